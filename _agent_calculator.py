@@ -1,9 +1,17 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import os
+import random
 import sys
 import time
 from termcolor import colored
 os.system('color')
 
+from _calculator_cache import _get_calculator_cache
+from _calculator_fast_path import _calculator_fast_path, _calculator_tier_stats
+from _code_runner import _get_code_runner
+from _model_registry import _model_registry
+from _prefix_cache import _prefix_cache
 from _util import _prompt_llama_cpp
 
 def _agent_calculator_func(
@@ -11,14 +19,20 @@ def _agent_calculator_func(
     _print_function,
     _model_file: str = 'together.ai',
     _model_path: str = 'meta-llama/Meta-Llama-3.1-8b-Instruct-Turbo',
-    _together_api_key: str = ''):
+    _together_api_key: str = '',
+    _samples: int = 1,
+    _use_cache: bool = True):
   '''
   Agent Calculator is an LLM that exclusiely solves math problems.
   It's called Agent Calculator because that calculator is agentic, rather then a single LLM run.
   The process is as follows:
+  (0) Simple questions (arithmetic, travel times and date offsets) are answered straight away without the LLM (see _calculator_fast_path.py). Every other question goes through (1)-(3).
+  Answers are cached (see _calculator_cache.py), so a question that was answered before (or the same question with different numbers) does not need the LLM.
   (1) An LLM breaks down the math problem into a smaller set of solvable math problems, if necessary.
   (2) The Coder LLM generates the answer to the math question in a two-step process, but in one prompt (the model "thinks out loud", and then writes a python code (with strict coding conditions) to answer the question).
   (3) If the Coder's results do not produce error-free code, then the Refiner reads the question, the Coder's response and the error, and the refiner rewrites the code to remove the error. The refiner is repeated until there is not error, or for 3 loops.
+  If _samples is more than 1, several Coders answer the question at the same time, every Coder's code is run at the same time, and the most common answer is used (self-consistency). The Refiner is only used if none of the codes run.
+  Self-consistency is only used with together.ai. A local model can only run one Coder at a time, so N Coders would take N times as long as one, and _samples is set to 1.
   When either the Coder or the Refiner write code, it is run using the "exec" function.
   The code must be written under the "main" function.
   
@@ -29,6 +43,8 @@ def _agent_calculator_func(
    - _print_function: The function that will print information inside the function.
    - _model_file (STR): The file and library information for the LLM. 'llama-cpp-python' or 'together.ai' for either local. gguf models or for together.ai.
    - _model_path (STR): The path that the model is found in.
+   - _samples (INT): The number of Coders that answer the question (see above). Only used with together.ai. Defaults to 1.
+   - _use_cache (BOOL): Whether answers are taken from (and added to) the calculator cache. Defaults to True.
   
   Outputs:
    - _final_result (STR): The final result of the code being run.
@@ -46,31 +62,61 @@ def _agent_calculator_func(
       _prompt_input,
       _stop_tokens,
       _stream,
-      _model):
+      _model,
+      _prefix_name = None,
+      _seed = None):
     if _use_llm in ['llama-cpp-python']:
       _start_time = time.time()
       def _print_function(_str):
         return colored(_str, 'blue')
-      _assistant_output, _pt, _ct, _tt = _prompt_llama_cpp(
-          _print_function = _print_function,
-          _llm = _model,
-          _prompt_input = _prompt_input.replace('<|begin_of_text|>', ''),
-          _stop_tokens = _stop_tokens,
-          _stream = _stream)
+      with _model_lock:
+        # The fixed system prompt of each part of the calculator is restored from the prefix cache, so only the question is evaluated (see _prefix_cache.py).
+        _session = None
+        if _prefix_name is not None:
+          _session = _prefix_cache._session(_llm = _model, _name = _prefix_name, _prompt_input = _prompt_input.replace('<|begin_of_text|>', ''))
+        _assistant_output, _pt, _ct, _tt = _prompt_llama_cpp(
+            _print_function = _print_function,
+            _llm = _model,
+            _prompt_input = _prompt_input.replace('<|begin_of_text|>', ''),
+            _stop_tokens = _stop_tokens,
+            _stream = _stream,
+            _session = _session)
       _time_taken = time.time() - _start_time
     elif _use_llm in ['together.ai']:
+      # A Coder of _self_consistency is given its own seed, so the Coders do not all sample the same code.
       _assistant_output, _pt, _ct, _tt, _time_taken = _model(
           _prompt_input, 
           _stop = _stop_tokens, 
-          _max_tokens = -1)
+          _max_tokens = -1,
+          _seed = _seed)
     return _assistant_output, _pt, _ct, _tt, _time_taken
   
+  # Step (0): The fast path.
+  # Questions such as "What is 6243.83 divided by 95.26?" are answered without the LLM, which takes microseconds rather than three or more LLM calls.
+  _fast_path_answer = _calculator_fast_path(_math_input)
+  _print_function(f'|- Calculator Tiers: {_calculator_tier_stats()}', to_print = 0.0)
+  if _fast_path_answer is not None:
+    _final_result, _final_code, _tier = _fast_path_answer
+    _print_function(f'|- Calculator Fast Path ({_tier}): {_final_result}', to_print = 0.0)
+    return _final_result, _final_code
+  if _use_cache:
+    _cached_answer = _get_calculator_cache()._get(_math_input, _run_code = _get_code_runner()._run)
+    _print_function(f'|- Calculator Cache: {_get_calculator_cache()._stats()}', to_print = 0.0)
+    if _cached_answer is not None:
+      _final_result, _final_code, _kind = _cached_answer
+      _print_function(f'|- Calculator Cache ({_kind}): {_final_result}', to_print = 0.0)
+      return _final_result, _final_code
+  
   # Step (1): The LLM is loaded.
   # All different parts of the agent calculator are built on top of the same LLM, just with different prompting.
+  # A local model is only loaded once, and is shared with _Query (see _model_registry.py), so it is locked while it is used.
   assert _model_file in ['llama-cpp-python', 'together.ai']
   if _model_file == 'llama-cpp-python':
-    from llama_cpp import Llama
-    _model = Llama(model_path = _model_path, n_ctx = 8192, n_gpu_layers = 0, verbose = False)
+    _loaded_model = _model_registry._get(_model_path = _model_path, _consumer = '_calculator', _context_name = 'tools', _n_ctx = 8192)
+    _model, _model_lock = _loaded_model._llm, _loaded_model._lock
+    if _samples > 1:
+      _print_function(f'|- Self-Consistency ({_samples} Coders) is only used with together.ai. A single Coder is used.', to_print = 0.0)
+      _samples = 1
   elif _model_file == 'together.ai':
     from _together_api import _API
     _model = _API(_api_key = _together_api_key, _model_name = _model_path)
@@ -88,7 +134,7 @@ Do not answer the question, only rewrite the question so that it is as clear and
 
 \t'''
   _breakdown_prompt += f'Question: [{_math_input}].<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\tQuestion: [' 
-  _breakdown_output, _breakdown_pt, _breakdown_ct, _breakdown_tt, _breakdown_time_taken = _generate_response(_use_llm = _model_file, _prompt_input = _breakdown_prompt, _stop_tokens = ['<|eot_id|>'], _stream = False, _model = _model)
+  _breakdown_output, _breakdown_pt, _breakdown_ct, _breakdown_tt, _breakdown_time_taken = _generate_response(_use_llm = _model_file, _prompt_input = _breakdown_prompt, _stop_tokens = ['<|eot_id|>'], _stream = False, _model = _model, _prefix_name = 'calculator_breakdown')
   _print_function(_breakdown_output, to_print = 0.0)
   # The _breakdown_output is added to the _math_input, so that later LLMs can read both the input question and an initial exploration and refinement of the question.
   _broken_math_input = _math_input + '\n' + _breakdown_output
@@ -132,32 +178,40 @@ Your final function that returns the answer must be "def main()".'''
   # The answer is (a) a natural language explanation where the model is "thinking out loud", and (b) the python code that answers the question.
   _coder_prompt += f'Question: [{_broken_math_input}].<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'  
   _print_function('====================', to_print = 0.0)
-  _coder_output, _coder_pt, _coder_ct, _coder_tt, _coder_time_taken = _generate_response(
-      _use_llm = _model_file,
-      _prompt_input = _coder_prompt,
-      _stop_tokens = ['<|eot_id|>'],
-      _stream = False,
-      _model = _model)
-  _print_function(f'|- "The Coder", {_coder_time_taken} secs, P:{_coder_pt} - Comp:{_coder_ct} - Total:{_coder_tt}', to_print = 1.0)
-  _print_function(_coder_output, to_print = 0.0)
-  _print_function('====================', to_print = 0.0)
-  
-  # Step (4): The code from the Coder is extracted (the final chunk of code under "```python" and "```").
-  # If the code runs successfully then the results are sent off.
-  # If not, the code is sent to the refiner alongside the error.
-  _coder_output = '```'.join(_coder_output.split('```')[:-1])
-  _final_code = _coder_output.split('```python')[-1].split('```')[0]
-  _final_code = _final_code.replace('\nreturn ', '\n')
-  _final_code = '\n'.join([_ for _ in _final_code.split('\n') if 'print(' not in _])
-  _print_function(_final_code, to_print = 1.0)
+  if _samples > 1:
+    _coder_output, _final_code, _success_run, _run_output = _self_consistency(
+        _generate_response = _generate_response,
+        _use_llm = _model_file,
+        _coder_prompt = _coder_prompt,
+        _model = _model,
+        _samples = _samples,
+        _print_function = _print_function)
+  else:
+    _coder_output, _coder_pt, _coder_ct, _coder_tt, _coder_time_taken = _generate_response(
+        _use_llm = _model_file,
+        _prompt_input = _coder_prompt,
+        _stop_tokens = ['<|eot_id|>'],
+        _stream = False,
+        _model = _model,
+        _prefix_name = 'calculator_coder')
+    _print_function(f'|- "The Coder", {_coder_time_taken} secs, P:{_coder_pt} - Comp:{_coder_ct} - Total:{_coder_tt}', to_print = 1.0)
+    _print_function(_coder_output, to_print = 0.0)
+    _print_function('====================', to_print = 0.0)
+    
+    # Step (4): The code from the Coder is extracted (the final chunk of code under "```python" and "```").
+    # If the code runs successfully then the results are sent off.
+    # If not, the code is sent to the refiner alongside the error.
+    _coder_output = '```'.join(_coder_output.split('```')[:-1])
+    _final_code = _extract_code(_coder_output)
+    _print_function(_final_code, to_print = 1.0)
+    # The code is run in a worker process (see _code_runner.py), with a time limit, so broken code can never hang Jay.
+    _success_run, _run_output = _get_code_runner()._run(_final_code)
   _error_message = ''
-  try:
-    exec(_final_code, globals())
-    _final_result = main()
+  if _success_run:
+    _final_result = _run_output
     _print_function(f'|- Coder Answer: {_final_result}', to_print = 1.0)
-    _success_run = True
-  except Exception as e:
-    _error_message = str(e)
+  else:
+    _error_message = _run_output
     if "'main'" in _error_message:
       _error_message += '. Ensure the "main" function is used to run the code.'
     if "'return' outside function" in _error_message:
@@ -165,7 +219,6 @@ Your final function that returns the answer must be "def main()".'''
       if '\nreturn ' in _final_code:
         _final_code = _final_code.replace('\nreturn ', '\n')
     _print_function(f'|- Coder Error: {_error_message}', to_print = 1.0)
-    _success_run = False
     
   # The number of loops through the refiner is set to 3.
   _t = 0
@@ -214,7 +267,8 @@ While you are encouraged to think out loud and plan your approach carefully, you
         _prompt_input = _refiner_prompt,
         _stop_tokens = ['<|eot_id|>'],
         _stream = False,
-        _model = _model)
+        _model = _model,
+        _prefix_name = 'calculator_refiner')
     _print_function(f'|- "The Refiner", {_refiner_time_taken} secs, P:{_refiner_pt} - Comp:{_refiner_ct} - Total:{_refiner_tt}', to_print = 1.0)
     _print_function(_refiner_output, to_print = 0.0)
     _print_function('====================', to_print = 0.0)
@@ -223,14 +277,13 @@ While you are encouraged to think out loud and plan your approach carefully, you
     _refined_code = _refined_code.replace('\nreturn ', '\n')
     _refined_code = '\n'.join([_ for _ in _refined_code.split('\n') if 'print(' not in _])
     _print_function(_refined_code, to_print = 1.0)
-    try:
-      # If the refined code runs successfully, then the loop is finished and the results are returned.
-      exec(_refined_code, globals())
-      _final_result = main()
+    # If the refined code runs successfully, then the loop is finished and the results are returned.
+    _success_run, _run_output = _get_code_runner()._run(_refined_code)
+    if _success_run:
+      _final_result = _run_output
       _print_function(f'|- Refiner Answer: {_final_result}', to_print = 1.0)
-      _success_run = True
-    except Exception as e:
-      _error_message = str(e)
+    else:
+      _error_message = _run_output
       if "'main'" in _error_message:
         _error_message += '. Ensure the "main" function is used to run the code.'
       if "'return' outside function" in _error_message:
@@ -238,7 +291,6 @@ While you are encouraged to think out loud and plan your approach carefully, you
         if '\nreturn ' in _refined_code:
           _refined_code = _refined_code.replace('\nreturn ', '\n')
       _print_function(f'|- Refiner Error: {_error_message}', to_print = 1.0)
-      _success_run = False
     _final_code = _refined_code
     
     # If there have 3 loops through the refiner, then the loop is broken and the result "Code run unsuccessfully".
@@ -246,4 +298,72 @@ While you are encouraged to think out loud and plan your approach carefully, you
     if _t == 3 and not _success_run:
       _success_run = True
       _final_result = "Code run unsuccessfully"
-  return _final_result, _final_code
\ No newline at end of file
+  if _model_file == 'llama-cpp-python':
+    _print_function(f'|- Prefix Cache: {_prefix_cache._stats()}', to_print = 0.0)
+  if _use_cache and _final_result != "Code run unsuccessfully":
+    _get_calculator_cache()._put(_math_input, _final_result, _final_code)
+  return _final_result, _final_code
+
+def _extract_code(
+    _output: str) -> str:
+  '''
+  Extracts the code from the Coder's output (the final chunk of code under "```python"), without any "return" outside a function or any "print".
+  '''
+  _code = _output.split('```python')[-1].split('```')[0]
+  _code = _code.replace('\nreturn ', '\n')
+  return '\n'.join([_ for _ in _code.split('\n') if 'print(' not in _])
+
+def _self_consistency(
+    _generate_response,
+    _use_llm: str,
+    _coder_prompt: str,
+    _model,
+    _samples: int,
+    _print_function):
+  '''
+  Several Coders answer the question at the same time, and the most common answer of the codes that run is used.
+  The Coders are separate together.ai requests that run at the same time, so this takes about as long as a single Coder. It is not used with a local model (see "_agent_calculator_func").
+  Each Coder samples its own answer with its own seed (a random base seed, plus the number of the Coder), so the Coders do not all write the same code.
+  
+  Returns:
+   - _coder_output (STR): The output of the Coder whose answer is used (or the first Coder, if no code ran).
+   - _final_code (STR): The code of that Coder.
+   - _success_run (BOOL): Whether any code ran.
+   - _run_output: The most common answer, or the first Coder's error message if no code ran.
+  '''
+  _stt = time.time()
+  _base_seed = random.randrange(2 ** 30)
+  def _coder(_i):
+    return _generate_response(
+        _use_llm = _use_llm,
+        _prompt_input = _coder_prompt,
+        _stop_tokens = ['<|eot_id|>'],
+        _stream = False,
+        _model = _model,
+        _prefix_name = 'calculator_coder',
+        _seed = _base_seed + _i)
+  with ThreadPoolExecutor(max_workers = _samples) as _executor:
+    _candidates = list(_executor.map(_coder, range(_samples)))
+  _coder_time_taken = time.time() - _stt
+  
+  _coder_outputs = ['```'.join(_candidate[0].split('```')[:-1]) for _candidate in _candidates]
+  _codes = [_extract_code(_coder_output) for _coder_output in _coder_outputs]
+  _stt = time.time()
+  _runs = _get_code_runner()._run_batch(_codes)
+  _run_time_taken = time.time() - _stt
+  for _i, (_candidate, _run) in enumerate(zip(_candidates, _runs)):
+    _coder_output, _coder_pt, _coder_ct, _coder_tt, _candidate_time_taken = _candidate
+    _print_function(f'|- "The Coder" {_i + 1}/{_samples}, {_candidate_time_taken} secs, P:{_coder_pt} - Comp:{_coder_ct} - Total:{_coder_tt}', to_print = 1.0)
+    _print_function(_codes[_i], to_print = 0.0)
+    _print_function(f'|- Coder {_i + 1} {"Answer" if _run[0] else "Error"}: {_run[1]}', to_print = 0.0)
+  _print_function(f'|- Self-Consistency: {_samples} Coders in {round(_coder_time_taken, 4)} secs, Code in {round(_run_time_taken, 4)} secs', to_print = 1.0)
+  
+  # The answers are compared by their STR, as answers can be LIST, DICT, etc.
+  _votes = Counter([str(_run[1]) for _run in _runs if _run[0]])
+  if len(_votes) == 0:
+    return _coder_outputs[0], _codes[0], False, _runs[0][1]
+  _answer, _count = _votes.most_common(1)[0]
+  _print_function(f'|- Self-Consistency Vote: {_count}/{_samples} Coders Agree', to_print = 1.0)
+  # Ties go to the first Coder with the answer.
+  _i = [_run[0] and str(_run[1]) == _answer for _run in _runs].index(True)
+  return _coder_outputs[_i], _codes[_i], True, _runs[_i][1]
\ No newline at end of file
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import json
+import os
+import re
+import threading
+import time
+
+'''
+_AnswerCache remembers the answers of "_search_the_internet", so a question that was searched recently is answered without searching again.
+
+Questions are kept by their normalized text: lower case, without punctuation and without filler words (e.g. "What is the weather in Sydney?" and "weather in sydney" are the same question).
+How long an answer can be used for depends on what the question is about (see _CATEGORIES): the weather and prices change quickly, but encyclopedic facts do not.
+ - Fresh: The answer is returned straight away.
+ - Stale: The answer is older than its TTL, but not older than _stale_factor times its TTL. The stale answer is returned straight away, and the question is searched again in the background, so the next time it is fresh (stale-while-revalidate).
+ - Missing (or too old): The question is searched, and the answer is added to the cache.
+Answers are cached without their reference numbers ("REFERENCE: <>"), and are numbered each time they are returned, so a cached answer never reuses the numbers of an earlier turn.
+The cache is saved to a .json file, so it is kept between runs of Jay. The hit ratio and the time saved (the time each answer took to search for) are counted (see "_stats").
+'''
+
+# (category, TTL in seconds, keywords). The first category with a keyword in the question is used.
+_CATEGORIES = [
+    ('weather', 30 * 60, ['weather', 'temperature', 'forecast', 'rain', 'raining', 'humidity', 'wind', 'uv']),
+    ('markets', 15 * 60, ['price', 'prices', 'stock', 'stocks', 'share', 'shares', 'exchange rate', 'bitcoin', 'crypto', 'asx', 'nasdaq', 'dow jones', 'worth']),
+    ('news', 60 * 60, ['news', 'latest', 'today', 'tonight', 'current', 'currently', 'score', 'now', 'this week', 'yesterday']),
+    ('facts', 30 * 24 * 3600, ['who was', 'who invented', 'history', 'born', 'died', 'capital of', 'meaning', 'define', 'definition', 'how many', 'how does', 'how do', 'why is', 'why do'])]
+_DEFAULT_CATEGORY = ('general', 24 * 3600)
+_FILLER_WORDS = ['what', 'whats', 'is', 'are', 'the', 'a', 'an', 'please', 'tell', 'me', 'can', 'you', 'search', 'for', 'find', 'look', 'up', 'out']
+# Answers that are never cached, as they mean the search did not work.
+_UNCACHED_ANSWERS = ['No information was found online.', 'The search was cancelled.']
+
+def _normalize_query(
+    _query: str) -> str:
+  _words = re.sub(r'[^\w\s]', ' ', _query.lower()).split()
+  return ' '.join([_word for _word in _words if _word not in _FILLER_WORDS])
+
+def _query_category(
+    _query: str):
+  '''
+  Returns (_category, _ttl) of the question.
+  '''
+  _text = ' ' + ' '.join(re.sub(r'[^\w\s]', ' ', _query.lower()).split()) + ' '
+  for _category, _ttl, _keywords in _CATEGORIES:
+    if any([f' {_keyword} ' in _text for _keyword in _keywords]):
+      return _category, _ttl
+  return _DEFAULT_CATEGORY
+
+class _AnswerCache():
+  def __init__(
+      self,
+      _filename: str = 'answer_cache.json',
+      _max_entries: int = 256,
+      _stale_factor: float = 4.0):
+    '''
+    Args:
+     - _filename (STR): The .json file the cache is saved in. Set to None to keep the cache in memory only.
+     - _max_entries (INT): The number of answers kept. The least recently used answer is removed once the cache is full.
+     - _stale_factor (FLOAT): A stale answer is still returned (while it is searched again) until it is this many times older than its TTL.
+    '''
+    self._filename = _filename
+    self._max_entries = _max_entries
+    self._stale_factor = _stale_factor
+    self._entries = OrderedDict()
+    self._refreshing = set()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._stale_hits = 0
+    self._misses = 0
+    self._refreshes = 0
+    self._time_saved = 0.0
+    if self._filename is not None and os.path.exists(self._filename):
+      try:
+        with open(self._filename, 'r', encoding = 'utf-8') as _file:
+          for _entry in json.load(_file):
+            self._entries[_entry['key']] = _entry
+      except (json.JSONDecodeError, KeyError, TypeError, OSError):
+        self._entries = OrderedDict()
+  
+  def _call(
+      self,
+      _query: str,
+      _search,
+      _cancel_event = None,
+      _number_references = None) -> str:
+    '''
+    Returns the answer to the question, from the cache if possible.
+    
+    Args:
+     - _query (STR): The question.
+     - _search: The function that searches the internet, "_search(_query, _cancel_event)", which returns the answer (STR) with its references not numbered.
+     - _cancel_event (threading.Event): Given to _search if the question has to be searched. Defaults to None.
+     - _number_references: The function that numbers the references of an answer (e.g. _Query._number_references). It is used on every answer that is returned, but never on the answers that are cached (or searched again in the background). Defaults to None (answers are returned as they are cached).
+    
+    Returns:
+     - _answer (STR): The answer.
+    '''
+    _key = _normalize_query(_query)
+    _category, _ttl = _query_category(_query)
+    with self._lock:
+      _entry = self._entries.get(_key)
+      if _entry is not None:
+        _age = time.time() - _entry['time']
+        if _age <= _ttl:
+          self._entries.move_to_end(_key)
+          self._hits += 1
+          self._time_saved += _entry['search_time']
+          return self._numbered(_entry['answer'], _number_references)
+        if _age <= _ttl * self._stale_factor:
+          self._entries.move_to_end(_key)
+          self._stale_hits += 1
+          self._time_saved += _entry['search_time']
+          if _key not in self._refreshing:
+            self._refreshing.add(_key)
+            threading.Thread(target = self._refresh, args = (_key, _query, _search), daemon = True).start()
+          return self._numbered(_entry['answer'], _number_references)
+      self._misses += 1
+    return self._numbered(self._search_and_put(_key, _query, _search, _cancel_event), _number_references)
+  
+  def _numbered(
+      self,
+      _answer,
+      _number_references):
+    if _number_references is None or type(_answer) is not str:
+      return _answer
+    return _number_references(_answer)
+  
+  def _refresh(
+      self,
+      _key: str,
+      _query: str,
+      _search):
+    '''
+    Searches a stale question again in the background.
+    '''
+    try:
+      self._search_and_put(_key, _query, _search, None)
+      with self._lock:
+        self._refreshes += 1
+    except Exception:
+      pass
+    finally:
+      with self._lock:
+        self._refreshing.discard(_key)
+  
+  def _search_and_put(
+      self,
+      _key: str,
+      _query: str,
+      _search,
+      _cancel_event) -> str:
+    _stt = time.time()
+    _answer = _search(_query, _cancel_event)
+    _search_time = time.time() - _stt
+    if type(_answer) is not str or _answer in _UNCACHED_ANSWERS:
+      return _answer
+    with self._lock:
+      self._entries[_key] = {'key': _key, 'query': _query, 'category': _query_category(_query)[0], 'answer': _answer, 'time': time.time(), 'search_time': _search_time}
+      self._entries.move_to_end(_key)
+      while len(self._entries) > self._max_entries:
+        self._entries.popitem(last = False)
+      self._save()
+    return _answer
+  
+  def _save(self):
+    '''
+    Saves the cache. It is written to a temporary file first, so a crash can never leave a half-written cache.
+    '''
+    if self._filename is None:
+      return
+    _folder = os.path.dirname(self._filename)
+    if _folder != '':
+      os.makedirs(_folder, exist_ok = True)
+    with open(self._filename + '.tmp', 'w', encoding = 'utf-8') as _file:
+      json.dump(list(self._entries.values()), _file, ensure_ascii = False)
+    os.replace(self._filename + '.tmp', self._filename)
+  
+  def _stats(self) -> dict:
+    with self._lock:
+      _total = self._hits + self._stale_hits + self._misses
+      return {'entries': len(self._entries),
+              'hits': self._hits,
+              'stale_hits': self._stale_hits,
+              'misses': self._misses,
+              'refreshes': self._refreshes,
+              'hit_ratio': round((self._hits + self._stale_hits) / _total, 4) if _total > 0 else 0.0,
+              'time_saved': round(self._time_saved, 4)}
\ No newline at end of file
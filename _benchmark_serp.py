@@ -0,0 +1,400 @@
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from _serp_parser import _parse_answer_box, _parse_search_results
+
+'''
+Benchmarks _serp_parser against the BeautifulSoup code it replaced, on saved Google search result pages (SERPs).
+
+Every .html file in the fixtures folder (default "SERP_Fixtures") is parsed by both, and the time each takes (and the speedup) is printed.
+Real pages can be saved into the folder (e.g. from the browser, or "_http_client._get('https://www.google.com/search', _params = {'q': _query}, _browser = True).text").
+If the folder is missing or empty, synthetic pages are used instead (with 10, 50 and 200 results, and the weather, stock, dictionary, calculator and primary answer boxes), so the benchmark can always be run. They are generated in memory, so nothing is written to the folder.
+Both must also return the same search results and the same answer box, which is checked.
+
+Usage:
+  python _benchmark_serp.py [_fixture_folder] [_repeats]
+'''
+
+def _legacy_search_results(_html):
+  '''
+  The search results, as "_download_google" read them before _serp_parser (copied from it): every element is searched for its first h3 and first link, and the first URL of each title is kept.
+  '''
+  _soup = BeautifulSoup(_html, 'html.parser')
+  _results = _soup.find_all()
+  # Step (2) Extract and clean URL and title information from metadata
+  _result_titles = []; _result_urls = []
+  for _result in _results:
+    _title = _result.find('h3')
+    _url = _result.find('a')
+    if _title is None or _url is None:
+      pass
+    else:
+      _result_titles.append(_result.find('h3').text)
+      _result_urls.append(_result.find('a')['href'])
+  _suitable_titles = []; _suitable_urls = []
+  for _title, _url in zip(_result_titles, _result_urls):
+    _url = _url.split('/url?q=')
+    if len(_url) != 1:
+      _url = _url[1].split('&sa=')[0]
+      if _title not in _suitable_titles:
+        _suitable_titles.append(_title)
+        _suitable_urls.append(_url)
+  return _suitable_titles, _suitable_urls
+
+def _search_results(_html):
+  '''
+  The search results, as "_download_google" reads them now.
+  '''
+  _result_titles, _result_urls = _parse_search_results(_html)
+  _suitable_titles = []; _suitable_urls = []
+  for _title, _url in zip(_result_titles, _result_urls):
+    _url = _url.split('/url?q=')
+    if len(_url) != 1:
+      _url = _url[1].split('&sa=')[0]
+      if _title not in _suitable_titles:
+        _suitable_titles.append(_title)
+        _suitable_urls.append(_url)
+  return _suitable_titles, _suitable_urls
+
+def _legacy_answer_box(_html):
+  '''
+  The answer box, as "_google_answer_box" read it before _serp_parser (copied from it): one CSS search of the whole page per field.
+  '''
+  _soup = BeautifulSoup(_html, 'lxml')
+  
+  # _google_box_answers ["Type of Information": "Extracted Info"]
+  _google_box = {}
+  def _load_notable_text(_soup):
+    '''How many protons in Oxygen atom?'''
+    if _soup.select_one('.ILfuVd') != None:
+      _notable_answer = _soup.select_one('.ILfuVd').text
+      _google_box['Notable Text'] = _notable_answer
+  _load_notable_text(_soup = _soup)
+  
+  def _google_business_box(_soup):
+    '''state parliament nsw open hours'''
+    try:
+      _desc = _soup.select_one('.xDKLO')
+      _google_box['Business Information'] = _desc.text
+    except:
+      pass
+  _google_business_box(_soup = _soup)
+  
+  def _google_table(_soup):
+    try:
+      _desc = _soup.select_one('.Crs1tb')
+      _google_box['Table'] = _desc.text
+    except:
+      pass
+  _google_table(_soup = _soup)
+  
+  def _google_address_box(_soup):
+    try:
+      _desc = _soup.select_one('.sXLaOe')
+      _google_box['Address'] = _desc.text
+    except:
+      pass
+  _google_address_box(_soup = _soup)
+  
+  def _google_side_box(_soup):
+    try:
+      _desc = _soup.select_one('.kno-rdesc')
+      _desc_href = str(_desc).split('href="')[1].split('" ')[0]
+      _desc = _desc.text
+      _google_box['Side Box'] = _desc
+      _google_box['Side Box (href)'] = _desc_href
+      x = _soup.select('.rVusze')
+      for _ in x:
+        _key, _value = _.text.split(': ')
+        _google_box['Side Box {}'.format(_key)] = _value
+    except:
+      pass
+  _google_side_box(_soup = _soup)
+  
+  def _google_quaternary_answer(_soup):
+    try:
+      _title = _soup.select_one('.QpPSMb').text
+      _subtitle = _soup.select_one('.loJjTe').text
+      while _title[0] == ' ':
+        _title = _title[1:]
+      while _subtitle[0] == ' ':
+        _subtitle = _subtitle[1:]
+      _google_box['Quaternary Title'] = _title
+      _google_box['Quaternary Subtitle'] = _subtitle
+    except:
+      pass
+  _google_quaternary_answer(_soup = _soup)
+
+  def _google_tertiary_answer(_soup):
+    # _google_answer_box('How much is a large pizza at Papa John\'s')
+    try:
+      _title = _soup.select_one('.ifM9O .LC20lb').text
+      _link = _soup.select_one('.ifM9O .yuRUbf a')['href']
+      _displayed_link = _soup.select_one('.ifM9O .iUh30').text
+      _snippet = _soup.select_one('.ifM9O .iKJnec').text
+
+      _google_box['Tertiary Title'] = _title
+      _google_box['Tertiary Link'] = _link
+      _google_box['Tertiary Displayed Link'] = _displayed_link
+      _google_box['Tertiary Snippet'] = _snippet
+
+      for _table_key, _table_value, _table_value_price in zip(
+          _soup.select('.ztXv9~ tr+ tr td:nth-child(1)'),
+          _soup.select('td:nth-child(2)'),
+          _soup.select('td~ td+ td')):
+        _key = _table_key.text
+        _value = _table_value.text
+        _price = _table_value_price.text
+        _google_box['Tertiary Table Row'] = [_key, _value, _price]
+    except:
+      pass
+  _google_tertiary_answer(_soup = _soup)
+
+  def _google_secondary_answer(_soup):
+    '''dynasties of macedonia'''
+    try:
+      _title = _soup.select_one('.xpdopen .DKV0Md').text
+      _link = _soup.select_one('.xpdopen .yuRUbf a')['href']
+      _displayed_link = _soup.select_one('.xpdopen .iUh30').text
+      _google_box['Secondary Title'] = _title
+      _google_box['Secondary Link'] = _link
+      #_google_box['Secondary Displayed Link'] = _displayed_link
+
+      if _soup.select_one('.xpdopen .co8aDb b') and _soup.select_one('.TrT0Xe') is not None:
+        _snippet = _soup.select_one('.xpdopen .co8aDb b').text
+        _bullet_points = '\n'.join([_bullet_point.text for _bullet_point in _soup.select('.TrT0Xe')])
+      elif _soup.select_one('.TrT0Xe') is not None:
+        _bullet_points = '\n'.join([_bullet_point.text for _bullet_point in _soup.select('.TrT0Xe')])
+        _snippet = None
+      else: 
+        _snippet = _soup.select_one('.xpdopen .iKJnec').text
+        _bullet_points = None
+    
+      if type(_snippet) is str:
+        _google_box['Secondary Snippet'] = _snippet
+      if type(_bullet_points) is str:
+        _google_box['Secondary Bullet Points'] = _bullet_points
+
+      if _soup.select_one('#rso td:nth-child(1)') is None:
+        pass
+      else:
+       for _table_key, _table_value in zip(
+          _soup.select('#rso td:nth-child(1)'), 
+          _soup.select('#rso td+ td')):
+          _key = _table_key.text
+          _value = _table_value.text
+          _google_box['Secondary {}'.format(_key)] = _value
+    except:
+      pass
+  _google_secondary_answer(_soup = _soup)
+
+  def _google_primany_answer(_soup):
+    '''luke skywalker lightsaber color'''
+    try:
+      _link = _soup.select_one('.yuRUbf a')['href']
+      _google_box['Primary Link'] = _link
+      _answer = _soup.select_one('.IZ6rdc').text
+      _google_box['Primary Answer'] = _answer
+      _snippet = _soup.select_one('.hgKElc').text
+      _google_box['Primary Snippet'] = _snippet
+    except:
+      pass
+  _google_primany_answer(_soup = _soup)
+
+  def _google_dictionary_answer(_soup):
+    '''define slob'''
+    try:
+      _definition = 1
+      for _result in _soup.select('.VpH2eb.vmod'):
+        #_syllables = _result.select_one('.DgZBFd span').text
+        #_audio_link = f"https:{result.select_one('.brWULd audio source')['src']}"
+        #_phonetic_result.select_one('.S23sjd .LTKOO span').text
+        #_word_types = [_word_type.text for _word_type in _result.select('.vdBwhd .YrbPuc')]
+  
+        _definitions = [_definition.text for _definition in _result.select('.PZPZlf')]
+        _sentence_examples = [_definition.text for _definition in _result.select('.ubHt5c')]
+        _similar_words = [_similar_word.text for _similar_word in _result.select('.p9F8Cd span')]
+        _google_box['Definition {}'.format(_definition)] = _definitions
+        _definition += 1
+    except:
+      pass
+  _google_dictionary_answer(_soup = _soup)
+
+  def _google_currency_conversion_answer(_soup):
+    '''100 usd in aud'''
+    try:
+      _conversion = _soup.select_one('.SwHCTb').text
+      _google_box['Conversion Rate'] = _conversion
+      _conversion_currency = _soup.select_one('.MWvIVe').text
+      _google_box['Conversion Currency'] = _conversion_currency
+    except:
+      pass
+  _google_currency_conversion_answer(_soup  = _soup)
+
+  def _google_population_answer(_soup):
+    '''What is the population of India?'''
+    try:
+      _place = _soup.select_one('.GzssTd span').text; _google_box['Location'] = _place
+      _population_year = _soup.select_one('.KBXm4e').text.split(' ')
+      _population = _population_year[0]; _google_box['Population'] = _population
+      _year = _population_year[1].replace('(', '').replace(')', ''); _google_box['Year Captured'] = _year
+      _sources = [_source.text for _source in _soup.select('.kno-ftr span a')]; _google_box['Source of Info'] = _sources
+
+      #for other_city, other_population in zip(_soup.select('.AleqXe'), _soup.select('.kpd-lv')):
+      #  other_place_city = other_city.text.strip()
+      #  other_place_population = other_population.text
+    except:
+      pass
+  _google_population_answer(_soup = _soup)
+
+  def _google_stock_answer(_soup):
+    '''vas Stock'''
+    try:
+      _title = _soup.select_one('.oPhL2e').text.replace(u'\xa0', u'').split('>')[1]; _google_box['Stock Title'] = _title
+      _date_time = _soup.select_one('[jsname=ihIZgd]').text.replace(' ·', ''); _google_box['Stock Datetime'] = _date_time
+      _market_status = _soup.select_one('.TgMHGc span:nth-child(1)').text.strip().replace(':', ''); _google_box['Market Status'] = _market_status
+      _currency = _soup.select_one('.knFDje').text.strip(); _google_box['Currency'] = _currency
+      _current_price = _soup.select_one('.wT3VGc, .XcVN5d').text; _google_box['Current Price'] = _current_price
+      _price_change = _soup.select_one('.WlRRw > span:nth-child(1)').text; _google_box['Price Change'] = _price_change
+      _price_change_percent = _soup.select_one('.jBBUv span:nth-child(1)').text.replace('(', '').replace(')', ''); _google_box['Price Change Percent'] = _price_change_percent
+      _price_change_date = _soup.select_one('.jdUcZd span').text.strip().capitalize(); _google_box['Price Change Date'] = _price_change_date
+      _price_movement = 'Down' if '−' in _price_change else 'Up'; _google_box['Price Movement'] = _price_movement
+
+      for _stock_table_key, _stock_table_value in zip(_soup.select('.JgXcPd'), _soup.select('.iyjjgb')):
+        _stock_key = _stock_table_key.text
+        _stock_value = _stock_table_value.text
+        _google_box[_stock_key] = _stock_value
+    except:
+      pass
+  _google_stock_answer(_soup = _soup)
+
+  def _google_weather_answer(_soup):
+    '''What is the weather in Orange, NSW?'''
+    try:
+      _location = _soup.select_one('#wob_loc').text; _google_box['Weather Location'] = _location
+      _weather_condition = _soup.select_one('#wob_dc').text; _google_box['Weather Condition'] = _weather_condition
+      _temperature = _soup.select_one('#wob_tm').text; _google_box['Weather Temperature'] = _temperature
+      _precipitation = _soup.select_one('#wob_pp').text; _google_box['Weather Precipitation'] = _precipitation
+      _humidity = _soup.select_one('#wob_hm').text; _google_box['Weather Humidity'] = _humidity
+      _wind = _soup.select_one('#wob_ws').text; _google_box['Weather Wind'] = _wind
+      _current_time = _soup.select_one('#wob_dts').text; _google_box['Weather Current-Time'] = _current_time
+
+      for _wind_speed_direction in _soup.select('.wob_noe .wob_hw'):
+        try:
+          _wind_speed = _wind_speed_direction.select_one('.wob_t').text; _google_box['Weather Wind Speed'] = _wind_speed
+          _wind_direction = ' '.join(_wind_speed_direction.select_one('.wob_t')['aria-label'].split(' ')[2:4]); _google_box['Weather Wind Direction'] = _wind_direction
+        except:
+          pass
+
+      for _forecast in _soup.select('.wob_df'):
+        _day = _forecast.select_one('.Z1VzSb')['aria-label']
+        _weather = str(_forecast.select_one('.YQ4gaf')).split('img alt="')[1].split('" class=')[0]
+        if _forecast.select_one('.vk_gy .wob_t:nth-child(1)') is None:
+          _high_temp = _forecast.select_one('.gNCp2e .wob_t').text
+        else:
+          _high_temp = _forecast.select_one('.vk_gy .wob_t:nth-child(1)').text
+        _low_temp = _forecast.select_one('.QrNVmd .wob_t:nth-child(1)').text
+        _google_box['Weather Forecast {}'.format(_day)] = 'Weather: {}, High: {}, Low: {}'.format(_weather, _high_temp, _low_temp)
+    except:
+      pass
+  _google_weather_answer(_soup = _soup)
+  
+  def _google_calculator_answer(_soup):
+    '''32 * 3 / 3 + 12 * 332 - 1995'''
+    try:
+      _math_expression = _soup.select_one('.XH1CIc').text.strip().replace(' =', '')
+      _calc_answer = _soup.select_one('#cwos').text.strip()
+      _google_box['Mathematical Expression'] = _math_expression
+      _google_box['Calculated Answer'] = _calc_answer
+    except:
+      pass
+  _google_calculator_answer(_soup = _soup)
+  return _google_box
+
+def _synthetic_serp(
+    _no_of_results: int) -> str:
+  '''
+  A page shaped like a Google SERP: nested layout elements around each result, and several answer boxes.
+  '''
+  _results = []
+  for _number in range(_no_of_results):
+    _results.append(
+        f'<div class="MjjYud"><div class="g tF2Cxc"><div class="N54PNb"><div class="kb0PBd"><div class="yuRUbf"><div><span>'
+        f'<a href="/url?q=https://www.example{_number}.com/page{_number}&sa=U&ved=0ah{_number}"><h3 class="LC20lb MBeuO DKV0Md">Result number {_number}</h3>'
+        f'<div class="notranslate"><cite class="iUh30">www.example{_number}.com</cite></div></a></span></div></div></div>'
+        f'<div class="kb0PBd"><div class="VwiC3b"><span>{"Some snippet text about the result. " * 8}</span></div></div></div></div></div>')
+  _forecast = ''.join([
+      f'<div class="wob_df"><div class="Z1VzSb" aria-label="Day{_day}">Day{_day}</div><div><img class="YQ4gaf" alt="Sunny" src="x.png"></div>'
+      f'<div class="gNCp2e"><span class="wob_t">2{_day}</span></div><div class="QrNVmd"><span class="wob_t">1{_day}</span></div></div>' for _day in range(8)])
+  _answer_boxes = (
+      '<div class="xpdopen"><div class="ifM9O"><div><span class="hgKElc">Mount Everest is <b>8,849</b> metres tall.</span></div>'
+      '<div class="yuRUbf"><a href="https://en.wikipedia.org/wiki/Mount_Everest"><h3 class="LC20lb DKV0Md">Mount Everest - Wikipedia</h3></a></div>'
+      '<div class="IZ6rdc">8,849 m</div></div></div>'
+      '<div id="wob_wc"><span id="wob_loc">Orange NSW</span><span id="wob_dts">Sunday 10:00</span><span id="wob_dc">Sunny</span>'
+      '<span id="wob_tm">21</span><span id="wob_pp">5%</span><span id="wob_hm">40%</span><span id="wob_ws">10 km/h</span>'
+      f'<div class="wob_noe"><div class="wob_hw"><span class="wob_t" aria-label="10 km/h From the North west">10 km/h</span></div></div>{_forecast}</div>'
+      '<div class="oPhL2e">Market Summary > Vanguard Australian Shares</div><div><span jsname="ihIZgd">17 Oct, 4:10 pm AEDT ·</span></div>'
+      '<div class="TgMHGc"><span>Closed:</span></div><span class="knFDje">AUD</span><span class="wT3VGc">98.12</span>'
+      '<span class="WlRRw"><span>−0.45</span></span><span class="jBBUv"><span>(0.46%)</span></span><span class="jdUcZd"><span>today</span></span>'
+      '<table><tr><td class="JgXcPd">Open</td><td class="iyjjgb">98.50</td></tr><tr><td class="JgXcPd">High</td><td class="iyjjgb">98.90</td></tr></table>'
+      '<div class="VpH2eb vmod"><div class="PZPZlf">a lazy and untidy person.</div><div class="PZPZlf">behave in a lazy way.</div></div>'
+      '<span class="XH1CIc">32 * 3 / 3 + 12 * 332 - 1995 =</span><span id="cwos">2021</span>')
+  _padding = ''.join([f'<div class="pad{_number % 7}"><div><span>{"menu " * 3}</span></div></div>' for _number in range(_no_of_results * 4)])
+  return (
+      '<!DOCTYPE html><html><head><title>query - Google Search</title></head><body><div id="main"><div id="rcnt">'
+      f'<div id="center_col">{_answer_boxes}<div id="search"><div id="rso">{"".join(_results)}</div></div></div>'
+      f'<div id="footer">{_padding}</div></div></div></body></html>')
+
+def _load_fixtures(
+    _fixture_folder: str) -> list:
+  '''
+  Returns [(_filename, _html)] for every .html file in the fixtures folder, or the synthetic pages if there are none.
+  '''
+  _filenames = sorted([_filename for _filename in os.listdir(_fixture_folder) if _filename.endswith('.html')]) if os.path.isdir(_fixture_folder) else []
+  if len(_filenames) == 0:
+    return [(f'synthetic_{_no_of_results}_results.html', _synthetic_serp(_no_of_results)) for _no_of_results in [10, 50, 200]]
+  _fixtures = []
+  for _filename in _filenames:
+    with open(os.path.join(_fixture_folder, _filename), 'r', encoding = 'utf-8', errors = 'ignore') as _file:
+      _fixtures.append((_filename, _file.read()))
+  return _fixtures
+
+def _time(
+    _function,
+    _html: str,
+    _repeats: int) -> float:
+  '''
+  The fastest time (in seconds) of _repeats calls.
+  '''
+  _times = []
+  for _ in range(_repeats):
+    _stt = time.perf_counter()
+    _function(_html)
+    _times.append(time.perf_counter() - _stt)
+  return min(_times)
+
+def _benchmark(
+    _fixture_folder: str = 'SERP_Fixtures',
+    _repeats: int = 5) -> list:
+  '''
+  Returns (and prints) [(_filename, _kilobytes, _legacy_time, _new_time, _speedup)] for every fixture.
+  '''
+  _rows = []
+  for _filename, _html in _load_fixtures(_fixture_folder):
+    assert _legacy_search_results(_html) == _search_results(_html), f'{_filename}: the search results differ.'
+    assert _legacy_answer_box(_html) == _parse_answer_box(_html), f'{_filename}: the answer boxes differ.'
+    _legacy_time = _time(lambda _html: (_legacy_search_results(_html), _legacy_answer_box(_html)), _html, _repeats)
+    _new_time = _time(lambda _html: (_search_results(_html), _parse_answer_box(_html)), _html, _repeats)
+    _rows.append((_filename, round(len(_html) / 1024, 1), round(_legacy_time, 4), round(_new_time, 4), round(_legacy_time / _new_time, 1)))
+  print('{:<36} {:>8} {:>12} {:>12} {:>8}'.format('Fixture', 'KB', 'Legacy (s)', 'New (s)', 'Speedup'))
+  for _row in _rows:
+    print('{:<36} {:>8} {:>12} {:>12} {:>7}x'.format(*_row))
+  return _rows
+
+if __name__ == '__main__':
+  _fixture_folder = sys.argv[1] if len(sys.argv) > 1 else 'SERP_Fixtures'
+  _repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+  _benchmark(_fixture_folder = _fixture_folder, _repeats = _repeats)
\ No newline at end of file
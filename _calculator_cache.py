@@ -0,0 +1,186 @@
+from collections import OrderedDict
+import json
+import os
+import re
+import threading
+import time
+
+'''
+_CalculatorCache remembers the answers of the calculator (and the code that found them), so the same question is never sent to the LLM twice.
+
+Jay often asks the calculator the same question (or almost the same question) again and again.
+Questions are kept by their normalized text (lower case, single spaces and no punctuation at the end), and the cache is saved to a .json file, so it is kept between runs of Jay.
+(1) A hit: The same question was answered before. The answer is returned straight away.
+(2) A near-hit: A question with the same words but different numbers was answered before (e.g. "What is the date 10 days after 1/6/2024" and "What is the date 3 days after 28/2/2025").
+    The numbers of the old question are swapped for the new numbers in the old code, and the code is run again (using _code_runner.py), so the LLM is not needed.
+    This is only done when every number of the old question appears exactly once in the old code, so there is no doubt about which number to swap.
+(3) A miss: The question is answered by the LLM, and then added to the cache.
+Once the cache is full, the least recently used question is removed. Questions older than _ttl_seconds are never used.
+'''
+
+_NUMBER_PATTERN = r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])'
+
+def _normalize_question(
+    _question: str) -> str:
+  return ' '.join(_question.lower().split()).strip(' ?.!')
+
+def _question_template(
+    _question: str):
+  '''
+  Returns the question with every number replaced by "<N>", and the numbers (STR) in the order they appear.
+  '''
+  _numbers = re.findall(_NUMBER_PATTERN, _question)
+  return re.sub(_NUMBER_PATTERN, '<N>', _question), _numbers
+
+class _CalculatorCache():
+  def __init__(
+      self,
+      _filename: str = 'calculator_cache.json',
+      _max_entries: int = 512,
+      _ttl_seconds: float = 30 * 24 * 3600):
+    '''
+    Args:
+     - _filename (STR): The .json file the cache is saved in. Set to None to keep the cache in memory only.
+     - _max_entries (INT): The number of questions kept. The least recently used question is removed once the cache is full.
+     - _ttl_seconds (FLOAT): The number of seconds an answer can be used for. Defaults to 30 days.
+    '''
+    self._filename = _filename
+    self._max_entries = _max_entries
+    self._ttl_seconds = _ttl_seconds
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._near_hits = 0
+    self._misses = 0
+    if self._filename is not None and os.path.exists(self._filename):
+      try:
+        with open(self._filename, 'r', encoding = 'utf-8') as _file:
+          for _entry in json.load(_file):
+            self._entries[_entry['question']] = _entry
+      except (json.JSONDecodeError, KeyError, TypeError, OSError):
+        self._entries = OrderedDict()
+  
+  def _get(
+      self,
+      _question: str,
+      _run_code = None):
+    '''
+    Returns the cached answer to the question, if there is one.
+    
+    Args:
+     - _question (STR): The math question.
+     - _run_code: The function that runs code for a near-hit (e.g. "_get_code_runner()._run"). Returns (_success, _result). If None, near-hits are not used.
+    
+    Returns:
+     - None if there is no cached answer. Otherwise (_final_result, _final_code, _kind), where _kind is 'hit' or 'near_hit'.
+    '''
+    _question = _normalize_question(_question)
+    with self._lock:
+      self._remove_expired()
+      _entry = self._entries.get(_question)
+      if _entry is not None:
+        self._entries.move_to_end(_question)
+        self._hits += 1
+        return _entry['result'], _entry['code'], 'hit'
+      _near_entry = self._find_near_entry(_question)
+    if _near_entry is not None and _run_code is not None:
+      _code = self._swap_numbers(_near_entry, _question)
+      if _code is not None:
+        _success, _result = _run_code(_code)
+        if _success:
+          self._put(_question, _result, _code)
+          with self._lock:
+            self._near_hits += 1
+          return _result, _code, 'near_hit'
+    with self._lock:
+      self._misses += 1
+    return None
+  
+  def _put(
+      self,
+      _question: str,
+      _final_result,
+      _final_code: str):
+    '''
+    Adds the answer to the cache, and saves the cache.
+    '''
+    _question = _normalize_question(_question)
+    # Only simple values can be saved in .json, so anything else is kept as its STR.
+    try:
+      json.dumps(_final_result)
+    except (TypeError, ValueError):
+      _final_result = str(_final_result)
+    _template, _numbers = _question_template(_question)
+    with self._lock:
+      self._entries[_question] = {'question': _question, 'template': _template, 'numbers': _numbers, 'result': _final_result, 'code': _final_code, 'time': time.time()}
+      self._entries.move_to_end(_question)
+      while len(self._entries) > self._max_entries:
+        self._entries.popitem(last = False)
+      self._save()
+  
+  def _find_near_entry(
+      self,
+      _question: str):
+    _template, _numbers = _question_template(_question)
+    if len(_numbers) == 0:
+      return None
+    for _entry in reversed(self._entries.values()):
+      if _entry['template'] == _template:
+        return _entry
+    return None
+  
+  def _swap_numbers(
+      self,
+      _entry: dict,
+      _question: str):
+    '''
+    Swaps the numbers of the cached question for the numbers of the new question in the cached code.
+    Returns None if any number of the cached question is repeated, or does not appear exactly once in the code.
+    '''
+    _old_numbers = _entry['numbers']
+    _new_numbers = _question_template(_question)[1]
+    if len(set(_old_numbers)) != len(_old_numbers) or len(_old_numbers) != len(_new_numbers):
+      return None
+    _code = _entry['code']
+    for _number in _old_numbers:
+      if len(re.findall(rf'(?<![\w.]){re.escape(_number)}(?![\w.])', _code)) != 1:
+        return None
+    # Every number is swapped at once, so a new number is never swapped again.
+    _swap = dict(zip(_old_numbers, _new_numbers))
+    _pattern = '|'.join([rf'(?<![\w.]){re.escape(_number)}(?![\w.])' for _number in sorted(_old_numbers, key = len, reverse = True)])
+    return re.sub(_pattern, lambda _match: _swap[_match.group(0)], _code)
+  
+  def _remove_expired(self):
+    _now = time.time()
+    for _question in [_question for _question, _entry in self._entries.items() if _now - _entry['time'] > self._ttl_seconds]:
+      del self._entries[_question]
+  
+  def _save(self):
+    '''
+    Saves the cache. It is written to a temporary file first, so a crash can never leave a half-written cache.
+    '''
+    if self._filename is None:
+      return
+    _folder = os.path.dirname(self._filename)
+    if _folder != '':
+      os.makedirs(_folder, exist_ok = True)
+    with open(self._filename + '.tmp', 'w', encoding = 'utf-8') as _file:
+      json.dump(list(self._entries.values()), _file, ensure_ascii = False)
+    os.replace(self._filename + '.tmp', self._filename)
+  
+  def _stats(self) -> dict:
+    with self._lock:
+      return {'entries': len(self._entries), 'hits': self._hits, 'near_hits': self._near_hits, 'misses': self._misses}
+
+_calculator_cache = None
+_calculator_cache_lock = threading.Lock()
+
+def _get_calculator_cache() -> _CalculatorCache:
+  '''
+  Returns the calculator cache that is shared by the whole process, loading it if it has not been loaded yet.
+  '''
+  global _calculator_cache
+  with _calculator_cache_lock:
+    if _calculator_cache is None:
+      _calculator_cache = _CalculatorCache()
+    return _calculator_cache
\ No newline at end of file
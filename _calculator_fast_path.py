@@ -0,0 +1,225 @@
+import ast
+import calendar
+import datetime
+import decimal
+import math
+import operator
+import re
+import threading
+
+'''
+_calculator_fast_path answers simple math questions without the LLM.
+
+Many of the questions Jay sends to the calculator are simple enough that they do not need the breakdown, the Coder and the Refiner:
+(1) 'arithmetic': Arithmetic written with numbers and words (e.g. "What is 6243.83 divided by 95.26, rounded to 5 decimal points?").
+    The expression is evaluated by walking its syntax tree (using "ast"), and only numbers, + - * / // % ** and sqrt are allowed, so nothing else can be run.
+    Rounding is half up (e.g. 2.5 to the nearest whole number is 3), as people expect, rather than Python's "round", which rounds halves to the even number.
+(2) 'unit_rate': How long it takes to travel a distance at a speed (e.g. "How long does it take to drive 1 kilometre at 15kph?").
+(3) 'date': A number of days, weeks, months or years before or after a date (e.g. "What is the date 10 days after 10/6/2024"). Dates are day/month/year.
+The fast path is strict: if any part of the question is not understood, the question is sent to the LLM ('llm') instead.
+
+Each answer also comes with the python code that computes it, in the same form the Coder writes ("def main(): ..."), so the answer can be checked by the user.
+The number of questions answered by each tier is counted (see "_calculator_tier_stats").
+'''
+
+_TIERS = ['arithmetic', 'unit_rate', 'date', 'llm']
+_tier_counts = {_tier: 0 for _tier in _TIERS}
+_tier_lock = threading.Lock()
+
+_BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow}
+_UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_WORD_OPERATORS = [
+    (r'\bmultiplied by\b', '*'),
+    (r'\btimes\b', '*'),
+    (r'(?<=[\d\)])\s*x\s*(?=[\d\(])', ' * '),
+    (r'×', '*'),
+    (r'\bdivided by\b', '/'),
+    (r'÷', '/'),
+    (r'\bplus\b', '+'),
+    (r'\badded to\b', '+'),
+    (r'\bminus\b', '-'),
+    (r'\bto the power of\b', '**'),
+    (r'\^', '**'),
+    (r'\bsquared\b', '**2'),
+    (r'\bcubed\b', '**3'),
+    (r'\bthe square root of\b', 'sqrt'),
+    (r'\bsquare root of\b', 'sqrt'),
+    (r'\s*(%|percent) of\b', ' / 100 *')]
+
+_DISTANCE_UNITS = {'km': 1.0, 'kms': 1.0, 'kilometre': 1.0, 'kilometres': 1.0, 'kilometer': 1.0, 'kilometers': 1.0,
+                   'm': 0.001, 'metre': 0.001, 'metres': 0.001, 'meter': 0.001, 'meters': 0.001,
+                   'mile': 1.609344, 'miles': 1.609344}
+_SPEED_UNITS = {'kph': 1.0, 'km/h': 1.0, 'kmh': 1.0, 'kmph': 1.0, 'kilometres per hour': 1.0, 'kilometers per hour': 1.0,
+                'mph': 1.609344, 'miles per hour': 1.609344,
+                'm/s': 3.6, 'metres per second': 3.6, 'meters per second': 3.6}
+
+def _calculator_fast_path(
+    _math_input: str):
+  '''
+  Answers the question without the LLM, if the question is simple enough.
+  Questions that are not answered are counted as 'llm' (the caller sends them to the LLM).
+  
+  Args:
+   - _math_input (STR): The math question, in natural language.
+  
+  Returns:
+   - None if the question could not be answered. Otherwise:
+   - _final_result: The answer.
+   - _final_code (STR): Python code that computes the answer.
+   - _tier (STR): 'arithmetic', 'unit_rate' or 'date'.
+  '''
+  for _tier, _function in [('date', _date_offset), ('unit_rate', _unit_rate), ('arithmetic', _arithmetic)]:
+    try:
+      _answer = _function(_math_input)
+    except (ValueError, TypeError, ZeroDivisionError, OverflowError, SyntaxError, KeyError, decimal.InvalidOperation):
+      _answer = None
+    if _answer is not None:
+      _count_tier(_tier)
+      return _answer[0], _answer[1], _tier
+  _count_tier('llm')
+  return None
+
+def _count_tier(
+    _tier: str):
+  with _tier_lock:
+    _tier_counts[_tier] += 1
+
+def _calculator_tier_stats() -> dict:
+  '''
+  Returns how many questions each tier answered, and its hit rate (the share of every calculator question).
+  {'arithmetic': {'count': INT, 'rate': FLOAT}, ..., 'total': INT}
+  '''
+  with _tier_lock:
+    _total = sum(_tier_counts.values())
+    _stats = {_tier: {'count': _count, 'rate': round(_count / _total, 4) if _total > 0 else 0.0} for _tier, _count in _tier_counts.items()}
+  _stats['total'] = _total
+  return _stats
+
+def _normalize_question(
+    _math_input: str) -> str:
+  _text = _math_input.lower().strip()
+  # Thousands separators are removed (e.g. "6,243.83").
+  _text = re.sub(r'(?<=\d),(?=\d{3}\b)', '', _text)
+  return ' '.join(_text.split())
+
+def _arithmetic(
+    _math_input: str):
+  '''
+  Tier (1): Arithmetic. Every word of the question (other than "what is", rounding, etc) must be part of the expression.
+  Rounding is only understood at the end of the question (e.g. "What is 2 to 3 decimal places plus 1" is sent to the LLM).
+  '''
+  _text = _normalize_question(_math_input)
+  _decimals = None
+  _rounding = re.search(r',?\s*(rounded|round it|correct|give the answer|to)?\s*(to )?(\d+) (decimal places|decimal points|decimal place|decimal point|dp|d\.p\.)[\s\?\.!]*$', _text)
+  if _rounding is not None:
+    _decimals = int(_rounding.group(3))
+    _text = _text[:_rounding.start()] + _text[_rounding.end():]
+  _rounding = re.search(r',?\s*(rounded )?to the nearest (whole number|integer)[\s\?\.!]*$', _text)
+  if _rounding is not None:
+    _decimals = 0
+    _text = _text[:_rounding.start()] + _text[_rounding.end():]
+  _text = re.sub(r'^(what is|what\'s|whats|calculate|compute|evaluate|work out|find)\s+', '', _text)
+  _text = _text.strip(' ?.=')
+  for _pattern, _replacement in _WORD_OPERATORS:
+    _text = re.sub(_pattern, f' {_replacement} ', _text)
+  # "sqrt 16" is written as "sqrt(16)".
+  _text = re.sub(r'sqrt\s+(\d+(\.\d+)?)', r'sqrt(\1)', _text)
+  _expression = ' '.join(_text.split())
+  if re.fullmatch(r'[\d\.\s\+\-\*/\(\)%]*(sqrt\([\d\.\s\+\-\*/\(\)%]*\)[\d\.\s\+\-\*/\(\)%]*)*', _expression) is None:
+    return None
+  if re.search(r'[\+\-\*/%]|sqrt', _expression) is None:
+    return None
+  _result = _safe_eval(ast.parse(_expression, mode = 'eval').body)
+  _code = f'def main():\n  # {_code_comment(_math_input)}\n  from math import sqrt\n  return {_expression}'
+  if _decimals is not None:
+    _result = _round_half_up(_result, _decimals)
+    _code = (f'def main():\n  # {_code_comment(_math_input)}\n  from decimal import Decimal, ROUND_HALF_UP\n  from math import sqrt\n'
+             f'  _answer = Decimal(repr({_expression})).quantize(Decimal(1).scaleb(-{_decimals}), rounding = ROUND_HALF_UP)\n'
+             f'  return {"int" if _decimals == 0 else "float"}(_answer)')
+  return _result, _code
+
+def _round_half_up(
+    _value,
+    _decimals: int):
+  '''
+  Rounds to _decimals decimal places, with halves rounded away from zero. The value is read from its shortest repr, so 2.675 is rounded to 2.68 (not 2.67, as the float is slightly less than 2.675).
+  Returns an INT if _decimals is 0, otherwise a FLOAT.
+  '''
+  _answer = decimal.Decimal(repr(_value)).quantize(decimal.Decimal(1).scaleb(-_decimals), rounding = decimal.ROUND_HALF_UP)
+  return int(_answer) if _decimals == 0 else float(_answer)
+
+def _code_comment(
+    _math_input: str) -> str:
+  '''
+  The question, on a single line, so it can be written as a comment of the code.
+  '''
+  return ' '.join(_math_input.split())
+
+def _safe_eval(
+    _node):
+  '''
+  Evaluates an arithmetic syntax tree. Anything other than numbers, arithmetic operators and sqrt is refused (ValueError).
+  '''
+  if isinstance(_node, ast.Constant) and type(_node.value) in [int, float]:
+    return _node.value
+  if isinstance(_node, ast.UnaryOp) and type(_node.op) in _UNARY_OPERATORS:
+    return _UNARY_OPERATORS[type(_node.op)](_safe_eval(_node.operand))
+  if isinstance(_node, ast.BinOp) and type(_node.op) in _BINARY_OPERATORS:
+    _left, _right = _safe_eval(_node.left), _safe_eval(_node.right)
+    # Very large powers would take too long (or too much memory) to compute.
+    if isinstance(_node.op, ast.Pow) and (abs(_right) > 1000 or abs(_left) > 10**6):
+      raise ValueError('Power is too large')
+    return _BINARY_OPERATORS[type(_node.op)](_left, _right)
+  if isinstance(_node, ast.Call) and isinstance(_node.func, ast.Name) and _node.func.id == 'sqrt' and len(_node.args) == 1 and len(_node.keywords) == 0:
+    return math.sqrt(_safe_eval(_node.args[0]))
+  raise ValueError('Not arithmetic')
+
+def _unit_rate(
+    _math_input: str):
+  '''
+  Tier (2): The time taken to travel a distance at a speed.
+  '''
+  _text = _normalize_question(_math_input).strip(' ?.')
+  _distance_units = '|'.join(sorted([re.escape(_) for _ in _DISTANCE_UNITS], key = len, reverse = True))
+  _speed_units = '|'.join(sorted([re.escape(_) for _ in _SPEED_UNITS], key = len, reverse = True))
+  _match = re.fullmatch(rf'how long (does|will|would) it take (to|me to|you to) (\w+) (\d+(\.\d+)?) ?({_distance_units}) (at|going|travelling|traveling at) (\d+(\.\d+)?) ?({_speed_units})', _text)
+  if _match is None:
+    return None
+  _distance = float(_match.group(4)) * _DISTANCE_UNITS[_match.group(6)]
+  _speed = float(_match.group(8)) * _SPEED_UNITS[_match.group(10)]
+  _minutes = 60 * _distance / _speed
+  _code = f'def main():\n  # {_code_comment(_math_input)}\n  _distance_km = {_distance}\n  _speed_kph = {_speed}\n  return 60 * _distance_km / _speed_kph'
+  return _format_minutes(_minutes), _code
+
+def _format_minutes(
+    _minutes: float) -> str:
+  _minutes = round(_minutes, 2)
+  if _minutes < 60:
+    return f'{_minutes:g} minutes'
+  _hours, _minutes = int(_minutes // 60), round(_minutes % 60, 2)
+  if _minutes == 0:
+    return f'{_hours} hours'
+  return f'{_hours} hours and {_minutes:g} minutes'
+
+def _date_offset(
+    _math_input: str):
+  '''
+  Tier (3): A number of days, weeks, months or years before or after a date (day/month/year).
+  '''
+  _text = _normalize_question(_math_input).strip(' ?.')
+  _match = re.fullmatch(r'(what is |what\'s |what will be |what was )?(the date |the day )?(in )?(\d+) (day|days|week|weeks|month|months|year|years) (after|before|from) (\d{1,2})/(\d{1,2})/(\d{4})', _text)
+  if _match is None:
+    return None
+  _number, _unit, _direction = int(_match.group(4)), _match.group(5).rstrip('s'), _match.group(6)
+  _date = datetime.date(int(_match.group(9)), int(_match.group(8)), int(_match.group(7)))
+  _sign = -1 if _direction == 'before' else 1
+  if _unit in ['day', 'week']:
+    _new_date = _date + datetime.timedelta(days = _sign * _number * (7 if _unit == 'week' else 1))
+  else:
+    _months = _sign * _number * (12 if _unit == 'year' else 1)
+    _year, _month = divmod(_date.month - 1 + _months, 12)
+    _year, _month = _date.year + _year, _month + 1
+    # The day is moved back to the end of the month if the new month is shorter (e.g. 31/1 + 1 month is 29/2 or 28/2).
+    _new_date = datetime.date(_year, _month, min(_date.day, calendar.monthrange(_year, _month)[1]))
+  _code = f'def main():\n  # {_code_comment(_math_input)}\n  import datetime\n  _date = datetime.date({_date.year}, {_date.month}, {_date.day})\n  _new_date = datetime.date({_new_date.year}, {_new_date.month}, {_new_date.day})\n  return f"{{_new_date.day}}/{{_new_date.month}}/{{_new_date.year}}"'
+  return f'{_new_date.day}/{_new_date.month}/{_new_date.year}', _code
\ No newline at end of file
@@ -0,0 +1,181 @@
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import queue
+import threading
+import time
+
+'''
+_CodeRunner runs the python code written by the calculator in a pool of separate worker processes, rather than inside Jay.
+
+The workers are started when the pool is created, and each one imports sympy and numpy straight away, so the imports are not paid for while the user waits.
+Each piece of code is run in a fresh namespace, and must define "main()", which returns the answer.
+The code is given a time limit. If the code runs for too long (e.g. an infinite loop), its worker is stopped and replaced, so the code can never hang Jay.
+On systems that have "resource" (not Windows), each worker is also given a memory limit.
+Only simple values (numbers, STR, LIST, DICT, etc) are sent back from the worker. Any other result (e.g. a sympy expression) is sent back as its STR.
+Several pieces of code can be run at the same time, one per worker (see "_run_batch").
+'''
+
+def _worker_main(
+    _connection,
+    _memory_limit_mb: int):
+  '''
+  The loop that each worker process runs. The worker receives code, runs it and sends back (_success, _result).
+  '''
+  if _memory_limit_mb > 0:
+    try:
+      import resource
+      resource.setrlimit(resource.RLIMIT_AS, (_memory_limit_mb * 2**20, _memory_limit_mb * 2**20))
+    except (ImportError, ValueError, OSError):
+      pass
+  # The libraries the calculator's code usually uses are imported before the worker is ready.
+  try:
+    import numpy
+    import sympy
+  except ImportError:
+    pass
+  _connection.send('ready')
+  while True:
+    try:
+      _code = _connection.recv()
+    except EOFError:
+      break
+    _namespace = {'__name__': '_calculator_code'}
+    try:
+      exec(_code, _namespace)
+      if 'main' not in _namespace:
+        raise NameError("name 'main' is not defined")
+      _connection.send((True, _to_simple_value(_namespace['main']())))
+    except (Exception, SystemExit) as e:
+      # Some errors (e.g. MemoryError) have no message, so the name of the error is used.
+      _connection.send((False, str(e) if str(e) != '' else type(e).__name__))
+
+def _to_simple_value(_value):
+  '''
+  Converts the result of the code into a value that can be sent back from the worker without importing anything (e.g. sympy) in Jay.
+  '''
+  if _value is None or type(_value) in [bool, int, float, complex, str]:
+    return _value
+  if type(_value) in [list, tuple, set]:
+    return type(_value)([_to_simple_value(_) for _ in _value])
+  if type(_value) is dict:
+    return {_to_simple_value(_k): _to_simple_value(_v) for _k, _v in _value.items()}
+  return str(_value)
+
+class _CodeRunner():
+  def __init__(
+      self,
+      _workers: int = 2,
+      _timeout: float = 10.0,
+      _memory_limit_mb: int = 4096):
+    '''
+    Args:
+     - _workers (INT): The number of worker processes, which is the number of pieces of code that can run at the same time.
+     - _timeout (FLOAT): The number of seconds code can run before it is stopped.
+     - _memory_limit_mb (INT): The memory (address space) each worker can use, in MB. Set to -1 for no limit. Not used on Windows.
+    '''
+    self._timeout = _timeout
+    self._memory_limit_mb = _memory_limit_mb
+    # The workers are started fresh, rather than copied from Jay (which holds the loaded models).
+    self._context = multiprocessing.get_context('spawn')
+    self._idle_workers = queue.Queue()
+    self._workers = []
+    self._executor = ThreadPoolExecutor(max_workers = _workers)
+    self._lock = threading.Lock()
+    for _ in range(_workers):
+      self._idle_workers.put(self._start_worker())
+    
+    self._runs = 0
+    self._timeouts = 0
+    self._crashes = 0
+    self._run_time = 0.0
+  
+  def _start_worker(self) -> dict:
+    _parent_connection, _child_connection = self._context.Pipe()
+    _process = self._context.Process(target = _worker_main, args = (_child_connection, self._memory_limit_mb), daemon = True)
+    _process.start()
+    _child_connection.close()
+    _worker = {'process': _process, 'connection': _parent_connection, 'ready': False}
+    with self._lock:
+      self._workers.append(_worker)
+    return _worker
+  
+  def _stop_worker(
+      self,
+      _worker: dict):
+    _worker['process'].terminate()
+    _worker['process'].join(timeout = 1)
+    _worker['connection'].close()
+    with self._lock:
+      self._workers.remove(_worker)
+  
+  def _run(
+      self,
+      _code: str,
+      _timeout: float = -1):
+    '''
+    Runs the code on the next free worker, and returns the result of "main()".
+    
+    Args:
+     - _code (STR): The python code. It must define "main()".
+     - _timeout (FLOAT): The time limit, in seconds. Defaults to -1 (the runner's _timeout).
+    
+    Returns:
+     - _success (BOOL): Whether the code ran without an error.
+     - _result: The result of "main()" if the code ran, or the error message (STR) if it did not.
+    '''
+    _timeout = self._timeout if _timeout <= 0 else _timeout
+    _worker = self._idle_workers.get()
+    _stt = time.time()
+    try:
+      if not _worker['ready']:
+        # A new worker is only ready once it has imported sympy and numpy. This is not counted in the time limit.
+        _worker['connection'].recv()
+        _worker['ready'] = True
+        _stt = time.time()
+      _worker['connection'].send(_code)
+      if not _worker['connection'].poll(_timeout):
+        self._stop_worker(_worker)
+        _worker = self._start_worker()
+        self._timeouts += 1
+        return False, f'The code took longer than {_timeout} seconds to run, and was stopped. Make sure the code does not loop forever'
+      return _worker['connection'].recv()
+    except (EOFError, OSError):
+      # The worker stopped while it was running the code (e.g. it ran out of memory).
+      self._stop_worker(_worker)
+      _worker = self._start_worker()
+      self._crashes += 1
+      return False, 'The code crashed while it was running, which can happen if it uses too much memory'
+    finally:
+      self._runs += 1
+      self._run_time += time.time() - _stt
+      self._idle_workers.put(_worker)
+  
+  def _run_batch(
+      self,
+      _codes: list) -> list:
+    '''
+    Runs several pieces of code at the same time, one per worker.
+    
+    Returns:
+     - _results (LIST): (_success, _result) for each piece of code, in the same order as _codes.
+    '''
+    return list(self._executor.map(self._run, _codes))
+  
+  def _close(self):
+    for _worker in list(self._workers):
+      self._stop_worker(_worker)
+
+_code_runner = None
+_code_runner_lock = threading.Lock()
+
+def _get_code_runner() -> _CodeRunner:
+  '''
+  Returns the code runner that is shared by the whole process, starting it if it has not been started yet.
+  '''
+  global _code_runner
+  with _code_runner_lock:
+    if _code_runner is None:
+      _code_runner = _CodeRunner()
+      atexit.register(_code_runner._close)
+    return _code_runner
\ No newline at end of file
@@ -0,0 +1,175 @@
+import re
+
+'''
+_ContextWindow keeps the prompt that is sent to Jay's LLM within a token budget.
+
+The conversation is kept as a list of segments, each of which knows its own token count, so the size of the prompt is tracked incrementally rather than by tokenizing the whole conversation every turn.
+The starting prompt (the system prompt and examples) is pinned, and is never compacted.
+Once the budget is crossed, the window is compacted down to a target size in two stages:
+(1) Old system results ("to-Jay:" payloads, e.g. entire downloaded webpages or files) are cut down to their first few hundred characters.
+(2) If that is not enough, the oldest exchanges (a user input, and everything Jay and system said until the next user input) are removed, and replaced by a short summary.
+The most recent exchanges are never removed.
+(3) As a last resort, if the window is still over the budget (e.g. a very large webpage or file in the most recent exchange), the system results of the most recent exchanges are also cut down, oldest first.
+'''
+
+class _ContextWindow():
+  def __init__(
+      self,
+      _pinned_prompt: str,
+      _count_tokens,
+      _budget_tokens: int = 24576,
+      _target_tokens: int = -1,
+      _keep_recent_exchanges: int = 2,
+      _tool_result_chars: int = 300,
+      _summary_chars: int = 150,
+      _max_summary_chars: int = 4000,
+      _summarize_function = None):
+    '''
+    Args:
+     - _pinned_prompt (STR): The starting prompt, which is never compacted.
+     - _count_tokens: A function that returns the number of tokens in a STR.
+     - _budget_tokens (INT): The window is compacted once it is larger than this many tokens.
+     - _target_tokens (INT): The size the window is compacted down to. Defaults to -1 (2/3 of _budget_tokens), so that compaction does not happen every turn.
+     - _keep_recent_exchanges (INT): The number of recent exchanges that are never removed. Their system results are only cut down if the window is still over the budget.
+     - _tool_result_chars (INT): The length that old "to-Jay:" payloads are cut down to.
+     - _summary_chars (INT): The length of each user input and Jay response in the default summary.
+     - _max_summary_chars (INT): The maximum length of the summary. The oldest part of the summary is removed first.
+     - _summarize_function: A function that is given the text of the removed exchanges, and returns a summary STR. Defaults to None (a short extractive summary).
+    '''
+    self._pinned_prompt = _pinned_prompt
+    self._count_tokens = _count_tokens
+    self._budget_tokens = _budget_tokens
+    self._target_tokens = _target_tokens if _target_tokens > 0 else (2 * _budget_tokens) // 3
+    self._keep_recent_exchanges = _keep_recent_exchanges
+    self._tool_result_chars = _tool_result_chars
+    self._summary_chars = _summary_chars
+    self._max_summary_chars = _max_summary_chars
+    self._summarize_function = _summarize_function
+    
+    self._pinned_tokens = self._count_tokens(_pinned_prompt)
+    self._summary_text = ''
+    self._summary = ''
+    self._summary_tokens = 0
+    # Each segment is a dict: {'text': STR, 'tokens': INT, 'type': 'user', 'tool' or 'assistant'}.
+    self._segments = []
+    self._segment_tokens = 0
+    self._compactions = 0
+  
+  def _append(
+      self,
+      _text: str,
+      _segment_type: str):
+    '''
+    Adds text to the end of the conversation.
+    
+    Args:
+     - _text (STR): The text to be added.
+     - _segment_type (STR): 'user' if the text is the user's input (which begins a new exchange), 'tool' if the text is a system result, or 'assistant' if the text is Jay's output.
+    '''
+    assert _segment_type in ['user', 'tool', 'assistant']
+    _tokens = self._count_tokens(_text)
+    self._segments.append({'text': _text, 'tokens': _tokens, 'type': _segment_type})
+    self._segment_tokens += _tokens
+  
+  def _total_tokens(self) -> int:
+    return self._pinned_tokens + self._summary_tokens + self._segment_tokens
+  
+  def _prompt(self) -> str:
+    '''
+    Returns the prompt that is sent to the LLM: the pinned prompt, the summary of removed exchanges and the remaining conversation.
+    '''
+    return self._pinned_prompt + self._summary + ''.join([_['text'] for _ in self._segments])
+  
+  def _compact(self) -> bool:
+    '''
+    Compacts the window if it is over the budget.
+    
+    Returns:
+     - _compacted (BOOL): Whether the window was compacted (it is smaller than it was).
+    '''
+    if self._total_tokens() <= self._budget_tokens:
+      return False
+    _tokens_before = self._total_tokens()
+    
+    # The exchanges that can be compacted are every exchange before the most recent few.
+    _exchange_starts = [_index for _index, _segment in enumerate(self._segments) if _segment['type'] == 'user']
+    _protected_index = _exchange_starts[-self._keep_recent_exchanges] if len(_exchange_starts) > self._keep_recent_exchanges else 0
+    
+    # Stage (1): Old system results are cut down, oldest first.
+    for _segment in self._segments[:_protected_index]:
+      if self._total_tokens() <= self._target_tokens:
+        break
+      if _segment['type'] == 'tool':
+        self._shorten_tool_result(_segment)
+    
+    # Stage (2): The oldest exchanges are removed and summarized.
+    _removed_until = 0
+    for _end in _exchange_starts[1:]:
+      if self._total_tokens() <= self._target_tokens or _end > _protected_index:
+        break
+      self._segment_tokens -= sum([_['tokens'] for _ in self._segments[_removed_until:_end]])
+      _removed_until = _end
+    if _removed_until > 0:
+      _removed_segments = self._segments[:_removed_until]
+      self._segments = self._segments[_removed_until:]
+      self._add_to_summary(_removed_segments)
+      _protected_index -= _removed_until
+    
+    # Stage (3): The system results of the most recent exchanges are cut down, oldest first, so a single large result cannot keep the prompt over the budget.
+    for _segment in self._segments[_protected_index:]:
+      if self._total_tokens() <= self._budget_tokens:
+        break
+      if _segment['type'] == 'tool':
+        self._shorten_tool_result(_segment)
+    
+    if self._total_tokens() >= _tokens_before:
+      return False
+    self._compactions += 1
+    return True
+  
+  def _shorten_tool_result(
+      self,
+      _segment):
+    '''
+    Cuts the "to-Jay:" payload of a system result down to _tool_result_chars characters.
+    The end of the segment (the end of the result and the prompt tags that follow it) is kept.
+    '''
+    _match = re.match(r'(\(to-Jay:)(.*)(\)\. .*)$', _segment['text'], re.DOTALL)
+    if _match is None or len(_match.group(2)) <= self._tool_result_chars:
+      return
+    _segment['text'] = _match.group(1) + _match.group(2)[:self._tool_result_chars] + ' ... [Result shortened]' + _match.group(3)
+    _tokens = self._count_tokens(_segment['text'])
+    self._segment_tokens += _tokens - _segment['tokens']
+    _segment['tokens'] = _tokens
+  
+  def _add_to_summary(
+      self,
+      _removed_segments: list):
+    '''
+    Summarizes the removed exchanges, and adds the summary to the start of the conversation.
+    '''
+    _removed_text = ''.join([_['text'] for _ in _removed_segments])
+    if self._summarize_function is not None:
+      _new_summary = self._summarize_function(_removed_text)
+    else:
+      _new_summary = ''
+      for _segment in _removed_segments:
+        _text = self._strip_prompt_tags(_segment['text'])
+        if _segment['type'] == 'user' and len(_text) > 0:
+          _new_summary += f' User: "{_text[:self._summary_chars]}".'
+        elif _segment['type'] == 'assistant' and len(_text) > 0:
+          _new_summary += f' Jay: "{_text[:self._summary_chars]}".'
+    self._summary_text = (self._summary_text + _new_summary)[-self._max_summary_chars:]
+    self._summary = f'(Summary of the earlier conversation:{self._summary_text}) '
+    self._summary_tokens = self._count_tokens(self._summary)
+  
+  def _strip_prompt_tags(
+      self,
+      _text: str) -> str:
+    '''
+    Removes the Llama3 prompt tags and Jay's internal monologue, leaving only what was said.
+    '''
+    _text = re.sub(r'<jay_internal>.*?</jay_internal>', '', _text, flags = re.DOTALL)
+    _text = re.sub(r'<\|start_header_id\|>.*?<\|end_header_id\|>', '', _text)
+    _text = _text.replace('<|eot_id|>', '').replace('<START>', '')
+    return ' '.join(_text.split())
\ No newline at end of file
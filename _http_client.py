@@ -0,0 +1,114 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+'''
+_HttpClient sends every request that _Query makes to the internet (searches, webpages and PDFs).
+
+Every request used to call "requests.get" on its own, which opens a new connection (and does a new TLS handshake) every time, even for the two Google searches of every query.
+The client keeps one "requests.Session", so connections are kept open (keep-alive) and reused for the next request to the same host.
+ - Connection pool: Up to _pool_maxsize connections are kept open to each host, for up to _pool_connections hosts.
+ - Per-host limit: At most _per_host_limit requests are sent to the same host at the same time, so the concurrent downloads of a query never flood one website.
+ - Compression: Responses are compressed (gzip and deflate, and brotli if it is installed).
+ - Headers: Every request is sent with the same headers. Google's answer box needs a browser User-Agent, which is sent with "_browser = True".
+The number of connections that were opened, and the number of requests that reused an open connection, are counted (see "_stats").
+'''
+
+_BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.67 Safari/537.36'
+
+class _HttpClient():
+  def __init__(
+      self,
+      _pool_connections: int = 16,
+      _pool_maxsize: int = 8,
+      _per_host_limit: int = 4,
+      _timeout: float = 10.0,
+      _headers: dict = {}):
+    '''
+    Args:
+     - _pool_connections (INT): The number of hosts that connections are kept open to.
+     - _pool_maxsize (INT): The number of connections kept open to each host.
+     - _per_host_limit (INT): The number of requests that can be sent to the same host at the same time.
+     - _timeout (FLOAT): The default number of seconds a request can take to connect, and between bytes of the response.
+     - _headers (DICT): Headers sent with every request, on top of the default headers.
+    '''
+    self._timeout = _timeout
+    self._per_host_limit = _per_host_limit
+    self._session = requests.Session()
+    self._adapter = HTTPAdapter(pool_connections = _pool_connections, pool_maxsize = _pool_maxsize)
+    self._session.mount('http://', self._adapter)
+    self._session.mount('https://', self._adapter)
+    try:
+      import brotli
+      _encodings = 'gzip, deflate, br'
+    except ImportError:
+      _encodings = 'gzip, deflate'
+    self._session.headers.update({'Accept-Encoding': _encodings, 'Connection': 'keep-alive'})
+    self._session.headers.update(_headers)
+    self._host_limits = {}
+    self._lock = threading.Lock()
+    self._requests = 0
+    self._failures = 0
+  
+  def _get(
+      self,
+      _url: str,
+      _params: dict = None,
+      _timeout: float = -1,
+      _browser: bool = False,
+      _headers: dict = None) -> requests.Response:
+    '''
+    Sends a GET request, reusing an open connection to the host if there is one.
+    
+    Args:
+     - _url (STR): The URL.
+     - _params (DICT): The query parameters (e.g. {'q': _query}).
+     - _timeout (FLOAT): Defaults to -1 (the client's _timeout).
+     - _browser (BOOL): Whether the request is sent with a browser User-Agent. Defaults to False.
+     - _headers (DICT): Headers for this request only.
+    
+    Returns:
+     - _response (requests.Response): Raises the same errors as "requests.get".
+    '''
+    _request_headers = dict(_headers) if _headers is not None else {}
+    if _browser:
+      _request_headers['User-Agent'] = _BROWSER_USER_AGENT
+    with self._host_limit(_url):
+      try:
+        return self._session.get(_url, params = _params, headers = _request_headers, timeout = self._timeout if _timeout <= 0 else _timeout)
+      except requests.RequestException:
+        with self._lock:
+          self._failures += 1
+        raise
+      finally:
+        with self._lock:
+          self._requests += 1
+  
+  def _host_limit(
+      self,
+      _url: str) -> threading.BoundedSemaphore:
+    _host = urlparse(_url).netloc.lower()
+    with self._lock:
+      if _host not in self._host_limits:
+        self._host_limits[_host] = threading.BoundedSemaphore(self._per_host_limit)
+      return self._host_limits[_host]
+  
+  def _stats(self) -> dict:
+    '''
+    Returns the number of requests, the number of connections that were opened and the number of requests that reused an open connection.
+    Hosts whose connections have been closed (once more than _pool_connections hosts are used) are not counted.
+    '''
+    _connections, _pool_requests = 0, 0
+    _pools = self._adapter.poolmanager.pools
+    for _key in list(_pools.keys()):
+      _pool = _pools.get(_key)
+      if _pool is not None:
+        _connections += _pool.num_connections
+        _pool_requests += _pool.num_requests
+    with self._lock:
+      return {'requests': self._requests, 'failures': self._failures, 'connections': _connections, 'reused': max(0, _pool_requests - _connections)}
+
+# The client is shared by the whole process, so every query reuses the same connections.
+_http_client = _HttpClient()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import json
+import os
+
+'''
+_TranscriptJournal saves Jay's conversation to file as it happens.
+
+Rather than re-writing the whole conversation every turn, only the text that was added is appended to the journal.
+Each line of the journal is a JSON record: {"type": ..., "text": ...}, where "type" is one of:
+ - 'prompt': The starting prompt (always the first record).
+ - 'user': The user's input.
+ - 'tool': A system result ("to-Jay:").
+ - 'assistant': Jay's output.
+The conversation is rebuilt by joining the text of every record in order (see "_read_journal").
+'''
+
+class _TranscriptJournal():
+  def __init__(
+      self,
+      _filename: str,
+      _fsync_policy: str = 'turn',
+      _buffer_size: int = 65536):
+    '''
+    Args:
+     - _filename (STR): The journal file. If the file already exists, the journal is appended to it.
+     - _fsync_policy (STR): When the journal is forced onto the disk.
+                            'always': after every record.
+                            'turn': at the end of every turn (see "_end_turn").
+                            'never': the journal is flushed to the OS at the end of every turn, but the OS decides when it is written to disk.
+     - _buffer_size (INT): The size of the write buffer, in bytes.
+    '''
+    assert _fsync_policy in ['always', 'turn', 'never']
+    self._filename = _filename
+    self._fsync_policy = _fsync_policy
+    _folder = os.path.dirname(_filename)
+    if _folder != '':
+      os.makedirs(_folder, exist_ok = True)
+    # A half-written final line is ended, so that new records are not joined onto it.
+    _half_written = False
+    if os.path.exists(_filename) and os.path.getsize(_filename) > 0:
+      with open(_filename, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        _half_written = f.read(1) != b'\n'
+    self._file = open(_filename, 'a', encoding = 'utf-8', buffering = _buffer_size)
+    if _half_written:
+      self._file.write('\n')
+    self._records_written = 0
+    self._bytes_written = 0
+  
+  def _append(
+      self,
+      _text: str,
+      _record_type: str):
+    '''
+    Appends a record to the journal. The record is buffered, and is written at the end of the turn (unless _fsync_policy is 'always').
+    '''
+    assert _record_type in ['prompt', 'user', 'tool', 'assistant']
+    _line = json.dumps({'type': _record_type, 'text': _text}, ensure_ascii = False) + '\n'
+    self._file.write(_line)
+    self._records_written += 1
+    self._bytes_written += len(_line)
+    if self._fsync_policy == 'always':
+      self._sync()
+  
+  def _end_turn(self):
+    '''
+    Writes the buffered records at the end of a turn.
+    '''
+    if self._fsync_policy == 'turn':
+      self._sync()
+    else:
+      self._file.flush()
+  
+  def _sync(self):
+    self._file.flush()
+    os.fsync(self._file.fileno())
+  
+  def _close(self):
+    if not self._file.closed:
+      self._sync()
+      self._file.close()
+
+def _read_journal(
+    _filename: str) -> list:
+  '''
+  Reads the records of a journal.
+  A half-written line (e.g. if Jay was closed in the middle of a write) is ignored.
+  
+  Args:
+   - _filename (STR): The journal file.
+  
+  Returns:
+   - _records (LIST): Each record is a DICT, with the keys 'type' and 'text'.
+  '''
+  _records = []
+  with open(_filename, 'r', encoding = 'utf-8') as f:
+    for _line in f:
+      try:
+        _records.append(json.loads(_line))
+      except json.JSONDecodeError:
+        continue
+  return _records
+
+def _journal_to_conversation(
+    _records: list) -> str:
+  '''
+  Rebuilds the conversation, as a single STR, from the records of a journal.
+  '''
+  return ''.join([_['text'] for _ in _records])
\ No newline at end of file
@@ -0,0 +1,327 @@
+import hashlib
+import math
+import os
+import pickle
+import time
+
+'''
+_LlamaSession keeps a Llama_CPP model "warm" between prompts.
+
+Llama_CPP keeps the tokens that it has evaluated (and the KV cache behind them) inside the Llama object.
+Jay's conversation only ever grows at the end, so every turn shares a very long prefix with the previous turn (the system prompt, the examples and every previous turn).
+The session compares the new prompt against the evaluated tokens, rewinds the KV cache to the longest common prefix and only evaluates the tokens after it.
+If the prompt diverges from the evaluated tokens (e.g. the conversation was edited), the KV cache is rewound to where they diverge, rather than being thrown away.
+
+The KV cache of a fixed prefix (e.g. Jay's system prompt and examples) can also be saved to disk as a snapshot, so that a new process can load it instead of evaluating the prefix again.
+
+Yes/no questions (e.g. "TRUE" or "FALSE") are answered by "_classify": the prompt is evaluated once, and the logits of the first token of each label are compared, so nothing is sampled.
+'''
+
+class _LlamaSession():
+  def __init__(
+      self,
+      _llm):
+    '''
+    Args:
+     - _llm: The language model, from Llama_CPP.
+    '''
+    self._llm = _llm
+    self._end_of_generation_tokens = self._find_end_of_generation_tokens()
+    
+    # Statistics of the previous call.
+    self._prompt_tokens = 0
+    self._completion_tokens = 0
+    self._prefix_hit_tokens = 0
+    self._diverged = False
+    
+    # Statistics over the whole session.
+    self._total_prompt_tokens = 0
+    self._total_prefix_hit_tokens = 0
+    self._total_divergences = 0
+  
+  def _tokenize(
+      self,
+      _prompt_input: str):
+    '''
+    Tokenizes the prompt the same way Llama_CPP does, so the tokens can be compared with the evaluated tokens.
+    "<|begin_of_text|>" is added by the tokenizer, so it is removed from the text.
+    '''
+    if '<|begin_of_text|>' == _prompt_input[:17]:
+      _prompt_input = _prompt_input[17:]
+    return self._llm.tokenize(bytes(_prompt_input, 'utf-8'), add_bos = True, special = True)
+  
+  def _find_end_of_generation_tokens(self) -> set:
+    '''
+    The tokens that end generation.
+    Llama 3 ends each turn with "<|eot_id|>" (or "<|eom_id|>"), which is not the model's "token_eos()" ("<|end_of_text|>"), so these are found by tokenizing them.
+    '''
+    _end_of_generation_tokens = set([self._llm.token_eos()])
+    for _special_token in ['<|eot_id|>', '<|eom_id|>', '<|end_of_text|>']:
+      _ids = self._llm.tokenize(bytes(_special_token, 'utf-8'), add_bos = False, special = True)
+      # Models without the special token split it into several ordinary tokens, which must not stop generation.
+      if len(_ids) == 1:
+        _end_of_generation_tokens.add(_ids[0])
+    return _end_of_generation_tokens
+  
+  def _rewind(
+      self,
+      _tokens: list) -> int:
+    '''
+    Rewinds the evaluated tokens to the longest common prefix with _tokens.
+    The last prompt token is never reused, so that there are fresh logits to sample the first token from.
+    
+    Args:
+     - _tokens (LIST): The tokenized prompt.
+    
+    Returns:
+     - _prefix (INT): The number of tokens that do not need to be evaluated again.
+    '''
+    _evaluated_tokens = self._llm._input_ids
+    _prefix = 0
+    for _evaluated_token, _token in zip(_evaluated_tokens, _tokens[:-1]):
+      if _evaluated_token != _token:
+        break
+      _prefix += 1
+    # The prompt diverges if an evaluated token was not reused, excluding the final (un-evaluated) token from the previous generation.
+    self._diverged = _prefix < len(_evaluated_tokens) and _prefix < len(_tokens) - 1
+    if self._diverged:
+      self._total_divergences += 1
+    # Llama_CPP removes everything in the KV cache after "n_tokens" when it next evaluates.
+    self._llm.n_tokens = _prefix
+    return _prefix
+  
+  def _stream(
+      self,
+      _prompt_input: str,
+      _stop_tokens: list = ['<|eot_id|>'],
+      _max_tokens: int = -1,
+      _repeat_penalty: float = 1.1,
+      _temperature: float = 0.8,
+      _top_k: int = 40,
+      _top_p: float = 0.95,
+      _tool_call_detector = None,
+      _tool_call_grammar = None):
+    '''
+    Generates text from the prompt, only evaluating the tokens that are not already in the KV cache.
+    The text is yielded as it is generated. Text that could be the start of a stop token is held back until it is certain it is not.
+    
+    Args:
+     - _prompt_input (STR): The input text. This is the whole conversation, not only the new text.
+     - _stop_tokens (LIST): Generation stops when any of these strings are generated. Generation also stops on an end-of-generation token (e.g. "<|eot_id|>"), whatever the stop strings are.
+     - _max_tokens (INT): The maximum output tokens. Defaults to -1 (no maximum length).
+     - _repeat_penalty (FLOAT): Defaults to 1.1.
+     - _temperature, _top_k, _top_p: Sampling parameters. Default to the Llama_CPP defaults.
+     - _tool_call_detector: A _ToolCallDetector. If given, generation stops as soon as Jay's system calls are complete. Defaults to None.
+     - _tool_call_grammar: A LlamaGrammar of the valid system calls (see _ToolRegistry._grammar). Only used with _tool_call_detector. Once "to-system:" is generated, the rest of the response is sampled with the grammar, so the call always parses. If the token that completes "to-system:" also starts the call, generation is rolled back to the end of "to-system:" first. Defaults to None.
+
+    Yields:
+     - _text (STR): The next piece of generated text.
+    '''
+    _tokens = self._tokenize(_prompt_input)
+    _prefix = self._rewind(_tokens)
+    self._prompt_tokens = len(_tokens)
+    self._prefix_hit_tokens = _prefix
+    self._completion_tokens = 0
+    self._total_prompt_tokens += len(_tokens)
+    self._total_prefix_hit_tokens += _prefix
+    
+    _n_ctx = self._llm.n_ctx()
+    _hold = max([len(_) for _ in _stop_tokens] + [1]) - 1
+    _output_bytes, _output, _emitted, _detected = b'', '', 0, 0
+    _generator = self._llm.generate(
+        _tokens[_prefix:],
+        top_k = _top_k,
+        top_p = _top_p,
+        temp = _temperature,
+        repeat_penalty = _repeat_penalty,
+        reset = False)
+    _grammar_applied = False
+    while True:
+      _token = next(_generator, None)
+      if _token is None or _token in self._end_of_generation_tokens:
+        break
+      self._completion_tokens += 1
+      _output_bytes += self._llm.detokenize([_token], special = True)
+      # Incomplete multi-byte characters are dropped until the rest of the character is generated.
+      _output = _output_bytes.decode('utf-8', errors = 'ignore')
+      _stop_indices = [_output.find(_) for _ in _stop_tokens if _ in _output]
+      if len(_stop_indices) > 0:
+        _output = _output[:min(_stop_indices)]
+        break
+      # The detector reads the text before it is held back, so generation stops on the token that completes the call.
+      if _tool_call_detector is not None and _tool_call_detector._feed(_output[_detected:]):
+        _output = _output[:_tool_call_detector._end]
+        break
+      # If the token that completes "to-system:" also starts the call (e.g. ": _"), the token is dropped before it is evaluated,
+      # and generation is restarted with the grammar from the end of "to-system:".
+      if _tool_call_grammar is not None and _tool_call_detector is not None and not _grammar_applied and _tool_call_detector._started_call_in(_detected):
+        _marker_end = _tool_call_detector._call_start
+        _marker_tokens = self._llm.tokenize(_output[_detected:_marker_end].encode('utf-8'), add_bos = False, special = True)
+        _output = _output[:_marker_end]
+        _output_bytes = _output.encode('utf-8')
+        _detected = len(_output)
+        _tool_call_detector._rewind_to_call_start()
+        self._completion_tokens += len(_marker_tokens) - 1
+        _generator.close()
+        _generator = self._llm.generate(
+            _marker_tokens,
+            top_k = _top_k,
+            top_p = _top_p,
+            temp = _temperature,
+            repeat_penalty = _repeat_penalty,
+            reset = False,
+            grammar = _tool_call_grammar)
+        _grammar_applied = True
+        continue
+      _detected = len(_output)
+      if _max_tokens > 0 and self._completion_tokens >= _max_tokens:
+        break
+      if self._llm.n_tokens + 1 >= _n_ctx:
+        break
+      if len(_output) - _hold > _emitted:
+        yield _output[_emitted:len(_output) - _hold]
+        _emitted = len(_output) - _hold
+      # Once "to-system:" is generated, generation is restarted with the grammar.
+      # The token that was just sampled has not been evaluated yet, so it is the first token given to the new generator.
+      if _tool_call_grammar is not None and _tool_call_detector is not None and not _grammar_applied and _tool_call_detector._waiting_for_call():
+        _generator.close()
+        _generator = self._llm.generate(
+            [_token],
+            top_k = _top_k,
+            top_p = _top_p,
+            temp = _temperature,
+            repeat_penalty = _repeat_penalty,
+            reset = False,
+            grammar = _tool_call_grammar)
+        _grammar_applied = True
+    if len(_output) > _emitted:
+      yield _output[_emitted:]
+  
+  def _generate(
+      self,
+      _prompt_input: str,
+      _stop_tokens: list = ['<|eot_id|>'],
+      _max_tokens: int = -1,
+      _repeat_penalty: float = 1.1):
+    '''
+    Generates text from the prompt statically. See "_stream".
+    
+    Returns:
+     - _output: The generated output text.
+     - _prompt_tokens: The length of prompt tokens.
+     - _completion_tokens: The length of tokens that are generated.
+     - _total_tokens: The total number of tokens that are prompted and generated.
+    '''
+    _output = ''.join(self._stream(
+        _prompt_input = _prompt_input,
+        _stop_tokens = _stop_tokens,
+        _max_tokens = _max_tokens,
+        _repeat_penalty = _repeat_penalty))
+    return _output, self._prompt_tokens, self._completion_tokens, self._prompt_tokens + self._completion_tokens
+
+  def _classify(
+      self,
+      _prompt_input: str,
+      _labels: dict):
+    '''
+    Classifies the prompt into one of the labels, from the logits of the token after the prompt.
+    Only the labels are compared (e.g. "[" is ignored, even if it is more likely than "TRUE").
+    
+    Args:
+     - _prompt_input (STR): The input text. The label is expected to be the next token.
+     - _labels (DICT): {_label: [_variant, ...]}, e.g. {'TRUE': ['TRUE', 'True'], 'FALSE': ['FALSE', 'False']}. Only the first token of each variant is compared, and the most likely variant is used for each label.
+    
+    Returns:
+     - _label (STR): The most likely label.
+     - _confidence (FLOAT): The probability of the label, out of the labels.
+     - _prompt_tokens (INT): The length of prompt tokens.
+    '''
+    _tokens = self._tokenize(_prompt_input)
+    _prefix = self._rewind(_tokens)
+    self._prompt_tokens = len(_tokens)
+    self._prefix_hit_tokens = _prefix
+    self._completion_tokens = 0
+    self._total_prompt_tokens += len(_tokens)
+    self._total_prefix_hit_tokens += _prefix
+    # _rewind never reuses the last prompt token, so it is always evaluated and its logits are fresh.
+    self._llm.eval(_tokens[_prefix:])
+    _logits = self._llm._ctx.get_logits()
+    _offset = 0
+    if self._llm.context_params.logits_all:
+      # Every token of the last batch has logits, and the last row belongs to the last prompt token.
+      _offset = ((len(_tokens) - _prefix - 1) % self._llm.n_batch) * self._llm.n_vocab()
+    
+    _label_logits = {}
+    for _label, _variants in _labels.items():
+      _variant_tokens = set([self._llm.tokenize(bytes(_variant, 'utf-8'), add_bos = False, special = False)[0] for _variant in _variants])
+      _label_logits[_label] = max([_logits[_offset + _token] for _token in _variant_tokens])
+    _max_logit = max(_label_logits.values())
+    _total = sum([math.exp(_logit - _max_logit) for _logit in _label_logits.values()])
+    _label = max(_label_logits, key = _label_logits.get)
+    return _label, 1.0 / _total, len(_tokens)
+  
+  def _prefill(
+      self,
+      _prompt_input: str) -> int:
+    '''
+    Evaluates the prompt into the KV cache, without generating anything.
+    
+    Returns:
+     - _evaluated_tokens (INT): The number of tokens that were evaluated (i.e. not already in the KV cache).
+    '''
+    _tokens = self._tokenize(_prompt_input)
+    _prefix = self._rewind(_tokens)
+    self._llm.eval(_tokens[_prefix:])
+    return len(_tokens) - _prefix
+  
+  def _snapshot_path(
+      self,
+      _snapshot_folder: str,
+      _model_path: str,
+      _prompt_input: str) -> str:
+    '''
+    The snapshot file name is keyed by the model path, the context length and a hash of the prefix, so a snapshot is never loaded for a different model or prompt.
+    '''
+    _key = f'{_model_path}|{self._llm.n_ctx()}|{_prompt_input}'
+    _hash = hashlib.sha256(_key.encode('utf-8')).hexdigest()[:16]
+    _model_name = os.path.basename(_model_path.replace('\\', '/')).replace('.gguf', '')
+    return os.path.join(_snapshot_folder, f'{_model_name}_{_hash}.kv')
+  
+  def _load_or_save_snapshot(
+      self,
+      _snapshot_folder: str,
+      _model_path: str,
+      _prompt_input: str):
+    '''
+    Restores the KV cache of _prompt_input from a snapshot on disk.
+    If there is no snapshot (or the snapshot cannot be used), the prefix is evaluated and a snapshot is saved for the next time.
+    
+    Args:
+     - _snapshot_folder (STR): The folder that snapshots are saved in.
+     - _model_path (STR): The path of the model weights.
+     - _prompt_input (STR): The fixed prefix. This must not change between processes (e.g. it must not contain the date).
+    
+    Returns:
+     - _loaded (BOOL): Whether the snapshot was loaded from disk.
+     - _time_taken (FLOAT): The time taken to load or evaluate and save the prefix.
+    '''
+    _stt = time.time()
+    _path = self._snapshot_path(_snapshot_folder = _snapshot_folder, _model_path = _model_path, _prompt_input = _prompt_input)
+    _tokens = self._tokenize(_prompt_input)
+    if os.path.exists(_path):
+      try:
+        with open(_path, 'rb') as f:
+          _state = pickle.load(f)
+        # The snapshot is only used if it holds exactly the tokens of the prefix.
+        if list(_state.input_ids[:_state.n_tokens]) == list(_tokens):
+          self._llm.load_state(_state)
+          return True, time.time() - _stt
+      except Exception:
+        pass
+    self._prefill(_prompt_input)
+    os.makedirs(_snapshot_folder, exist_ok = True)
+    # The snapshot is written to a temporary file first, so a half-written snapshot is never loaded.
+    with open(_path + '.tmp', 'wb') as f:
+      pickle.dump(self._llm.save_state(), f)
+    os.replace(_path + '.tmp', _path)
+    return False, time.time() - _stt
\ No newline at end of file
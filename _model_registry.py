@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+'''
+_ModelRegistry loads each Llama_CPP model once per process, and hands the same loaded model to every part of Jay that asks for it.
+
+Jay, _Query and the calculator all use the same .gguf weights. Rather than each loading their own Llama (the calculator used to load a new one every call), they ask the registry.
+Models are kept by their path, their settings and a context name:
+ - Jay has its own context ('Jay'), as its KV cache holds the conversation between turns (see _LlamaSession).
+ - _Query and the calculator share a context ('tools'). Only one of them can use it at a time, so each use must hold the model's lock.
+Llama_CPP memory-maps the weights, so the contexts of the same file share the weights in memory; each context only adds its own KV cache.
+
+The time taken to load each model, who uses it and the memory used by the process can be reported (see "_report").
+'''
+
+class _LoadedModel():
+  def __init__(
+      self,
+      _llm,
+      _model_path: str,
+      _context_name: str,
+      _n_ctx: int,
+      _load_time: float):
+    self._llm = _llm
+    self._model_path = _model_path
+    self._context_name = _context_name
+    self._n_ctx = _n_ctx
+    self._load_time = _load_time
+    self._consumers = []
+    # Llama_CPP is not thread-safe, so a context can only be used by one thread at a time.
+    self._lock = threading.RLock()
+
+class _ModelRegistry():
+  def __init__(self):
+    self._models = {}
+    self._lock = threading.Lock()
+  
+  def _get(
+      self,
+      _model_path: str,
+      _consumer: str,
+      _context_name: str = 'tools',
+      _n_ctx: int = 32768,
+      _n_gpu_layers: int = 0) -> _LoadedModel:
+    '''
+    Returns the loaded model, loading it if it has not been loaded yet.
+    
+    Args:
+     - _model_path (STR): The path of the .gguf weights.
+     - _consumer (STR): Who is using the model (e.g. '_Query'). Only used for reporting.
+     - _context_name (STR): Consumers with the same context name share one context (and KV cache). Defaults to 'tools'.
+     - _n_ctx (INT): The smallest context length the consumer needs. A loaded context that is at least this long is shared.
+     - _n_gpu_layers (INT): Defaults to 0.
+    
+    Returns:
+     - _loaded_model (_LoadedModel): The model. The Llama object is "_loaded_model._llm".
+    '''
+    _key = (_model_path, _context_name, _n_gpu_layers)
+    with self._lock:
+      _loaded_model = self._models.get(_key)
+      if _loaded_model is None or _loaded_model._n_ctx < _n_ctx:
+        from llama_cpp import Llama
+        _stt = time.time()
+        _llm = Llama(model_path = _model_path, n_ctx = _n_ctx, n_gpu_layers = _n_gpu_layers, verbose = False)
+        _consumers = [] if _loaded_model is None else _loaded_model._consumers
+        _loaded_model = _LoadedModel(_llm = _llm, _model_path = _model_path, _context_name = _context_name, _n_ctx = _n_ctx, _load_time = time.time() - _stt)
+        _loaded_model._consumers = _consumers
+        self._models[_key] = _loaded_model
+      if _consumer not in _loaded_model._consumers:
+        _loaded_model._consumers.append(_consumer)
+      return _loaded_model
+  
+  def _report(self) -> dict:
+    '''
+    Returns every loaded model, and the memory used by the process.
+    {'models': [{'model': STR, 'context': STR, 'n_ctx': INT, 'load_time': FLOAT, 'consumers': LIST}], 'resident_memory_mb': FLOAT}
+    '''
+    with self._lock:
+      _models = [{'model': os.path.basename(_loaded_model._model_path.replace('\\', '/')),
+                  'context': _loaded_model._context_name,
+                  'n_ctx': _loaded_model._n_ctx,
+                  'load_time': round(_loaded_model._load_time, 4),
+                  'consumers': list(_loaded_model._consumers)} for _loaded_model in self._models.values()]
+    return {'models': _models, 'resident_memory_mb': _resident_memory_mb()}
+
+def _resident_memory_mb() -> float:
+  '''
+  The resident memory of the process, in MB. psutil is used if it is installed; otherwise, the peak resident memory is read from "resource" (not available on Windows).
+  Returns -1 if neither is available.
+  '''
+  try:
+    import psutil
+    return round(psutil.Process(os.getpid()).memory_info().rss / 2**20, 1)
+  except ImportError:
+    pass
+  try:
+    import resource
+    import sys
+    _max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KB elsewhere.
+    return round(_max_rss / 2**20 if sys.platform == 'darwin' else _max_rss / 2**10, 1)
+  except ImportError:
+    return -1
+
+# The registry is shared by the whole process.
+_model_registry = _ModelRegistry()
\ No newline at end of file
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+'''
+_PageCache keeps the cleaned text of downloaded webpages on disk, so the same webpage is not downloaded (and parsed) again by the next query.
+
+Each webpage is saved as its own .json file, named by a hash of its URL. The cleaned text is saved (not the HTML), so a cached webpage skips both the download and BeautifulSoup.
+ - TTL: A webpage is fresh for _default_ttl seconds, or for the TTL of its domain (e.g. Wikipedia articles are kept for longer, see _domain_ttls).
+ - Revalidation: Once a webpage is stale, the website is asked whether it has changed (using the "ETag" and "Last-Modified" the website sent). If it has not (a 304), the cached text is used and the webpage is fresh again.
+ - Size: Once the cache is larger than _max_megabytes, the least recently used webpages are removed.
+Only webpages that were downloaded successfully are cached.
+'''
+
+_DOMAIN_TTLS = {
+    'wikipedia.org': 7 * 24 * 3600,
+    'youtube.com': 30 * 24 * 3600,
+    'britannica.com': 7 * 24 * 3600}
+
+class _PageCache():
+  def __init__(
+      self,
+      _folder: str = 'Page_Cache',
+      _max_megabytes: float = 200.0,
+      _default_ttl: float = 24 * 3600,
+      _domain_ttls: dict = _DOMAIN_TTLS):
+    '''
+    Args:
+     - _folder (STR): The folder the webpages are saved in.
+     - _max_megabytes (FLOAT): The largest size of the cache on disk, in MB.
+     - _default_ttl (FLOAT): The number of seconds a webpage is fresh for. Defaults to 1 day.
+     - _domain_ttls (DICT): The number of seconds webpages from each domain are fresh for (e.g. {'wikipedia.org': 604800}). Subdomains are included.
+    '''
+    self._folder = _folder
+    self._max_bytes = int(_max_megabytes * 2**20)
+    self._default_ttl = _default_ttl
+    self._domain_ttls = _domain_ttls
+    # {_key: [_size, _last_used]}, loaded from the folder the first time the cache is used.
+    self._index = None
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._stale = 0
+    self._revalidated = 0
+    self._misses = 0
+  
+  def _get(
+      self,
+      _url: str):
+    '''
+    Returns the cached webpage, or None if it is not cached.
+    The webpage is a DICT: {'url', 'text', 'time', 'etag', 'last_modified', 'stale'}. If 'stale' is True, the webpage should be revalidated (see "_validators").
+    '''
+    _key = self._key(_url)
+    with self._lock:
+      self._load_index()
+      if _key not in self._index:
+        self._misses += 1
+        return None
+    try:
+      with open(self._path(_key), 'r', encoding = 'utf-8') as _file:
+        _page = json.load(_file)
+    except (OSError, json.JSONDecodeError):
+      with self._lock:
+        self._index.pop(_key, None)
+        self._misses += 1
+      return None
+    _page['stale'] = time.time() - _page['time'] > self._ttl(_url)
+    # The time the webpage was last used is kept on disk too, so the least recently used webpages are still known by the next process.
+    try:
+      os.utime(self._path(_key))
+    except OSError:
+      pass
+    with self._lock:
+      if _key in self._index:
+        self._index[_key][1] = time.time()
+      if not _page['stale']:
+        self._hits += 1
+      else:
+        self._stale += 1
+    return _page
+  
+  def _validators(
+      self,
+      _page) -> dict:
+    '''
+    The headers that ask the website whether a stale webpage has changed. Empty if _page is None or the website did not send an "ETag" or "Last-Modified".
+    '''
+    _headers = {}
+    if _page is not None and _page['stale']:
+      if _page.get('etag') is not None:
+        _headers['If-None-Match'] = _page['etag']
+      if _page.get('last_modified') is not None:
+        _headers['If-Modified-Since'] = _page['last_modified']
+    return _headers
+  
+  def _put(
+      self,
+      _url: str,
+      _text: str,
+      _etag: str = None,
+      _last_modified: str = None,
+      _revalidated: bool = False):
+    '''
+    Saves the webpage (or, if it was revalidated, saves it as fresh again), and removes the least recently used webpages if the cache is too large.
+    '''
+    _key = self._key(_url)
+    _data = json.dumps({'url': _url, 'text': _text, 'time': time.time(), 'etag': _etag, 'last_modified': _last_modified}, ensure_ascii = False)
+    with self._lock:
+      self._load_index()
+      os.makedirs(self._folder, exist_ok = True)
+      # The webpage is written to a temporary file first, so a half-written webpage is never read.
+      with open(self._path(_key) + '.tmp', 'w', encoding = 'utf-8') as _file:
+        _file.write(_data)
+      os.replace(self._path(_key) + '.tmp', self._path(_key))
+      self._index[_key] = [os.path.getsize(self._path(_key)), time.time()]
+      if _revalidated:
+        self._revalidated += 1
+      self._evict()
+  
+  def _evict(self):
+    _total = sum([_size for _size, _ in self._index.values()])
+    for _key, (_size, _) in sorted(self._index.items(), key = lambda _item: _item[1][1]):
+      if _total <= self._max_bytes:
+        break
+      try:
+        os.remove(self._path(_key))
+      except OSError:
+        pass
+      del self._index[_key]
+      _total -= _size
+  
+  def _load_index(self):
+    if self._index is not None:
+      return
+    self._index = {}
+    if not os.path.isdir(self._folder):
+      return
+    for _filename in os.listdir(self._folder):
+      if _filename.endswith('.json'):
+        _stat = os.stat(os.path.join(self._folder, _filename))
+        self._index[_filename[:-5]] = [_stat.st_size, _stat.st_mtime]
+  
+  def _ttl(
+      self,
+      _url: str) -> float:
+    _host = urlparse(_url).netloc.lower()
+    for _domain, _ttl in self._domain_ttls.items():
+      if _host == _domain or _host.endswith('.' + _domain):
+        return _ttl
+    return self._default_ttl
+  
+  def _key(
+      self,
+      _url: str) -> str:
+    return hashlib.sha256(_url.encode('utf-8')).hexdigest()[:32]
+  
+  def _path(
+      self,
+      _key: str) -> str:
+    return os.path.join(self._folder, f'{_key}.json')
+  
+  def _stats(self) -> dict:
+    with self._lock:
+      _index = self._index if self._index is not None else {}
+      return {'pages': len(_index), 'megabytes': round(sum([_size for _size, _ in _index.values()]) / 2**20, 2), 'hits': self._hits, 'stale': self._stale, 'revalidated': self._revalidated, 'misses': self._misses}
+
+# The page cache is shared by the whole process.
+_page_cache = _PageCache()
\ No newline at end of file
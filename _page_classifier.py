@@ -0,0 +1,114 @@
+import re
+import threading
+
+'''
+_PageClassifier decides whether a downloaded webpage is worth the LLM reading it, without an LLM call.
+
+Before a webpage is read, the LLM used to be asked (twice, with the whole webpage as context) whether the download worked, to catch 404s and "enable JavaScript" pages.
+Most webpages are obviously fine (long, readable English), or obviously not (a few lines saying "Page not found"), so they are classified from cheap features of their text instead:
+ - Length: The number of words.
+ - Error phrases: Phrases that only appear on failed downloads (see _ERROR_PATTERNS), e.g. "Page not found", "enable JavaScript", "Access denied" or a captcha. They count for more near the start of the webpage, where the error message is.
+   Single words that are common on error pages, but also in ordinary text (see _ERROR_WORDS), e.g. "404", "not found" or "forbidden", are never enough to reject a webpage. They only send it to the LLM.
+ - Boilerplate: Phrases from cookie banners, menus and log-in walls (see _BOILERPLATE_PATTERNS), per 100 words.
+ - Language: The fraction of words that are common English words, and the fraction of letters that are not Latin. Jay answers in English.
+A webpage is either 'accept' (read by the LLM, without the download check), 'reject' (skipped) or 'ambiguous' (the LLM checks the download, as before).
+HTTP errors (e.g. a 404 status) are rejected as the webpage is downloaded (see _Query._download_webpage), so they are never classified.
+The number of webpages of each kind, and the LLM calls saved, are counted (see "_stats").
+'''
+
+_ERROR_PATTERNS = [re.compile(_pattern, re.IGNORECASE) for _pattern in [
+    r'page (was )?not found', r'\b404 (error|not found)\b', r'access (is )?denied', r'\b403 forbidden\b',
+    r'enable javascript', r'javascript (is )?(disabled|required)', r'requires javascript', r'enable cookies',
+    r'checking (if the site connection is secure|your browser)', r'are you a (robot|human)', r'\bcaptcha\b', r'unusual traffic',
+    r'service (temporarily )?unavailable', r'bad gateway', r'internal server error', r'too many requests', r'just a moment',
+    r'this (page|content) is (no longer|not) available']]
+_ERROR_WORDS = [re.compile(_pattern, re.IGNORECASE) for _pattern in [
+    r'\b404\b', r'\bnot found\b', r'\bforbidden\b', r'(subscribe|sign in|log in) to (continue|read)', r'has been (removed|deleted)']]
+_BOILERPLATE_PATTERNS = [re.compile(_pattern, re.IGNORECASE) for _pattern in [
+    r'\bcookies?\b', r'privacy policy', r'terms (of (service|use)|and conditions)', r'\bsign (in|up)\b', r'\blog ?in\b', r'\bsubscribe\b',
+    r'\bnewsletter\b', r'skip to (main )?content', r'all rights reserved', r'\bcopyright\b', r'\badvertisement\b', r'\bmenu\b']]
+_ENGLISH_WORDS = set('''the of and to a in is that it for was on are as with by be this at from or have an which not but his they were has had their
+its can one all been more also there when who will would other what about into than some these only may such after most many first
+over new where between out up time so we you he she them then if no do does any each very used like'''.split())
+
+class _PageClassifier():
+  def __init__(
+      self,
+      _min_words: int = 25,
+      _accept_words: int = 150,
+      _error_page_words: int = 300,
+      _max_boilerplate: float = 2.0,
+      _min_english: float = 0.15):
+    '''
+    Args:
+     - _min_words (INT): Webpages with fewer words are rejected.
+     - _accept_words (INT): Webpages need at least this many words to be accepted without the LLM.
+     - _error_page_words (INT): Webpages with an error phrase (not only an error word) in their first 50 words, and fewer words than this, are rejected. Longer webpages are often articles that mention an error (e.g. "What is a 404 error?").
+     - _max_boilerplate (FLOAT): Webpages with more boilerplate phrases than this per 100 words are not accepted without the LLM.
+     - _min_english (FLOAT): The fraction of words that must be common English words for a webpage to be accepted without the LLM. English prose is usually above 0.3.
+    '''
+    self._min_words = _min_words
+    self._accept_words = _accept_words
+    self._error_page_words = _error_page_words
+    self._max_boilerplate = _max_boilerplate
+    self._min_english = _min_english
+    self._lock = threading.Lock()
+    self._counts = {'accept': 0, 'reject': 0, 'ambiguous': 0}
+    self._llm_calls_saved = 0
+  
+  def _classify(
+      self,
+      _webpage: str):
+    '''
+    Returns:
+     - _verdict (STR): 'accept', 'reject' or 'ambiguous'.
+     - _reason (STR): Why, e.g. 'error page'.
+    '''
+    _verdict, _reason = self._verdict(_webpage)
+    with self._lock:
+      self._counts[_verdict] += 1
+      # Webpages that are too short were never checked by the LLM.
+      if _verdict != 'ambiguous' and _reason != 'too short':
+        self._llm_calls_saved += 2
+    return _verdict, _reason
+  
+  def _verdict(
+      self,
+      _webpage: str):
+    _words = _webpage.split()
+    if len(_words) < self._min_words:
+      return 'reject', 'too short'
+    _start = ' '.join(_words[:50])
+    _errors_at_start = sum([1 for _pattern in _ERROR_PATTERNS if _pattern.search(_start) is not None])
+    if _errors_at_start > 0 and len(_words) < self._error_page_words:
+      return 'reject', 'error page'
+    _errors_at_start += sum([1 for _pattern in _ERROR_WORDS if _pattern.search(_start) is not None])
+    _letters = [_character for _character in _webpage if _character.isalpha()]
+    if len(_letters) > 0 and sum([1 for _character in _letters if ord(_character) > 0x24F]) / len(_letters) > 0.5:
+      return 'reject', 'not english'
+    
+    _lower_words = [_word.strip('.,;:!?"\'()[]').lower() for _word in _words]
+    _english = sum([1 for _word in _lower_words if _word in _ENGLISH_WORDS]) / len(_words)
+    _boilerplate = 100 * sum([len(_pattern.findall(_webpage)) for _pattern in _BOILERPLATE_PATTERNS]) / len(_words)
+    _errors = sum([1 for _pattern in _ERROR_PATTERNS + _ERROR_WORDS if _pattern.search(_webpage) is not None])
+    if _errors_at_start > 0 or _errors > 1:
+      return 'ambiguous', 'error phrases'
+    if len(_words) < self._accept_words:
+      return 'ambiguous', 'short'
+    if _boilerplate > self._max_boilerplate:
+      return 'ambiguous', 'boilerplate'
+    if _english < self._min_english:
+      return 'ambiguous', 'little english'
+    return 'accept', 'readable'
+  
+  def _stats(self) -> dict:
+    '''
+    Returns the number of webpages of each kind, and the number of LLM calls saved (the download check is two calls).
+    '''
+    with self._lock:
+      _stats = dict(self._counts)
+      _stats['llm_calls_saved'] = self._llm_calls_saved
+      return _stats
+
+# The classifier is shared by the whole process.
+_page_classifier = _PageClassifier()
\ No newline at end of file
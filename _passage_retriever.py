@@ -0,0 +1,145 @@
+import math
+import re
+import threading
+
+'''
+_PassageRetriever picks the passages of a webpage that are relevant to the query, so the LLM only reads those.
+
+The whole webpage used to be given to the LLM for reading comprehension, and long webpages (e.g. Wikipedia articles and PDFs) cost tens of thousands of prompt tokens.
+ - Passages: The webpage is split into passages of whole sentences, of about _passage_words words each.
+ - Ranking: An inverted index ({term: {passage: count}}) is built over the passages, and each passage is scored against the query with BM25. Only the passages that contain a query term are scored.
+ - Budget: The best passages are kept, up to _top_k passages and _token_budget tokens, and are given to the LLM in the order they appear on the webpage.
+Webpages that already fit in the budget are given to the LLM whole.
+Tokens are estimated as 4 characters per token (as _API does when together.ai does not return the usage). The tokens saved are counted (see "_stats").
+'''
+
+_STOP_WORDS = set('''a an and are as at be by for from has have how in is it its of on or that the this to was were what when where which who why will with
+does did do can could would should i you he she they we me my your about into than then there their them these those'''.split())
+
+def _terms(
+    _text: str) -> list:
+  return [_term for _term in re.findall(r'\w+', _text.lower()) if _term not in _STOP_WORDS]
+
+def _tokens(
+    _text: str) -> int:
+  return len(_text) // 4 + 1
+
+class _PassageRetriever():
+  def __init__(
+      self,
+      _passage_words: int = 120,
+      _top_k: int = 6,
+      _token_budget: int = 1500,
+      _k1: float = 1.5,
+      _b: float = 0.75):
+    '''
+    Args:
+     - _passage_words (INT): The number of words in each passage (a passage ends at the end of a sentence).
+     - _top_k (INT): The largest number of passages given to the LLM.
+     - _token_budget (INT): The largest number of tokens given to the LLM. Webpages with fewer tokens are not split.
+     - _k1 (FLOAT), _b (FLOAT): The BM25 parameters. _k1 is how quickly repeating a term stops counting, and _b is how much long passages are penalized.
+    '''
+    self._passage_words = _passage_words
+    self._top_k = _top_k
+    self._token_budget = _token_budget
+    self._k1 = _k1
+    self._b = _b
+    self._lock = threading.Lock()
+    self._pages = 0
+    self._page_tokens = 0
+    self._retrieved_tokens = 0
+  
+  def _retrieve(
+      self,
+      _query: str,
+      _webpage: str):
+    '''
+    Returns the passages of the webpage that best answer the query.
+    
+    Returns:
+     - _context (STR): The passages, in the order they appear on the webpage, separated by " ... ". The whole webpage if it fits in the budget.
+     - _page_tokens (INT): The estimated tokens of the whole webpage.
+     - _context_tokens (INT): The estimated tokens of _context.
+    '''
+    _page_tokens = _tokens(_webpage)
+    if _page_tokens <= self._token_budget:
+      _context = _webpage
+    else:
+      _passages = self._split(_webpage)
+      _scores = self._bm25(_terms(_query), [_terms(_passage) for _passage in _passages])
+      _ranked = sorted(range(len(_passages)), key = lambda _number: -_scores[_number])
+      _chosen, _context_tokens = [], 0
+      for _number in _ranked:
+        if len(_chosen) == self._top_k:
+          break
+        if _scores[_number] <= 0.0 and len(_chosen) > 0:
+          break
+        if _context_tokens + _tokens(_passages[_number]) > self._token_budget and len(_chosen) > 0:
+          continue
+        _chosen.append(_number)
+        _context_tokens += _tokens(_passages[_number])
+      _context = ' ... '.join([_passages[_number] for _number in sorted(_chosen)])
+    _context_tokens = _tokens(_context)
+    with self._lock:
+      self._pages += 1
+      self._page_tokens += _page_tokens
+      self._retrieved_tokens += _context_tokens
+    return _context, _page_tokens, _context_tokens
+  
+  def _split(
+      self,
+      _webpage: str) -> list:
+    '''
+    Splits the webpage into passages of whole sentences. A sentence that is longer than a passage is split by words.
+    '''
+    _passages, _passage = [], []
+    for _sentence in re.split(r'(?<=[.!?])\s+', _webpage):
+      _words = _sentence.split()
+      while len(_words) > self._passage_words:
+        _passages.append(' '.join(_words[:self._passage_words]))
+        _words = _words[self._passage_words:]
+      _passage += _words
+      if len(_passage) >= self._passage_words:
+        _passages.append(' '.join(_passage))
+        _passage = []
+    if len(_passage) > 0:
+      _passages.append(' '.join(_passage))
+    return _passages
+  
+  def _bm25(
+      self,
+      _query_terms: list,
+      _passage_terms: list) -> list:
+    '''
+    Scores each passage against the query with BM25, using an inverted index of the passages.
+    '''
+    _index = {}
+    for _number, _terms_of_passage in enumerate(_passage_terms):
+      for _term in _terms_of_passage:
+        _postings = _index.setdefault(_term, {})
+        _postings[_number] = _postings.get(_number, 0) + 1
+    _lengths = [len(_terms_of_passage) for _terms_of_passage in _passage_terms]
+    _average_length = max(1.0, sum(_lengths) / max(1, len(_lengths)))
+    _scores = [0.0] * len(_passage_terms)
+    for _term in set(_query_terms):
+      _postings = _index.get(_term)
+      if _postings is None:
+        continue
+      _idf = math.log(1.0 + (len(_passage_terms) - len(_postings) + 0.5) / (len(_postings) + 0.5))
+      for _number, _count in _postings.items():
+        _norm = self._k1 * (1.0 - self._b + self._b * _lengths[_number] / _average_length)
+        _scores[_number] += _idf * _count * (self._k1 + 1.0) / (_count + _norm)
+    return _scores
+  
+  def _stats(self) -> dict:
+    '''
+    Returns the number of webpages, and their estimated prompt tokens before and after retrieval.
+    '''
+    with self._lock:
+      return {'pages': self._pages,
+              'page_tokens': self._page_tokens,
+              'retrieved_tokens': self._retrieved_tokens,
+              'reduction': round(1.0 - self._retrieved_tokens / self._page_tokens, 4) if self._page_tokens > 0 else 0.0}
+
+# The retriever is shared by the whole process.
+_passage_retriever = _PassageRetriever()
\ No newline at end of file
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import threading
+import time
+
+from _llama_session import _LlamaSession
+
+'''
+_PrefixCache keeps the KV cache of the fixed system prompts of the sub-agents (the calculator's breakdown, Coder and Refiner, and _Query's download check, reading comprehension and summary).
+
+Each sub-agent prompt starts with the same long system prompt, and only the question (and context) after it changes.
+The system prompt is kept as a named prefix: the prefix is everything up to (and including) the first user header, "<|start_header_id|>user<|end_header_id|>".
+The first time a prefix is used, it is evaluated and its KV cache is kept (Llama_CPP's "save_state"). Every later call restores the KV cache and only evaluates the question after it.
+If a snapshot folder is set, the KV cache of each prefix is also saved to disk (see _LlamaSession._load_or_save_snapshot), so a new process does not need to evaluate it again.
+Each KV cache is a full copy of the model's state (tens to hundreds of MB for an 8B model), so only the most recently used are kept in memory, up to _max_bytes in total. The others are loaded from their snapshot on disk.
+
+A prefix is used in one of four ways, which are counted (see "_stats"):
+ - 'warm': The prefix is already in the KV cache (e.g. the Refiner after the Refiner), so nothing is restored.
+ - 'memory': The KV cache of the prefix is restored from memory.
+ - 'disk': The KV cache of the prefix is loaded from a snapshot.
+ - 'miss': The prefix is evaluated.
+Only used with Llama_CPP. together.ai is sent the whole prompt.
+'''
+
+_PREFIX_END = '<|start_header_id|>user<|end_header_id|>'
+
+def _state_bytes(
+    _state) -> int:
+  '''
+  The size of a Llama_CPP state (from "save_state"): the KV cache, and the tokens and logits that are copied with it.
+  '''
+  _bytes = getattr(_state, 'llama_state_size', 0)
+  for _array in [getattr(_state, 'input_ids', None), getattr(_state, 'scores', None)]:
+    _bytes += getattr(_array, 'nbytes', 0)
+  return _bytes
+
+class _PrefixCache():
+  def __init__(
+      self,
+      _snapshot_folder: str = None,
+      _max_prefixes: int = 4,
+      _max_bytes: int = 256 * 1024 * 1024):
+    '''
+    Args:
+     - _snapshot_folder (STR): The folder that the KV cache of each prefix is saved in. Defaults to None (the KV caches are only kept in memory).
+     - _max_prefixes (INT): The number of KV caches kept in memory. The least recently used is removed first. Defaults to 4.
+     - _max_bytes (INT): The total size of the KV caches kept in memory. A KV cache that is larger than this on its own is never kept in memory. Defaults to 256 MB.
+    '''
+    self._snapshot_folder = _snapshot_folder
+    self._max_prefixes = _max_prefixes
+    self._max_bytes = _max_bytes
+    self._bytes = 0
+    # Each state is {key: (_prefix_tokens, _state, _bytes)}, with the most recently used last.
+    self._states = OrderedDict()
+    self._sessions = {}
+    self._lock = threading.Lock()
+    self._counts = {'warm': 0, 'memory': 0, 'disk': 0, 'miss': 0}
+    self._restore_time = 0.0
+  
+  def _session(
+      self,
+      _llm,
+      _name: str,
+      _prompt_input: str) -> _LlamaSession:
+    '''
+    Restores the KV cache of the prompt's prefix into _llm, and returns a session over _llm that only evaluates the rest of the prompt.
+    The model's lock must be held until the returned session has finished generating.
+    
+    Args:
+     - _llm: The language model, from Llama_CPP.
+     - _name (STR): The name of the prefix (e.g. 'calculator_coder').
+     - _prompt_input (STR): The whole prompt, which starts with the prefix.
+    
+    Returns:
+     - _session (_LlamaSession): Give this to "_prompt_llama_cpp" as _session.
+    '''
+    _stt = time.time()
+    with self._lock:
+      if id(_llm) not in self._sessions:
+        self._sessions[id(_llm)] = _LlamaSession(_llm = _llm)
+      _session = self._sessions[id(_llm)]
+    if _PREFIX_END not in _prompt_input:
+      return _session
+    _prefix = _prompt_input[:_prompt_input.find(_PREFIX_END) + len(_PREFIX_END)]
+    _prefix_tokens = list(_session._tokenize(_prefix))
+    _key = (id(_llm), _name)
+    
+    if list(_llm._input_ids[:len(_prefix_tokens)]) == _prefix_tokens:
+      _kind = 'warm'
+    else:
+      with self._lock:
+        _entry = self._states.get(_key)
+        if _entry is not None:
+          self._states.move_to_end(_key)
+      if _entry is not None and _entry[0] == _prefix_tokens:
+        _llm.load_state(_entry[1])
+        _kind = 'memory'
+      else:
+        if self._snapshot_folder is not None:
+          _loaded, _ = _session._load_or_save_snapshot(_snapshot_folder = self._snapshot_folder, _model_path = _llm.model_path, _prompt_input = _prefix)
+          _kind = 'disk' if _loaded else 'miss'
+        else:
+          _session._prefill(_prefix)
+          _kind = 'miss'
+        _state = _llm.save_state()
+        with self._lock:
+          if _key in self._states:
+            self._bytes -= self._states.pop(_key)[2]
+          self._states[_key] = (_prefix_tokens, _state, _state_bytes(_state))
+          self._bytes += self._states[_key][2]
+          while len(self._states) > 0 and (len(self._states) > self._max_prefixes or self._bytes > self._max_bytes):
+            self._bytes -= self._states.popitem(last = False)[1][2]
+    with self._lock:
+      self._counts[_kind] += 1
+      self._restore_time += time.time() - _stt
+    return _session
+  
+  def _stats(self) -> dict:
+    '''
+    Returns the number of times each prefix was 'warm', restored from 'memory' or 'disk', or a 'miss', and the time spent restoring prefixes.
+    '''
+    with self._lock:
+      _stats = dict(self._counts)
+      _stats['hits'] = _stats['warm'] + _stats['memory'] + _stats['disk']
+      _stats['restore_time'] = round(self._restore_time, 4)
+      _stats['memory_prefixes'] = len(self._states)
+      _stats['memory_bytes'] = self._bytes
+      return _stats
+
+# The prefix cache is shared by the whole process, as _Query and the calculator share one context (see _model_registry.py).
+_prefix_cache = _PrefixCache()
\ No newline at end of file
@@ -1,12 +1,12 @@
 import os
 from bs4 import BeautifulSoup
+import concurrent.futures
 from duckduckgo_search import DDGS
 import itertools
 import json
-from llama_cpp import Llama
-import lxml
-import requests
+import re
 import io
+import threading
 import time
 from trafilatura import fetch_url, extract
 import wikipedia
@@ -14,6 +14,13 @@ import wikipedia
 from termcolor import colored
 os.system('color')
 
+from _http_client import _http_client
+from _model_registry import _model_registry
+from _page_cache import _page_cache
+from _page_classifier import _page_classifier
+from _passage_retriever import _passage_retriever
+from _prefix_cache import _prefix_cache
+from _serp_parser import _parse_answer_box, _parse_search_results
 from _together_api import _API
 from _util import _prompt_llama_cpp
 
@@ -27,32 +34,84 @@ _Query follows a two-step process:
 This will return a str as context for Jay
 '''
 
+# The labels of the TRUE/FALSE checks, which are classified from the logits of a single token (see "_classify").
+_TRUE_FALSE_LABELS = {'TRUE': ['TRUE', 'True', ' TRUE'], 'FALSE': ['FALSE', 'False', ' FALSE']}
+
+class _FetchDeadline():
+  '''
+  The time a query stops waiting for its webpages to download.
+  The deadline starts when the query's first webpage is evaluated on the answer pool, not when the query is submitted, so the time a query spends queued behind another query's webpages is not counted.
+  '''
+  def __init__(
+      self,
+      _seconds: float):
+    self._seconds = _seconds
+    self._deadline = None
+    self._lock = threading.Lock()
+  
+  def _remaining(self) -> float:
+    with self._lock:
+      if self._deadline is None:
+        self._deadline = time.time() + self._seconds
+      return max(0.0, self._deadline - time.time())
+
 class _Query():
   def __init__(
       self,
       _print_function,
       _generation_model: str = 'together.ai',
       _generation_model_path: str = 'meta-llama/Meta-Llama-3.1-8b-Instruct-Turbo',
-      _together_api_key: str = ''):
+      _together_api_key: str = '',
+      _fetch_workers: int = 5,
+      _fetch_deadline: float = 20.0,
+      _answer_workers: int = 1):
+    '''
+    Args:
+     - _fetch_workers (INT): The number of webpages that are downloaded at the same time.
+     - _fetch_deadline (FLOAT): The number of seconds a query waits for its webpages to download, from when the LLM starts reading the query's webpages. Webpages that have not downloaded by then are skipped.
+     - _answer_workers (INT): The number of webpages the LLM reads at the same time. A local model can only read one at a time (it is locked), so more than 1 is only useful with together.ai.
+    '''
     self._print_function = _print_function
+    self._fetch_deadline = _fetch_deadline
+    # The webpages of a query are downloaded at the same time, rather than one after another (see "_fetch_pages").
+    self._fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers = _fetch_workers)
+    self._answer_executor = concurrent.futures.ThreadPoolExecutor(max_workers = _answer_workers)
+    self._stage_lock = threading.Lock()
     self._generation_model = _generation_model
     self._generation_model_path = _generation_model_path
     
+    # Every source of every call gets its own reference number. Calls can run at the same time (e.g. a batch of searches), so the numbers are reserved under a lock (see "_number_references").
     self._reference_number = 0
+    self._reference_lock = threading.Lock()
     
     if self._generation_model == 'together.ai':
       self._model = _API(_api_key = _together_api_key, _model_name = self._generation_model_path)
     elif self._generation_model == 'llama-cpp-python':
-      _llm = Llama(self._generation_model_path, n_ctx = 32768, n_gpu_layers = 0, verbose = False)
+      # The model is shared with the calculator (see _model_registry.py), so it is locked while it is used.
+      _loaded_model = _model_registry._get(_model_path = self._generation_model_path, _consumer = '_Query', _context_name = 'tools', _n_ctx = 32768)
       class Model():
-        def __init__(self, _llm):
-          self._llm = _llm
+        def __init__(self, _loaded_model):
+          self._llm = _loaded_model._llm
+          self._lock = _loaded_model._lock
         
-        def __call__(self, inputs, _stop, _max_tokens):
+        def __call__(self, inputs, _stop, _max_tokens, _prefix_name = None):
           _stt = time.time()
-          _output = self._llm(inputs, stop = _stop, max_tokens = _max_tokens, echo = False)
+          with self._lock:
+            # The fixed system prompt of each check is restored from the prefix cache, so only the webpage and question are evaluated (see _prefix_cache.py).
+            if _prefix_name is not None:
+              _session = _prefix_cache._session(_llm = self._llm, _name = _prefix_name, _prompt_input = inputs)
+              _output, _pt, _ct, _tt = _session._generate(_prompt_input = inputs, _stop_tokens = _stop, _max_tokens = _max_tokens)
+              return _output, _pt, _ct, _tt, time.time() - _stt
+            _output = self._llm(inputs, stop = _stop, max_tokens = _max_tokens, echo = False)
           return _output['choices'][0]['text'], _output['usage']['prompt_tokens'], _output['usage']['completion_tokens'], _output['usage']['total_tokens'], time.time() - _stt
-      self._model = Model(_llm = _llm)
+        
+        def _classify(self, inputs, _labels, _prefix_name = None):
+          _stt = time.time()
+          with self._lock:
+            _session = _prefix_cache._session(_llm = self._llm, _name = _prefix_name, _prompt_input = inputs)
+            _label, _confidence, _pt = _session._classify(_prompt_input = inputs, _labels = _labels)
+          return _label, _confidence, _pt, time.time() - _stt
+      self._model = Model(_loaded_model = _loaded_model)
     
   def call(
       self,
@@ -61,7 +120,9 @@ class _Query():
       _no_of_downloaded_websites: int = 5,
       _no_of_sources = 2,
       _search_engine: str = 'google',
-      _use_answer_box: bool = True) -> str:
+      _use_answer_box: bool = True,
+      _cancel_event = None,
+      _number_references: bool = True) -> str:
     '''
     Given a natural language query, searches the internet and returns an STR answer.
     The information from _query will contain:
@@ -73,6 +134,8 @@ class _Query():
      - _no_of_downloaded_websites (INT): The number of websites to be downloaded.
      - _search_engine (STR): The seach engine to use to get relevant URLs. As of 17/7/2024, ['duckduckgo', 'google'] are available.
      - _use_answer_box (BOOL): Whether to attempt to use the google answer box before a search engine is used.
+     - _cancel_event (threading.Event): If the event is set, the search stops before the next webpage is read. Defaults to None.
+     - _number_references (BOOL): Whether the references are numbered. If False, each reference is left as "REFERENCE: <>", to be numbered later by "_number_references" (e.g. by the answer cache, when the answer is used). Defaults to True.
     
     Returns:
      - _final_output (STR): Context that contains the answer.
@@ -135,29 +198,38 @@ class _Query():
     
     _extracted_answers = []
     _references = {}
-    for _index in range(len(_urls) + 1):
-      if _index == 0:
-        _download_check = False
-        if len(_downloaded_files_and_urls) > 0 and _use_answer_box:
-          _url = _downloaded_files_and_urls[0][1]
-          _webpage = _downloaded_files_and_urls[0][0]
-          _title = _answer_box_title
-          _download_check = True
-          if len(_webpage.split()) < 25:
-            _download_check = False
-      
-      else:
-        _url = _urls[_index - 1]
-        _title = _titles[_index - 1]
-        _webpage, _download_check = self._download_webpage(_url = _url, _title = _title)
+    # The webpages go through a pipeline of three stages, which overlap:
+    # (a) Fetch: Every webpage starts downloading now, on the fetch pool.
+    # (b) Filter: Each downloaded webpage is classified cheaply (see "_filter_page"), so the LLM never reads a webpage that is obviously useless, and only checks the download of webpages that are ambiguous.
+    # (c) Answer: The LLM reads the webpages that pass, on the answer pool, in the order of the search results. While the LLM reads one webpage, the next ones are still downloading.
+    # Once there are enough sources, every download and answer that is still waiting is cancelled.
+    _stage_times = {'fetch': 0.0, 'fetch_wait': 0.0, 'filter': 0.0, 'answer': 0.0}
+    _stop_event = threading.Event()
+    _page_futures = self._fetch_pages(_urls = _urls, _titles = _titles, _stage_times = _stage_times)
+    _pages = [[_url, _title, _page_future] for _url, _title, _page_future in zip(_urls, _titles, _page_futures)]
+    if len(_downloaded_files_and_urls) > 0 and _use_answer_box:
+      # The Google Answer Box has already been downloaded, and is read first.
+      _answer_box_future = concurrent.futures.Future()
+      _answer_box_future.set_result((_downloaded_files_and_urls[0][0], True))
+      _pages = [[_downloaded_files_and_urls[0][1], _answer_box_title, _answer_box_future]] + _pages
+    _deadline = _FetchDeadline(self._fetch_deadline)
+    _answer_futures = [self._answer_executor.submit(self._evaluate_page, _query = _query, _page_future = _page_future, _url = _url, _title = _title, _deadline = _deadline, _stop_event = _stop_event, _stage_times = _stage_times) for _url, _title, _page_future in _pages]
+    for (_url, _title, _), _answer_future in zip(_pages, _answer_futures):
+      while not _answer_future.done() and not (_cancel_event is not None and _cancel_event.is_set()):
+        concurrent.futures.wait([_answer_future], timeout = 0.25)
+      if _cancel_event is not None and _cancel_event.is_set():
+        self._stop_pipeline(_stop_event = _stop_event, _futures = _page_futures + _answer_futures)
+        self._print_function('|- _q.call cancelled. Time: {:.4f}'.format(time.time() - _start_time), to_print = 0.0)
+        return 'The search was cancelled.'
+      _webpage, _download_check, _answer = _answer_future.result()
       if _download_check:
         self._print_function(f'|- URL: {_url}', to_print = 1.0)
         self._print_function(f'|- Word Count: {len(_webpage.split())}', to_print = 1.0)
         _abstract = _webpage[:250].replace('\n', ' ').replace('  ', ' ')
         self._print_function(f'|- Abstract: {_abstract} ...', to_print = 1.0)
-        _answer_output, _answer_output_check, _summary_answer_output, _txt_name = self._generate_answer(_query = _query, _webpage = _webpage, _title = _title, _prepare_sentence_references = False)
+        _answer_output, _answer_output_check, _summary_answer_output, _txt_name = _answer
         if _answer_output_check:
-          _extracted_answers.append(f'[{_answer_output}]. REFERENCE: <{len(_references) + 1 + self._reference_number}>')
+          _extracted_answers.append(f'[{_answer_output}]. REFERENCE: <>')
           _references[len(_references) + 1] = _url
           self._print_function(f'|- <{len(_references)}> Title: {_title}', to_print = 2.0)
           if type(_txt_name) is not bool:
@@ -165,50 +237,200 @@ class _Query():
           self._print_function('====================', to_print = 1.0)
           
           if len(_references) == _no_of_sources:
-            self._reference_number += len(_references)
+            self._stop_pipeline(_stop_event = _stop_event, _futures = _page_futures + _answer_futures)
+            self._print_stage_times(_stage_times)
+            self._print_function(f'|- HTTP Connections: {_http_client._stats()}, Page Cache: {_page_cache._stats()}, Page Classifier: {_page_classifier._stats()}, Passage Retrieval: {_passage_retriever._stats()}', to_print = 0.0)
             self._print_function('|- _q.call completed. Time: {:.4f}'.format(time.time() - _start_time), to_print = 1.0)
             _extracted_answers = str(_extracted_answers)
-            return _extracted_answers
+            return self._number_references(_extracted_answers) if _number_references else _extracted_answers
     
+    self._print_stage_times(_stage_times)
+    self._print_function(f'|- HTTP Connections: {_http_client._stats()}, Page Cache: {_page_cache._stats()}, Page Classifier: {_page_classifier._stats()}, Passage Retrieval: {_passage_retriever._stats()}', to_print = 0.0)
     self._print_function('|- _q.call completed. Time: {:.4f}'.format(time.time() - _start_time), to_print = 1.0)
     if len(_extracted_answers) == 0:
       return 'No information was found online.'
     else:
       _extracted_answers = str(_extracted_answers)
-      self._reference_number += len(_references)
-      return _extracted_answers
+      return self._number_references(_extracted_answers) if _number_references else _extracted_answers
+  
+  def _number_references(
+      self,
+      _answer: str) -> str:
+    '''
+    Numbers every "REFERENCE: <>" in the answer, in order. The numbers are reserved under a lock, so answers that are numbered at the same time never share a number.
+    '''
+    _count = _answer.count('REFERENCE: <>')
+    with self._reference_lock:
+      _first = self._reference_number + 1
+      self._reference_number += _count
+    _numbers = iter(range(_first, _first + _count))
+    return re.sub(r'REFERENCE: <>', lambda _: f'REFERENCE: <{next(_numbers)}>', _answer)
+  
+  def _fetch_pages(
+      self,
+      _urls: list,
+      _titles: list,
+      _stage_times: dict) -> list:
+    '''
+    Stage (a) of the pipeline. Starts downloading every webpage on the fetch pool.
+    
+    Returns:
+     - _page_futures (LIST): A future for each URL, in the same order, whose result is (_webpage, _download_check).
+    '''
+    def _timed_download(_url, _title):
+      _stt = time.time()
+      try:
+        return self._download_webpage(_url = _url, _title = _title)
+      finally:
+        self._add_stage_time(_stage_times, 'fetch', time.time() - _stt)
+    return [self._fetch_executor.submit(_timed_download, _url, _title) for _url, _title in zip(_urls, _titles)]
+  
+  def _fetched_page(
+      self,
+      _page_future,
+      _url: str,
+      _deadline: _FetchDeadline):
+    '''
+    Waits for a webpage to download, until the query's deadline. A webpage that is not downloaded by the deadline (or fails to download) is skipped.
+    '''
+    try:
+      return _page_future.result(timeout = _deadline._remaining())
+    except concurrent.futures.TimeoutError:
+      self._print_function(f'|- Download Timed Out: {_url}', to_print = 0.0)
+      return '', False
+    except Exception:
+      return '', False
+  
+  def _filter_page(
+      self,
+      _webpage: str,
+      _url: str) -> str:
+    '''
+    Stage (b) of the pipeline. A cheap check of whether a webpage is worth the LLM reading it (see _page_classifier.py).
+    
+    Returns:
+     - _verdict (STR): 'accept' (the LLM reads it, without checking the download), 'reject' (skipped) or 'ambiguous' (the LLM checks the download first).
+    '''
+    _verdict, _reason = _page_classifier._classify(_webpage)
+    self._print_function(f'|- Page Classifier: {_verdict} ({_reason}): {_url}', to_print = 0.0)
+    return _verdict
+  
+  def _evaluate_page(
+      self,
+      _query: str,
+      _page_future,
+      _url: str,
+      _title: str,
+      _deadline: _FetchDeadline,
+      _stop_event,
+      _stage_times: dict):
+    '''
+    Stages (b) and (c) of the pipeline for a single webpage, which are run on the answer pool.
+    The webpage is skipped if the query has stopped (_stop_event), e.g. because there are already enough sources.
+    
+    Returns:
+     - _webpage (STR): The downloaded webpage.
+     - _download_check (BOOL): Whether the webpage downloaded, passed the filter and was read by the LLM.
+     - _answer: The result of "_generate_answer", or None if the webpage was not read.
+    '''
+    _stt = time.time()
+    _webpage, _download_check = self._fetched_page(_page_future = _page_future, _url = _url, _deadline = _deadline)
+    self._add_stage_time(_stage_times, 'fetch_wait', time.time() - _stt)
+    if not _download_check or _stop_event.is_set():
+      return _webpage, False, None
+    _stt = time.time()
+    _verdict = self._filter_page(_webpage, _url)
+    self._add_stage_time(_stage_times, 'filter', time.time() - _stt)
+    if _verdict == 'reject':
+      return _webpage, False, None
+    _stt = time.time()
+    _answer = self._generate_answer(_query = _query, _webpage = _webpage, _title = _title, _prepare_sentence_references = False, _cancel_event = _stop_event, _check_download = _verdict == 'ambiguous')
+    self._add_stage_time(_stage_times, 'answer', time.time() - _stt)
+    return _webpage, True, _answer
+  
+  def _stop_pipeline(
+      self,
+      _stop_event,
+      _futures: list):
+    '''
+    Stops the query's pipeline: downloads and answers that have not started are cancelled, and answers that have started stop before their next LLM call.
+    '''
+    _stop_event.set()
+    for _future in _futures:
+      _future.cancel()
+  
+  def _add_stage_time(
+      self,
+      _stage_times: dict,
+      _stage: str,
+      _time_taken: float):
+    with self._stage_lock:
+      _stage_times[_stage] += _time_taken
+  
+  def _print_stage_times(
+      self,
+      _stage_times: dict):
+    '''
+    Downloads and answers overlap, so the stages add up to more than the time of the query. "Waiting" is the time answers spent waiting for downloads.
+    '''
+    with self._stage_lock:
+      self._print_function('|- Stage Times: Fetch {:.4f} secs (Waiting {:.4f} secs), Filter {:.4f} secs, Answer {:.4f} secs'.format(_stage_times['fetch'], _stage_times['fetch_wait'], _stage_times['filter'], _stage_times['answer']), to_print = 1.0)
+  
+  def _classify(
+      self,
+      _prompt_input: str,
+      _name: str,
+      _prefix_name: str = None) -> str:
+    '''
+    Answers a TRUE/FALSE check with a single token, rather than generating text and searching it for "TRUE".
+    With Llama_CPP, the logits of "TRUE" and "FALSE" are compared after the prompt (see _LlamaSession._classify). With together.ai, a single token is generated with its logprob.
+    
+    Returns:
+     - _label (STR): 'TRUE' or 'FALSE'.
+    '''
+    _label, _confidence, _pt, _time_taken = self._model._classify(_prompt_input, _labels = _TRUE_FALSE_LABELS, _prefix_name = _prefix_name)
+    self._print_function(f'|- {_name}: {_label} ({_confidence:.2f}), {_time_taken:.4f} secs, P:{_pt}', to_print = 0.0)
+    return _label
   
   def _generate_answer(
       self,
       _query,
       _webpage,
       _title,
-      _prepare_sentence_references):
+      _prepare_sentence_references,
+      _cancel_event = None,
+      _check_download = True):
+    '''
+    The LLM reads the webpage and answers the query.
+    If _cancel_event is set, the answer stops before its next LLM call.
+    If _check_download is False (the webpage was accepted by _page_classifier), the LLM does not check whether the webpage downloaded successfully.
+    '''
     if len(_webpage.split()) < 25:
       return '', False, '', ''
     _context = _webpage.replace('\n', ' ').replace('  ', ' ')
     
-    _website_download_prompt = '''You are an LLM, and it is your job to read a downloaded website.
+    if _check_download:
+      _website_download_prompt = '''You are an LLM, and it is your job to read a downloaded website.
 If the downloaded website does not contain any useful information, then the download is a failure.
 You are looking for the following problems with the download:
 (1) An error, such as a 404 Error.
 (2) The website saying that Javascript needs to be enabled.
 If the website does contain useful information, then the download was successful.
 You will read the conversation, and then explain your reasoning behind your decision as to whether it is a download or not.'''
-    _website_download_prompt = f'''<|start_header_id|>system<|end_header_id|>
+      _website_download_prompt = f'''<|start_header_id|>system<|end_header_id|>
 
 \t{_website_download_prompt}<|eot_id|>\n<|start_header_id|>user<|end_header_id|>
 
 \t{_context} EXPLAIN YOUR REASONING AS TO IF THE WEBSITE HAS BEEN SUCCESSUFLLY DOWNLOADED.<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
 \t'''
-    _website_download_output, _website_download_pt, _website_download_ct, _website_download_tt, _website_download_time_taken = self._model(_website_download_prompt, _stop = ['<|eot_id|>'], _max_tokens = 1024)
-    self._print_function(f"|- Website Downloading Answer: {_website_download_time_taken} secs, P:{_website_download_pt} - Comp:{_website_download_ct} - Total:{_website_download_tt}", to_print = 1.0)
-    _website_download_prompt += _website_download_output + '<|eot_id|>\n<|start_header_id|>user<|end_header_id|>\n\n\tTherefore, if you had to summarize your answer as either "TRUE" (the download was successful) or "FALSE" (the download failed), what would you answer?<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'
-    _website_download_output, _, _, _, _ = self._model(_website_download_prompt, _stop = ['<|eot_id|>'], _max_tokens = 1024)
-    if 'TRUE' not in _website_download_output:
-      return '', False, '', ''
-    
+      _website_download_output, _website_download_pt, _website_download_ct, _website_download_tt, _website_download_time_taken = self._model(_website_download_prompt, _stop = ['<|eot_id|>'], _max_tokens = 1024, _prefix_name = 'query_download_check')
+      self._print_function(f"|- Website Downloading Answer: {_website_download_time_taken} secs, P:{_website_download_pt} - Comp:{_website_download_ct} - Total:{_website_download_tt}", to_print = 1.0)
+      _website_download_prompt += _website_download_output + '<|eot_id|>\n<|start_header_id|>user<|end_header_id|>\n\n\tTherefore, if you had to summarize your answer as either "TRUE" (the download was successful) or "FALSE" (the download failed), what would you answer?<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'
+      _website_download_label = self._classify(_website_download_prompt, _name = 'Download Check', _prefix_name = 'query_download_check')
+      if _website_download_label != 'TRUE':
+        return '', False, '', ''
+      
     _base_system_prompt = '''You are an LLM that performs reading comprehension. You are given context to read, and you must answer questions based on the context you are given. You will give as much detail in your answer as possible. You are going to answer this question by following these instructions:
 (1) You will prompt the reasoning, based on the extracted information, that you will use to inform your answer. Remember, you are capable of incredible reasoning abilities, and you will think out loud too get the right answer. Begin this prompt by saying "REASONING: ".
 (2) You will repeat keywords and phrases from the context that can help inform your answer. You can repeat as much information as you feel is wise. Begin this prompt by saying "KEYPHRASES: ".
@@ -216,15 +438,21 @@ You will read the conversation, and then explain your reasoning behind your deci
 If you feel there is no relevant information to answer the question, use the keyphrase "N\A".
 If you are given an open-ended question, give as much information as possible to answer the question from all perspectives.
 If you are given a closed-ended question, then give the answer and your supporting facts in as much detail as possible.'''
+    # Only the passages of the webpage that are relevant to the query are read (see _passage_retriever.py).
+    _reading_context, _page_tokens, _reading_tokens = _passage_retriever._retrieve(_query, _context)
+    if _reading_tokens < _page_tokens:
+      self._print_function(f'|- Passage Retrieval: ~{_reading_tokens} of ~{_page_tokens} prompt tokens ({100 * (1 - _reading_tokens / _page_tokens):.1f}% fewer)', to_print = 0.0)
     _base_prompt = f'''<|start_header_id|>system<|end_header_id|>
 
 \t{_base_system_prompt}<|eot_id|>\n<|start_header_id|>user<|end_header_id|>
 
-\t{_context} QUESTION: "{_query}"<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
+\t{_reading_context} QUESTION: "{_query}"<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
 \t'''
+    if _cancel_event is not None and _cancel_event.is_set():
+      return '', False, '', ''
     _generated_answers, _generated_answers_bool = [], []
-    _base_output, _base_pt, _base_ct, _base_tt, _base_time_taken = self._model(_base_prompt, _stop = ['<|eot_id|>'], _max_tokens = 1024)
+    _base_output, _base_pt, _base_ct, _base_tt, _base_time_taken = self._model(_base_prompt, _stop = ['<|eot_id|>'], _max_tokens = 1024, _prefix_name = 'query_reading_comprehension')
     self._print_function(f"|- Base Answer: {_base_time_taken} secs, P:{_base_pt} - Comp:{_base_ct} - Total:{_base_tt}", to_print = 1.0)
     
     _check_system_prompt = '''You are an LLM that is designed to ensure that assist in a reading comprehension task.
@@ -260,7 +488,7 @@ Sentence to Support: "{_sentence}"<|eot_id|>\n<|start_header_id|>assistant<|end_
 
 \tThe information in Context that best supports "{_sentence}" is 
 '''
-        _check_output, _check_pt, _check_ct, _check_tt, _check_time_taken = self._model(_check_prompt, _stop = ['<|eot_id|>'], _max_tokens = 256)
+        _check_output, _check_pt, _check_ct, _check_tt, _check_time_taken = self._model(_check_prompt, _stop = ['<|eot_id|>'], _max_tokens = 256, _prefix_name = 'query_sentence_check')
         self._print_function(f"|- Check Answer #{_no + 1}: {_base_time_taken} secs, P:{_base_pt} - Comp:{_base_ct} - Total:{_base_tt}", to_print = 0.0)
         _check_output_individuals = _check_output.replace('"\n', '').replace('- "', '').split('.')
         _sentences_in_paragraph = 0
@@ -293,11 +521,13 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
 
 \tQUESTION: "{_query}". Generated Response: "{_base_output}".'''
   
+    if _cancel_event is not None and _cancel_event.is_set():
+      return '', False, '', ''
     _summary_system_prompt += 'Has the question been properly answered using the context? Answer [TRUE] or [FALSE].<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'
-    _summary_check_output, _, _, _, _ = self._model(_summary_system_prompt, _stop = ['<|eot_id|>'], _max_tokens = 16)
+    _summary_check_output = self._classify(_summary_system_prompt, _name = 'Summary Check', _prefix_name = 'query_summary')
     if 'TRUE' in _summary_check_output:
       _summary_system_prompt += f'TRUE<|eot_id|>\n<|start_header_id|>user<|end_header_id|>\n\n\tBased on your returned context, answer the user\'s question {_query} in as few words as possible. If you cannot answer the question, return N\A.<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'
-      _summary_answer_output, _, _, _, _ = self._model(_summary_system_prompt, _stop = ['<|eot_id|>'], _max_tokens = 64)
+      _summary_answer_output, _, _, _, _ = self._model(_summary_system_prompt, _stop = ['<|eot_id|>'], _max_tokens = 64, _prefix_name = 'query_summary')
       if 'N\A' in _summary_answer_output or 'N/A' in _summary_answer_output:
         _summary_check_output = 'FALSE'
       else:
@@ -305,6 +535,8 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     else:
       _summary_answer_output = 'N\A'
       _summary_check_output = 'FALSE'
+    if self._generation_model == 'llama-cpp-python':
+      self._print_function(f'|- Prefix Cache: {_prefix_cache._stats()}', to_print = 0.0)
     if 'FALSE' in _summary_check_output:
       return _base_output, False, _summary_answer_output, _txt_name
     else:
@@ -314,6 +546,16 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
       self,
       _url: str,
       _title: str):
+    '''
+    Downloads the webpage and returns its cleaned text.
+    Webpages are cached on disk (see _page_cache.py). A fresh cached webpage is returned without downloading it, and a stale one is only downloaded again if it has changed.
+    '''
+    _cached_page = _page_cache._get(_url)
+    if _cached_page is not None and not _cached_page['stale']:
+      return _cached_page['text'], True
+    # The "ETag" and "Last-Modified" of the downloaded website, which are saved with the webpage.
+    _validators = {'etag': None, 'last_modified': None, 'revalidated': False}
+    
     def _download_wikipedia(_url, _title):
       _wikipedia_search_title = _title.replace(' - Wikipedia', '')
       _search_results = wikipedia.search(_wikipedia_search_title)
@@ -355,7 +597,7 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     def _download_pdf_online(_url, _title):
       try:
         from PyPDF2 import PdfReader
-        _response = requests.get(_url, timeout = 10.0)
+        _response = _http_client._get(_url, _timeout = 10.0)
         _on_fly_mem_obj = io.BytesIO(_response.content)
         _pdf_file = PdfReader(_on_fly_mem_obj)
         _pdf_text = '\n'.join(_pdf_file.pages[_].extract_text() for _ in range(len(_pdf_file.pages)))
@@ -371,7 +613,19 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     
     def _download_website(_url, _title):
       try:
-        _html = requests.get(_url, timeout = 10.0)
+        _html = _http_client._get(_url, _timeout = 10.0, _headers = _page_cache._validators(_cached_page))
+        _validators['etag'] = _html.headers.get('ETag')
+        _validators['last_modified'] = _html.headers.get('Last-Modified')
+        # The website has not changed since the webpage was cached.
+        # A 304 often does not send the "ETag" or "Last-Modified" again (Last-Modified is usually left out), so the cached ones are kept for the next time the webpage is stale.
+        if _html.status_code == 304 and _cached_page is not None:
+          _validators['revalidated'] = True
+          _validators['etag'] = _validators['etag'] or _cached_page.get('etag')
+          _validators['last_modified'] = _validators['last_modified'] or _cached_page.get('last_modified')
+          return _cached_page['text'], True
+        # Error pages (e.g. a 404) are rejected without being read.
+        if _html.status_code >= 400:
+          return '', False
         _soup = BeautifulSoup(_html.text, 'html.parser')
         for script in _soup(['script', 'style']):
           script.extract()
@@ -396,6 +650,8 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     else:
       _webpage, _download_check = _download_website(_url = _url, _title = _title)
     _webpage = ' '.join([_ for _ in _webpage.split() if len(_) < 20])
+    if _download_check:
+      _page_cache._put(_url, _webpage, _etag = _validators['etag'], _last_modified = _validators['last_modified'], _revalidated = _validators['revalidated'])
     return _webpage, _download_check
   
   def _download_search_engine(
@@ -419,19 +675,9 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     def _download_google(_query, _no_of_downloaded_websites, _safesearch = ''):
       # Step (1) Download URL metadata
       _params = {'q': _query}
-      _response = requests.get('https://www.google.com/search', params = _params)
-      _soup = BeautifulSoup(_response.text, 'html.parser')
-      _results = _soup.find_all()
-      # Step (2) Extract and clean URL and title information from metadata
-      _result_titles = []; _result_urls = []
-      for _result in _results:
-        _title = _result.find('h3')
-        _url = _result.find('a')
-        if _title is None or _url is None:
-          pass
-        else:
-          _result_titles.append(_result.find('h3').text)
-          _result_urls.append(_result.find('a')['href'])
+      _response = _http_client._get('https://www.google.com/search', _params = _params)
+      # Step (2) Extract and clean URL and title information from metadata (in a single pass over the page, see _serp_parser.py)
+      _result_titles, _result_urls = _parse_search_results(_response.text)
       _suitable_titles = []; _suitable_urls = []
       for _title, _url in zip(_result_titles, _result_urls):
         _url = _url.split('/url?q=')
@@ -474,260 +720,12 @@ Be aware, LLMs are not perfect, and sometimes will give detailed response that d
     Answer boxes that do not are commented out.
     
     The link will be found in the key "Primary Link".
+    Every answer box is read from a single parse of the page (see _serp_parser.py).
     '''
-    _headers = {'User-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.67 Safari/537.36'}
+    # The answer box is only returned to a browser, so the request is sent with a browser User-Agent.
     _params = {'q': _query}
-    _html = requests.get('https://www.google.com/search', headers = _headers, params = _params)
-    _soup = BeautifulSoup(_html.text, 'lxml')
-    
-    # _google_box_answers ["Type of Information": "Extracted Info"]
-    _google_box = {}
-    def _load_notable_text(_soup):
-      '''How many protons in Oxygen atom?'''
-      if _soup.select_one('.ILfuVd') != None:
-        _notable_answer = _soup.select_one('.ILfuVd').text
-        _google_box['Notable Text'] = _notable_answer
-    _load_notable_text(_soup = _soup)
-    
-    def _google_business_box(_soup):
-      '''state parliament nsw open hours'''
-      try:
-        _desc = _soup.select_one('.xDKLO')
-        _google_box['Business Information'] = _desc.text
-      except:
-        pass
-    _google_business_box(_soup = _soup)
-    
-    def _google_table(_soup):
-      try:
-        _desc = _soup.select_one('.Crs1tb')
-        _google_box['Table'] = _desc.text
-      except:
-        pass
-    _google_table(_soup = _soup)
-    
-    def _google_address_box(_soup):
-      try:
-        _desc = _soup.select_one('.sXLaOe')
-        _google_box['Address'] = _desc.text
-      except:
-        pass
-    _google_address_box(_soup = _soup)
-    
-    def _google_side_box(_soup):
-      try:
-        _desc = _soup.select_one('.kno-rdesc')
-        _desc_href = str(_desc).split('href="')[1].split('" ')[0]
-        _desc = _desc.text
-        _google_box['Side Box'] = _desc
-        _google_box['Side Box (href)'] = _desc_href
-        x = _soup.select('.rVusze')
-        for _ in x:
-          _key, _value = _.text.split(': ')
-          _google_box['Side Box {}'.format(_key)] = _value
-      except:
-        pass
-    _google_side_box(_soup = _soup)
-    
-    def _google_quaternary_answer(_soup):
-      try:
-        _title = _soup.select_one('.QpPSMb').text
-        _subtitle = _soup.select_one('.loJjTe').text
-        while _title[0] == ' ':
-          _title = _title[1:]
-        while _subtitle[0] == ' ':
-          _subtitle = _subtitle[1:]
-        _google_box['Quaternary Title'] = _title
-        _google_box['Quaternary Subtitle'] = _subtitle
-      except:
-        pass
-    _google_quaternary_answer(_soup = _soup)
-
-    def _google_tertiary_answer(_soup):
-      # _google_answer_box('How much is a large pizza at Papa John\'s')
-      try:
-        _title = _soup.select_one('.ifM9O .LC20lb').text
-        _link = _soup.select_one('.ifM9O .yuRUbf a')['href']
-        _displayed_link = _soup.select_one('.ifM9O .iUh30').text
-        _snippet = _soup.select_one('.ifM9O .iKJnec').text
-  
-        _google_box['Tertiary Title'] = _title
-        _google_box['Tertiary Link'] = _link
-        _google_box['Tertiary Displayed Link'] = _displayed_link
-        _google_box['Tertiary Snippet'] = _snippet
-  
-        for _table_key, _table_value, _table_value_price in zip(
-            _soup.select('.ztXv9~ tr+ tr td:nth-child(1)'),
-            _soup.select('td:nth-child(2)'),
-            _soup.select('td~ td+ td')):
-          _key = _table_key.text
-          _value = _table_value.text
-          _price = _table_value_price.text
-          _google_box['Tertiary Table Row'] = [_key, _value, _price]
-      except:
-        pass
-    _google_tertiary_answer(_soup = _soup)
-
-    def _google_secondary_answer(_soup):
-      '''dynasties of macedonia'''
-      try:
-        _title = _soup.select_one('.xpdopen .DKV0Md').text
-        _link = _soup.select_one('.xpdopen .yuRUbf a')['href']
-        _displayed_link = _soup.select_one('.xpdopen .iUh30').text
-        _google_box['Secondary Title'] = _title
-        _google_box['Secondary Link'] = _link
-        #_google_box['Secondary Displayed Link'] = _displayed_link
-  
-        if _soup.select_one('.xpdopen .co8aDb b') and _soup.select_one('.TrT0Xe') is not None:
-          _snippet = _soup.select_one('.xpdopen .co8aDb b').text
-          _bullet_points = '\n'.join([_bullet_point.text for _bullet_point in _soup.select('.TrT0Xe')])
-        elif _soup.select_one('.TrT0Xe') is not None:
-          _bullet_points = '\n'.join([_bullet_point.text for _bullet_point in _soup.select('.TrT0Xe')])
-          _snippet = None
-        else: 
-          _snippet = _soup.select_one('.xpdopen .iKJnec').text
-          _bullet_points = None
-      
-        if type(_snippet) is str:
-          _google_box['Secondary Snippet'] = _snippet
-        if type(_bullet_points) is str:
-          _google_box['Secondary Bullet Points'] = _bullet_points
-  
-        if _soup.select_one('#rso td:nth-child(1)') is None:
-          pass
-        else:
-         for _table_key, _table_value in zip(
-            _soup.select('#rso td:nth-child(1)'), 
-            _soup.select('#rso td+ td')):
-            _key = _table_key.text
-            _value = _table_value.text
-            _google_box['Secondary {}'.format(_key)] = _value
-      except:
-        pass
-    _google_secondary_answer(_soup = _soup)
-
-    def _google_primany_answer(_soup):
-      '''luke skywalker lightsaber color'''
-      try:
-        _link = _soup.select_one('.yuRUbf a')['href']
-        _google_box['Primary Link'] = _link
-        _answer = _soup.select_one('.IZ6rdc').text
-        _google_box['Primary Answer'] = _answer
-        _snippet = _soup.select_one('.hgKElc').text
-        _google_box['Primary Snippet'] = _snippet
-      except:
-        pass
-    _google_primany_answer(_soup = _soup)
-
-    def _google_dictionary_answer(_soup):
-      '''define slob'''
-      try:
-        _definition = 1
-        for _result in _soup.select('.VpH2eb.vmod'):
-          #_syllables = _result.select_one('.DgZBFd span').text
-          #_audio_link = f"https:{result.select_one('.brWULd audio source')['src']}"
-          #_phonetic_result.select_one('.S23sjd .LTKOO span').text
-          #_word_types = [_word_type.text for _word_type in _result.select('.vdBwhd .YrbPuc')]
-    
-          _definitions = [_definition.text for _definition in _result.select('.PZPZlf')]
-          _sentence_examples = [_definition.text for _definition in _result.select('.ubHt5c')]
-          _similar_words = [_similar_word.text for _similar_word in _result.select('.p9F8Cd span')]
-          _google_box['Definition {}'.format(_definition)] = _definitions
-          _definition += 1
-      except:
-        pass
-    _google_dictionary_answer(_soup = _soup)
-
-    def _google_currency_conversion_answer(_soup):
-      '''100 usd in aud'''
-      try:
-        _conversion = _soup.select_one('.SwHCTb').text
-        _google_box['Conversion Rate'] = _conversion
-        _conversion_currency = _soup.select_one('.MWvIVe').text
-        _google_box['Conversion Currency'] = _conversion_currency
-      except:
-        pass
-    _google_currency_conversion_answer(_soup  = _soup)
-
-    def _google_population_answer(_soup):
-      '''What is the population of India?'''
-      try:
-        _place = _soup.select_one('.GzssTd span').text; _google_box['Location'] = _place
-        _population_year = _soup.select_one('.KBXm4e').text.split(' ')
-        _population = _population_year[0]; _google_box['Population'] = _population
-        _year = _population_year[1].replace('(', '').replace(')', ''); _google_box['Year Captured'] = _year
-        _sources = [_source.text for _source in _soup.select('.kno-ftr span a')]; _google_box['Source of Info'] = _sources
-
-        #for other_city, other_population in zip(_soup.select('.AleqXe'), _soup.select('.kpd-lv')):
-        #  other_place_city = other_city.text.strip()
-        #  other_place_population = other_population.text
-      except:
-        pass
-    _google_population_answer(_soup = _soup)
-
-    def _google_stock_answer(_soup):
-      '''vas Stock'''
-      try:
-        _title = _soup.select_one('.oPhL2e').text.replace(u'\xa0', u'').split('>')[1]; _google_box['Stock Title'] = _title
-        _date_time = _soup.select_one('[jsname=ihIZgd]').text.replace(' ·', ''); _google_box['Stock Datetime'] = _date_time
-        _market_status = _soup.select_one('.TgMHGc span:nth-child(1)').text.strip().replace(':', ''); _google_box['Market Status'] = _market_status
-        _currency = _soup.select_one('.knFDje').text.strip(); _google_box['Currency'] = _currency
-        _current_price = _soup.select_one('.wT3VGc, .XcVN5d').text; _google_box['Current Price'] = _current_price
-        _price_change = _soup.select_one('.WlRRw > span:nth-child(1)').text; _google_box['Price Change'] = _price_change
-        _price_change_percent = _soup.select_one('.jBBUv span:nth-child(1)').text.replace('(', '').replace(')', ''); _google_box['Price Change Percent'] = _price_change_percent
-        _price_change_date = _soup.select_one('.jdUcZd span').text.strip().capitalize(); _google_box['Price Change Date'] = _price_change_date
-        _price_movement = 'Down' if '−' in _price_change else 'Up'; _google_box['Price Movement'] = _price_movement
-
-        for _stock_table_key, _stock_table_value in zip(_soup.select('.JgXcPd'), _soup.select('.iyjjgb')):
-          _stock_key = _stock_table_key.text
-          _stock_value = _stock_table_value.text
-          _google_box[_stock_key] = _stock_value
-      except:
-        pass
-    _google_stock_answer(_soup = _soup)
-
-    def _google_weather_answer(_soup):
-      '''What is the weather in Orange, NSW?'''
-      try:
-        _location = _soup.select_one('#wob_loc').text; _google_box['Weather Location'] = _location
-        _weather_condition = _soup.select_one('#wob_dc').text; _google_box['Weather Condition'] = _weather_condition
-        _temperature = _soup.select_one('#wob_tm').text; _google_box['Weather Temperature'] = _temperature
-        _precipitation = _soup.select_one('#wob_pp').text; _google_box['Weather Precipitation'] = _precipitation
-        _humidity = _soup.select_one('#wob_hm').text; _google_box['Weather Humidity'] = _humidity
-        _wind = _soup.select_one('#wob_ws').text; _google_box['Weather Wind'] = _wind
-        _current_time = _soup.select_one('#wob_dts').text; _google_box['Weather Current-Time'] = _current_time
-  
-        for _wind_speed_direction in _soup.select('.wob_noe .wob_hw'):
-          try:
-            _wind_speed = _wind_speed_direction.select_one('.wob_t').text; _google_box['Weather Wind Speed'] = _wind_speed
-            _wind_direction = ' '.join(_wind_speed_direction.select_one('.wob_t')['aria-label'].split(' ')[2:4]); _google_box['Weather Wind Direction'] = _wind_direction
-          except:
-            pass
-  
-        for _forecast in _soup.select('.wob_df'):
-          _day = _forecast.select_one('.Z1VzSb')['aria-label']
-          _weather = str(_forecast.select_one('.YQ4gaf')).split('img alt="')[1].split('" class=')[0]
-          if _forecast.select_one('.vk_gy .wob_t:nth-child(1)') is None:
-            _high_temp = _forecast.select_one('.gNCp2e .wob_t').text
-          else:
-            _high_temp = _forecast.select_one('.vk_gy .wob_t:nth-child(1)').text
-          _low_temp = _forecast.select_one('.QrNVmd .wob_t:nth-child(1)').text
-          _google_box['Weather Forecast {}'.format(_day)] = 'Weather: {}, High: {}, Low: {}'.format(_weather, _high_temp, _low_temp)
-      except:
-        pass
-    _google_weather_answer(_soup = _soup)
-    
-    def _google_calculator_answer(_soup):
-      '''32 * 3 / 3 + 12 * 332 - 1995'''
-      try:
-        _math_expression = _soup.select_one('.XH1CIc').text.strip().replace(' =', '')
-        _calc_answer = _soup.select_one('#cwos').text.strip()
-        _google_box['Mathematical Expression'] = _math_expression
-        _google_box['Calculated Answer'] = _calc_answer
-      except:
-        pass
-    _google_calculator_answer(_soup = _soup)
-    return _google_box
+    _html = _http_client._get('https://www.google.com/search', _params = _params, _browser = True)
+    return _parse_answer_box(_html.text)
     
 if __name__ == '__main__':
   def _print_function(string, to_print = 1.0):
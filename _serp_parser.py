@@ -0,0 +1,385 @@
+import re
+
+import lxml.etree
+import lxml.html
+
+'''
+_serp_parser reads Google's search results page (SERP): the links of the search results, and every answer box (e.g. the weather, a stock price or a definition).
+
+The page used to be read by BeautifulSoup, with around 15 functions that each searched the whole page several times (one "select_one" per field), and the search results were found by searching inside every element of the page (which is quadratic in the size of the page).
+Now, the page is parsed once with lxml, and a single pass over the elements indexes every element by its classes, its id, its "jsname" and its tag (_SerpIndex).
+Each field is then found from the index: a selector (e.g. ".xpdopen .yuRUbf a") looks up the elements that match its last part, and only checks the ancestors of those elements for the rest.
+Selectors support tags, classes, ids, [attribute=value], ":nth-child(1)" and the descendant (" ") and child (">") combinators.
+
+A benchmark against saved (or generated) pages is found in _benchmark_serp.py.
+'''
+
+_TOKEN_PATTERN = re.compile(r'^(?P<tag>[a-z][a-z0-9]*)?(?P<rest>.*)$')
+
+def _parse_token(
+    _token: str) -> dict:
+  '''
+  Parses one part of a selector (e.g. "td:nth-child(1)" or ".VpH2eb.vmod").
+  '''
+  _match = _TOKEN_PATTERN.match(_token)
+  _rest = _match.group('rest')
+  return {'tag': _match.group('tag'),
+          'classes': re.findall(r'\.([\w-]+)', _rest),
+          'id': (re.findall(r'#([\w-]+)', _rest) + [None])[0],
+          'attributes': re.findall(r'\[([\w-]+)=([\w-]+)\]', _rest),
+          'first_child': ':nth-child(1)' in _rest}
+
+def _parse_selector(
+    _selector: str) -> list:
+  '''
+  Parses a selector into [(_combinator, _token)], from the last part to the first. The combinator joins a part to the part before it: ' ' (descendant) or '>' (child).
+  '''
+  _parts = _selector.replace('>', ' > ').split()
+  _tokens, _combinator = [], ' '
+  for _part in _parts:
+    if _part == '>':
+      _combinator = '>'
+      continue
+    _tokens.append((_combinator, _parse_token(_part)))
+    _combinator = ' '
+  # The first part has no combinator.
+  _tokens[0] = (None, _tokens[0][1])
+  return _tokens[::-1]
+
+def _classes(_element) -> set:
+  return set((_element.get('class') or '').split())
+
+def _element_children(_element) -> list:
+  # Comments are not elements, and are not counted by ":nth-child".
+  return [_child for _child in _element if isinstance(_child.tag, str)]
+
+def _text(_element) -> str:
+  return _element.text_content()
+
+class _SerpIndex():
+  def __init__(
+      self,
+      _html: str):
+    '''
+    Parses the page, and indexes every element in a single pass.
+    '''
+    try:
+      self._root = lxml.html.fromstring(_html)
+    except (lxml.etree.ParserError, ValueError):
+      # An empty page (or one that cannot be parsed) has no results and no answer boxes.
+      self._root = lxml.html.fromstring('<html></html>')
+    self._by_class = {}
+    self._by_id = {}
+    self._by_jsname = {}
+    self._by_tag = {}
+    self._order = {}
+    for _position, _element in enumerate(self._root.iter()):
+      if not isinstance(_element.tag, str):
+        continue
+      self._order[_element] = _position
+      self._by_tag.setdefault(_element.tag, []).append(_element)
+      for _class in _classes(_element):
+        self._by_class.setdefault(_class, []).append(_element)
+      _id = _element.get('id')
+      if _id is not None and _id not in self._by_id:
+        self._by_id[_id] = _element
+      _jsname = _element.get('jsname')
+      if _jsname is not None:
+        self._by_jsname.setdefault(_jsname, []).append(_element)
+  
+  def _candidates(
+      self,
+      _token: dict) -> list:
+    if _token['id'] is not None:
+      return [self._by_id[_token['id']]] if _token['id'] in self._by_id else []
+    if len(_token['classes']) > 0:
+      # The rarest class has the fewest elements to check.
+      return min([self._by_class.get(_class, []) for _class in _token['classes']], key = len)
+    for _name, _value in _token['attributes']:
+      if _name == 'jsname':
+        return self._by_jsname.get(_value, [])
+    if _token['tag'] is not None:
+      return self._by_tag.get(_token['tag'], [])
+    return list(self._order.keys())
+  
+  def _matches(
+      self,
+      _element,
+      _token: dict) -> bool:
+    if _token['tag'] is not None and _element.tag != _token['tag']:
+      return False
+    if _token['id'] is not None and _element.get('id') != _token['id']:
+      return False
+    if not set(_token['classes']).issubset(_classes(_element)):
+      return False
+    for _name, _value in _token['attributes']:
+      if _element.get(_name) != _value:
+        return False
+    if _token['first_child']:
+      _parent = _element.getparent()
+      if _parent is None or _element_children(_parent)[0] is not _element:
+        return False
+    return True
+  
+  def _matches_chain(
+      self,
+      _element,
+      _tokens: list,
+      _index: int = 0) -> bool:
+    '''
+    Whether the element matches the selector, checked from its last part to its first (as browsers do).
+    '''
+    _combinator, _token = _tokens[_index]
+    if not self._matches(_element, _token):
+      return False
+    if _index == len(_tokens) - 1:
+      return True
+    if _combinator == '>':
+      _parent = _element.getparent()
+      return _parent is not None and self._matches_chain(_parent, _tokens, _index + 1)
+    for _ancestor in _element.iterancestors():
+      if self._matches_chain(_ancestor, _tokens, _index + 1):
+        return True
+    return False
+  
+  def _select(
+      self,
+      _selector: str,
+      _scope = None) -> list:
+    '''
+    Returns every element that matches the selector, in the order they appear on the page.
+    
+    Args:
+     - _selector (STR): The selector. Several selectors can be separated by commas (e.g. ".wT3VGc, .XcVN5d").
+     - _scope: If given, only elements inside _scope are returned.
+    '''
+    _elements = []
+    for _part in _selector.split(','):
+      _tokens = _parse_selector(_part.strip())
+      for _element in self._candidates(_tokens[0][1]):
+        if self._matches_chain(_element, _tokens) and (_scope is None or any([_ancestor is _scope for _ancestor in _element.iterancestors()])):
+          _elements.append(_element)
+    if ',' in _selector:
+      _elements = sorted(set(_elements), key = lambda _element: self._order[_element])
+    return _elements
+  
+  def _select_one(
+      self,
+      _selector: str,
+      _scope = None):
+    '''
+    Returns the first element that matches the selector, or None.
+    '''
+    _elements = self._select(_selector, _scope = _scope)
+    return _elements[0] if len(_elements) > 0 else None
+  
+  def _text_of(
+      self,
+      _selector: str,
+      _scope = None) -> str:
+    '''
+    The text of the first element that matches the selector. Raises an AttributeError if there is none (like BeautifulSoup's "select_one(...).text").
+    '''
+    _element = self._select_one(_selector, _scope = _scope)
+    if _element is None:
+      raise AttributeError(f'No element matches "{_selector}"')
+    return _text(_element)
+  
+  def _attribute_of(
+      self,
+      _selector: str,
+      _attribute: str,
+      _scope = None) -> str:
+    _element = self._select_one(_selector, _scope = _scope)
+    if _element is None or _element.get(_attribute) is None:
+      raise KeyError(f'No "{_attribute}" for "{_selector}"')
+    return _element.get(_attribute)
+
+def _parse_search_results(
+    _html: str):
+  '''
+  Returns the titles and links (hrefs) of the search results, in the order they appear on the page.
+  Each title (h3) is paired with the link that contains it, or, if it is not inside a link, the first link of its closest ancestor that has one.
+  
+  Returns:
+   - _titles (LIST): The text of each title.
+   - _urls (LIST): The href of each title's link.
+  '''
+  _index = _SerpIndex(_html)
+  _titles, _urls = [], []
+  for _h3 in _index._by_tag.get('h3', []):
+    _link = None
+    for _ancestor in _h3.iterancestors():
+      if _ancestor.tag == 'a' and _ancestor.get('href') is not None:
+        _link = _ancestor
+        break
+    if _link is None:
+      for _ancestor in _h3.iterancestors():
+        _link = next((_a for _a in _ancestor.iter('a') if _a.get('href') is not None), None)
+        if _link is not None:
+          break
+    if _link is not None:
+      _titles.append(_text(_h3))
+      _urls.append(_link.get('href'))
+  return _titles, _urls
+
+def _parse_answer_box(
+    _html: str) -> dict:
+  '''
+  Returns every answer box on the page, as {"Type of Information": "Extracted Info"}. The link of the answer is found in the key "Primary Link".
+  Each answer box is read separately, so an answer box that is missing (or has changed) does not stop the others from being read.
+  '''
+  _index = _SerpIndex(_html)
+  _google_box = {}
+  for _reader in [_notable_text, _business_box, _table, _address_box, _side_box, _quaternary_answer, _tertiary_answer, _secondary_answer,
+                  _primary_answer, _dictionary_answer, _currency_conversion_answer, _population_answer, _stock_answer, _weather_answer, _calculator_answer]:
+    try:
+      _reader(_index, _google_box)
+    except Exception:
+      pass
+  return _google_box
+
+def _notable_text(_index, _google_box):
+  '''How many protons in Oxygen atom?'''
+  _google_box['Notable Text'] = _index._text_of('.ILfuVd')
+
+def _business_box(_index, _google_box):
+  '''state parliament nsw open hours'''
+  _google_box['Business Information'] = _index._text_of('.xDKLO')
+
+def _table(_index, _google_box):
+  _google_box['Table'] = _index._text_of('.Crs1tb')
+
+def _address_box(_index, _google_box):
+  _google_box['Address'] = _index._text_of('.sXLaOe')
+
+def _side_box(_index, _google_box):
+  _desc = _index._select_one('.kno-rdesc')
+  _desc_href = [_element.get('href') for _element in _desc.iter() if isinstance(_element.tag, str) and _element.get('href') is not None][0]
+  _google_box['Side Box'] = _text(_desc)
+  _google_box['Side Box (href)'] = _desc_href
+  for _element in _index._select('.rVusze'):
+    _key, _value = _text(_element).split(': ')
+    _google_box['Side Box {}'.format(_key)] = _value
+
+def _quaternary_answer(_index, _google_box):
+  _title = _index._text_of('.QpPSMb').lstrip(' ')
+  _subtitle = _index._text_of('.loJjTe').lstrip(' ')
+  if _title == '' or _subtitle == '':
+    return
+  _google_box['Quaternary Title'] = _title
+  _google_box['Quaternary Subtitle'] = _subtitle
+
+def _tertiary_answer(_index, _google_box):
+  '''How much is a large pizza at Papa John's'''
+  _title = _index._text_of('.ifM9O .LC20lb')
+  _link = _index._attribute_of('.ifM9O .yuRUbf a', 'href')
+  _displayed_link = _index._text_of('.ifM9O .iUh30')
+  _snippet = _index._text_of('.ifM9O .iKJnec')
+  _google_box['Tertiary Title'] = _title
+  _google_box['Tertiary Link'] = _link
+  _google_box['Tertiary Displayed Link'] = _displayed_link
+  _google_box['Tertiary Snippet'] = _snippet
+  # The table after the answer (".ztXv9 ~ tr + tr"): every row after the first is [_key, _value, _price], and the last row is kept.
+  _table_start = _index._select_one('.ztXv9')
+  if _table_start is None:
+    return
+  _rows = []
+  for _sibling in _table_start.itersiblings():
+    if isinstance(_sibling.tag, str):
+      _rows += [_sibling] if _sibling.tag == 'tr' else list(_sibling.iter('tr'))
+  for _row in _rows[1:]:
+    _cells = [_text(_cell) for _cell in _element_children(_row) if _cell.tag == 'td']
+    if len(_cells) >= 3:
+      _google_box['Tertiary Table Row'] = _cells[:3]
+
+def _secondary_answer(_index, _google_box):
+  '''dynasties of macedonia'''
+  _title = _index._text_of('.xpdopen .DKV0Md')
+  _link = _index._attribute_of('.xpdopen .yuRUbf a', 'href')
+  # The answer is only used if it has a displayed link.
+  _index._text_of('.xpdopen .iUh30')
+  _google_box['Secondary Title'] = _title
+  _google_box['Secondary Link'] = _link
+  _bullet_points = _index._select('.TrT0Xe')
+  if _index._select_one('.xpdopen .co8aDb b') is not None and len(_bullet_points) > 0:
+    _google_box['Secondary Snippet'] = _index._text_of('.xpdopen .co8aDb b')
+    _google_box['Secondary Bullet Points'] = '\n'.join([_text(_bullet_point) for _bullet_point in _bullet_points])
+  elif len(_bullet_points) > 0:
+    _google_box['Secondary Bullet Points'] = '\n'.join([_text(_bullet_point) for _bullet_point in _bullet_points])
+  else:
+    _google_box['Secondary Snippet'] = _index._text_of('.xpdopen .iKJnec')
+  _results = _index._by_id.get('rso')
+  if _results is None:
+    return
+  for _row in _results.iter('tr'):
+    _cells = [_cell for _cell in _element_children(_row) if _cell.tag == 'td']
+    if len(_cells) >= 2:
+      _google_box['Secondary {}'.format(_text(_cells[0]))] = _text(_cells[1])
+
+def _primary_answer(_index, _google_box):
+  '''luke skywalker lightsaber color'''
+  _google_box['Primary Link'] = _index._attribute_of('.yuRUbf a', 'href')
+  _google_box['Primary Answer'] = _index._text_of('.IZ6rdc')
+  _google_box['Primary Snippet'] = _index._text_of('.hgKElc')
+
+def _dictionary_answer(_index, _google_box):
+  '''define slob'''
+  for _number, _result in enumerate(_index._select('.VpH2eb.vmod')):
+    _google_box['Definition {}'.format(_number + 1)] = [_text(_definition) for _definition in _index._select('.PZPZlf', _scope = _result)]
+
+def _currency_conversion_answer(_index, _google_box):
+  '''100 usd in aud'''
+  _google_box['Conversion Rate'] = _index._text_of('.SwHCTb')
+  _google_box['Conversion Currency'] = _index._text_of('.MWvIVe')
+
+def _population_answer(_index, _google_box):
+  '''What is the population of India?'''
+  _google_box['Location'] = _index._text_of('.GzssTd span')
+  _population_year = _index._text_of('.KBXm4e').split(' ')
+  _google_box['Population'] = _population_year[0]
+  _google_box['Year Captured'] = _population_year[1].replace('(', '').replace(')', '')
+  _google_box['Source of Info'] = [_text(_source) for _source in _index._select('.kno-ftr span a')]
+
+def _stock_answer(_index, _google_box):
+  '''vas Stock'''
+  _google_box['Stock Title'] = _index._text_of('.oPhL2e').replace(u'\xa0', u'').split('>')[1]
+  _google_box['Stock Datetime'] = _index._text_of('[jsname=ihIZgd]').replace(' ·', '')
+  _google_box['Market Status'] = _index._text_of('.TgMHGc span:nth-child(1)').strip().replace(':', '')
+  _google_box['Currency'] = _index._text_of('.knFDje').strip()
+  _price_change = _index._text_of('.WlRRw > span:nth-child(1)')
+  _google_box['Current Price'] = _index._text_of('.wT3VGc, .XcVN5d')
+  _google_box['Price Change'] = _price_change
+  _google_box['Price Change Percent'] = _index._text_of('.jBBUv span:nth-child(1)').replace('(', '').replace(')', '')
+  _google_box['Price Change Date'] = _index._text_of('.jdUcZd span').strip().capitalize()
+  _google_box['Price Movement'] = 'Down' if '−' in _price_change else 'Up'
+  for _stock_key, _stock_value in zip(_index._select('.JgXcPd'), _index._select('.iyjjgb')):
+    _google_box[_text(_stock_key)] = _text(_stock_value)
+
+def _weather_answer(_index, _google_box):
+  '''What is the weather in Orange, NSW?'''
+  for _key, _id in [('Weather Location', 'wob_loc'), ('Weather Condition', 'wob_dc'), ('Weather Temperature', 'wob_tm'), ('Weather Precipitation', 'wob_pp'),
+                    ('Weather Humidity', 'wob_hm'), ('Weather Wind', 'wob_ws'), ('Weather Current-Time', 'wob_dts')]:
+    _google_box[_key] = _index._text_of(f'#{_id}')
+  for _wind_speed_direction in _index._select('.wob_noe .wob_hw'):
+    try:
+      _wind = _index._select_one('.wob_t', _scope = _wind_speed_direction)
+      _google_box['Weather Wind Speed'] = _text(_wind)
+      _google_box['Weather Wind Direction'] = ' '.join(_wind.get('aria-label').split(' ')[2:4])
+    except Exception:
+      pass
+  for _forecast in _index._select('.wob_df'):
+    _day = _index._attribute_of('.Z1VzSb', 'aria-label', _scope = _forecast)
+    _weather = _index._attribute_of('.YQ4gaf', 'alt', _scope = _forecast)
+    _high_temp = _index._select_one('.vk_gy .wob_t:nth-child(1)', _scope = _forecast)
+    if _high_temp is None:
+      _high_temp = _index._select_one('.gNCp2e .wob_t', _scope = _forecast)
+    _low_temp = _index._text_of('.QrNVmd .wob_t:nth-child(1)', _scope = _forecast)
+    _google_box['Weather Forecast {}'.format(_day)] = 'Weather: {}, High: {}, Low: {}'.format(_weather, _text(_high_temp), _low_temp)
+
+def _calculator_answer(_index, _google_box):
+  '''32 * 3 / 3 + 12 * 332 - 1995'''
+  _math_expression = _index._text_of('.XH1CIc').strip().replace(' =', '')
+  _calc_answer = _index._text_of('#cwos').strip()
+  _google_box['Mathematical Expression'] = _math_expression
+  _google_box['Calculated Answer'] = _calc_answer
\ No newline at end of file
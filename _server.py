@@ -0,0 +1,227 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import heapq
+import itertools
+import json
+import time
+
+from _context_window import _ContextWindow
+from _journal import _TranscriptJournal
+
+'''
+_JayServer lets several users talk to Jay at the same time, each in their own conversation.
+
+Every conversation shares one Jay: the loaded model, _Query, the calendar, the to-do list and the system functions are only loaded once.
+Each conversation keeps its own prompt, context window and journal (a _ServerSession), so conversations never see each other.
+
+The server listens on a local TCP port. Each connection is one conversation, and each line sent is one user input, as JSON: {"text": "..."}.
+Each line returned is JSON: {"type": "output", "text": "..."} for anything Jay says before calling system, and {"type": "response", "text": "...", "time": FLOAT} once Jay has responded.
+
+Only one conversation can use the model at a time. Waiting conversations are given the model fairly (see _FairScheduler).
+System functions (e.g. a slow internet search) run on a separate thread pool, so while one conversation waits on a system function, other conversations can use the model.
+System functions that need the user at Jay's computer (e.g. "_save_note" asks at the console) are refused, and speculative tool calls are turned off, as the tool registry is shared.
+'''
+
+class _ServerSession():
+  def __init__(
+      self,
+      _session_id: int,
+      _conversation: str,
+      _context_window: _ContextWindow,
+      _journal: _TranscriptJournal):
+    '''
+    The state of a single conversation.
+    '''
+    self._session_id = _session_id
+    self._conversation = _conversation
+    self._context_window = _context_window
+    self._journal = _journal
+    # The total time this conversation has used the model, which the scheduler uses to share the model fairly.
+    self._model_seconds = 0.0
+    self._model_calls = 0
+
+class _FairScheduler():
+  def __init__(self):
+    '''
+    Decides which conversation uses the model next.
+    The waiting conversation that has used the model for the least time goes first (ties go to whichever has waited the longest).
+    A conversation that calls many system functions (and so uses the model many times in a row) cannot starve a conversation that only asked a short question.
+    '''
+    self._waiting = []
+    self._counter = itertools.count()
+    self._busy = False
+  
+  async def _acquire(
+      self,
+      _session: _ServerSession):
+    if not self._busy and len(self._waiting) == 0:
+      self._busy = True
+      return
+    _future = asyncio.get_running_loop().create_future()
+    heapq.heappush(self._waiting, (_session._model_seconds, next(self._counter), _future))
+    try:
+      await _future
+    except asyncio.CancelledError:
+      # If the model was handed over as the conversation was cancelled, it is passed on.
+      if _future.done() and not _future.cancelled():
+        self._release()
+      raise
+  
+  def _release(self):
+    while len(self._waiting) > 0:
+      _, _, _future = heapq.heappop(self._waiting)
+      if not _future.done():
+        _future.set_result(None)
+        return
+    self._busy = False
+
+class _JayServer():
+  def __init__(
+      self,
+      _jay,
+      _host: str = '127.0.0.1',
+      _port: int = 8765,
+      _tool_workers: int = 8,
+      _prompt_folder: str = 'Prompts'):
+    '''
+    Args:
+     - _jay (Jay): The loaded Jay, which every conversation shares.
+     - _host (STR): The address the server listens on. Defaults to '127.0.0.1' (this computer only).
+     - _port (INT): The port the server listens on.
+     - _tool_workers (INT): The number of system functions that can run at the same time, across every conversation.
+     - _prompt_folder (STR): The folder that the journal of each conversation is saved in.
+    '''
+    self._jay = _jay
+    self._host = _host
+    self._port = _port
+    self._prompt_folder = _prompt_folder
+    self._scheduler = _FairScheduler()
+    # The model is only ever used by one thread, so it is never used by two conversations at once.
+    self._model_executor = ThreadPoolExecutor(max_workers = 1)
+    self._tool_executor = ThreadPoolExecutor(max_workers = _tool_workers)
+    self._session_ids = itertools.count(1)
+    self._sessions = {}
+    # Jay's own (console) conversation is not used by the server.
+    self._jay._journal._close()
+    # Speculative calls are kept by the tool registry, which every conversation shares, so one conversation would cancel (or use) the guesses of another.
+    self._jay._speculative_tool_calls = False
+  
+  def _run(self):
+    asyncio.run(self._serve())
+  
+  async def _serve(self):
+    _server = await asyncio.start_server(self._handle_connection, self._host, self._port)
+    self._jay._util_print_color(f"|- Jay Server Listening: {self._host}:{self._port}", to_print = 1.0)
+    async with _server:
+      await _server.serve_forever()
+  
+  def _new_session(self) -> _ServerSession:
+    '''
+    Starts a new conversation, with its own context window and journal.
+    '''
+    _session_id = next(self._session_ids)
+    _conversation = self._jay._util_prompt_model_llama3()
+    _context_window = _ContextWindow(
+        _pinned_prompt = _conversation,
+        _count_tokens = self._jay._util_count_tokens,
+        _budget_tokens = self._jay._context_budget_tokens)
+    _journal = _TranscriptJournal(
+        _filename = f"{self._prompt_folder}\\server_{int(time.time())}_{_session_id}.jsonl",
+        _fsync_policy = self._jay._journal_fsync_policy)
+    _journal._append(_conversation, _record_type = 'prompt')
+    _journal._end_turn()
+    _session = _ServerSession(_session_id = _session_id, _conversation = _conversation, _context_window = _context_window, _journal = _journal)
+    self._sessions[_session_id] = _session
+    return _session
+  
+  async def _handle_connection(
+      self,
+      _reader,
+      _writer):
+    '''
+    Each connection is one conversation. The conversation ends when the connection is closed, or the user says "exit".
+    '''
+    _session = self._new_session()
+    self._jay._util_print_color(f"|- Session {_session._session_id} Started ({len(self._sessions)} Active)", to_print = 1.0)
+    try:
+      while True:
+        _line = await _reader.readline()
+        if len(_line) == 0:
+          break
+        try:
+          _text = json.loads(_line.decode('utf-8'))['text']
+          if not isinstance(_text, str):
+            raise TypeError
+        except (json.JSONDecodeError, KeyError, TypeError, UnicodeDecodeError):
+          await self._send(_writer, {'type': 'error', 'text': 'Each line must be JSON: {"text": "..."}'})
+          continue
+        if _text.lower() in ['false', 'f', 'exit', 'stop', 'cls']:
+          break
+        _stt = time.time()
+        _ai_response = await self._turn(_session = _session, _text = _text, _writer = _writer)
+        await self._send(_writer, {'type': 'response', 'text': _ai_response, 'time': round(time.time() - _stt, 4)})
+    except ConnectionError:
+      pass
+    finally:
+      _session._journal._close()
+      del self._sessions[_session._session_id]
+      self._jay._util_print_color(f"|- Session {_session._session_id} Ended: {_session._model_calls} Model Calls, {round(_session._model_seconds, 4)} Model secs", to_print = 1.0)
+      _writer.close()
+  
+  async def _send(
+      self,
+      _writer,
+      _message: dict):
+    _writer.write((json.dumps(_message, ensure_ascii = False) + '\n').encode('utf-8'))
+    await _writer.drain()
+  
+  async def _turn(
+      self,
+      _session: _ServerSession,
+      _text: str,
+      _writer) -> str:
+    '''
+    A single user input, and every system call that Jay makes before responding.
+    The model is released while system functions run, so other conversations can use it.
+    '''
+    _loop = asyncio.get_running_loop()
+    _ai_response, _send_to_system = await self._generate(_session = _session, _input = _text)
+    while _send_to_system and 'to-system:' in _ai_response:
+      # Functions that need the user at Jay's computer (e.g. "_save_note" asks at the console) are refused, as the user of this conversation is not there.
+      _user_output, _next_comment = await _loop.run_in_executor(self._tool_executor, functools.partial(self._jay._run_system_calls, _ai_response, _remote = True))
+      if len(_user_output) > 0:
+        await self._send(_writer, {'type': 'output', 'text': _user_output})
+      _ai_response, _send_to_system = await self._generate(_session = _session, _input = _next_comment)
+    return _ai_response
+  
+  async def _generate(
+      self,
+      _session: _ServerSession,
+      _input: str):
+    '''
+    Waits for the model, and then generates Jay's response in the conversation.
+    '''
+    await self._scheduler._acquire(_session)
+    try:
+      return await asyncio.get_running_loop().run_in_executor(self._model_executor, self._send_and_respond, _session, _input)
+    finally:
+      self._scheduler._release()
+  
+  def _send_and_respond(
+      self,
+      _session: _ServerSession,
+      _input: str):
+    '''
+    Runs Jay's "_send_and_respond" with the conversation of _session. This is only ever run on the model thread.
+    '''
+    _stt = time.time()
+    self._jay._conversation = _session._conversation
+    self._jay._context_window = _session._context_window
+    self._jay._journal = _session._journal
+    try:
+      return self._jay._send_and_respond(_input = _input)
+    finally:
+      _session._conversation = self._jay._conversation
+      _session._model_seconds += time.time() - _stt
+      _session._model_calls += 1
\ No newline at end of file
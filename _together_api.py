@@ -1,3 +1,4 @@
+import math
 import time
 
 class _API():
@@ -19,20 +20,126 @@ class _API():
       self,
       _messages,
       _stop = ['<|eot_id|>', 'END_FUNC'],
-      _max_tokens = 1024):
+      _max_tokens = 1024,
+      _tool_call_detector = None,
+      _prefix_name = None,
+      _seed = None):
+    '''
+    _prefix_name is only used by Llama_CPP models (see _prefix_cache.py). together.ai is always sent the whole prompt.
+    _seed is the sampling seed, so that several samples of the same prompt differ (see _agent_calculator._self_consistency). Defaults to None (together.ai picks one).
+    '''
     _stt = time.time()
+    _sampling = {} if _seed is None else {'seed': _seed}
     
+    if _tool_call_detector is not None:
+      return self._stream(_messages = _messages, _stop = _stop, _max_tokens = _max_tokens, _tool_call_detector = _tool_call_detector, _stt = _stt)
     if self._input_type == str:
       _response = self._client.completions.create(
           model = self._model_name,
           prompt = _messages,
           max_tokens = _max_tokens,
-          stop = _stop)
+          stop = _stop,
+          **_sampling)
       return (_response.choices[0].text, _response.usage.prompt_tokens, _response.usage.completion_tokens, _response.usage.total_tokens, time.time() - _stt)
     elif self._input_type == dict:
       _response = self._client.chat.completions.create(
           model = self._model_name,
           messages = _messages,
           max_tokens = _max_tokens,
-          stop = _stop)
-      return (_response.choices[0].message.content, _response.usage.prompt_tokens, _response.usage.completion_tokens, _response.usage.total_tokens, time.time() - _stt)
\ No newline at end of file
+          stop = _stop,
+          **_sampling)
+      return (_response.choices[0].message.content, _response.usage.prompt_tokens, _response.usage.completion_tokens, _response.usage.total_tokens, time.time() - _stt)
+  
+  def _classify(
+      self,
+      _messages,
+      _labels: dict,
+      _prefix_name = None):
+    '''
+    Classifies the prompt into one of the labels, by generating a single token (max_tokens = 1) with its logprob.
+    If the token is not one of the labels (e.g. "["), a few more tokens are generated and searched for a label, as before.
+    
+    Args:
+     - _messages: The prompt. The label is expected to be the next token.
+     - _labels (DICT): {_label: [_variant, ...]}, e.g. {'TRUE': ['TRUE', 'True'], 'FALSE': ['FALSE', 'False']}. The last label is returned if no label is found.
+    
+    Returns:
+     - _label (STR): The label.
+     - _confidence (FLOAT): The probability of the token, or 1.0 if together.ai did not return logprobs (or no label was in the first token).
+     - _prompt_tokens (INT): The length of prompt tokens.
+     - _time_taken (FLOAT)
+    '''
+    _stt = time.time()
+    if self._input_type == str:
+      _response = self._client.completions.create(
+          model = self._model_name,
+          prompt = _messages,
+          max_tokens = 1,
+          logprobs = 1)
+      _text = _response.choices[0].text
+    elif self._input_type == dict:
+      _response = self._client.chat.completions.create(
+          model = self._model_name,
+          messages = _messages,
+          max_tokens = 1,
+          logprobs = 1)
+      _text = _response.choices[0].message.content
+    _prompt_tokens = _response.usage.prompt_tokens
+    _logprobs = getattr(_response.choices[0], 'logprobs', None)
+    _token_logprobs = getattr(_logprobs, 'token_logprobs', None) if _logprobs is not None else None
+    for _label, _variants in _labels.items():
+      if (_text or '').strip() != '' and any([_variant.startswith((_text or '').strip()) for _variant in _variants]):
+        _confidence = math.exp(_token_logprobs[0]) if _token_logprobs is not None and len(_token_logprobs) > 0 and _token_logprobs[0] is not None else 1.0
+        return _label, _confidence, _prompt_tokens, time.time() - _stt
+    
+    _output, _prompt_tokens, _, _, _ = self(_messages, _stop = ['<|eot_id|>'], _max_tokens = 16)
+    for _label, _variants in _labels.items():
+      if any([_variant in _output for _variant in _variants]):
+        return _label, 1.0, _prompt_tokens, time.time() - _stt
+    return list(_labels.keys())[-1], 1.0, _prompt_tokens, time.time() - _stt
+  
+  def _stream(
+      self,
+      _messages,
+      _stop,
+      _max_tokens,
+      _tool_call_detector,
+      _stt):
+    '''
+    Streams the response, and closes the stream as soon as _tool_call_detector finds that the system calls are complete.
+    If the stream is closed early, together.ai does not return the usage, so the number of tokens is estimated.
+    '''
+    if self._input_type == str:
+      _response = self._client.completions.create(
+          model = self._model_name,
+          prompt = _messages,
+          max_tokens = _max_tokens,
+          stop = _stop,
+          stream = True)
+    elif self._input_type == dict:
+      _response = self._client.chat.completions.create(
+          model = self._model_name,
+          messages = _messages,
+          max_tokens = _max_tokens,
+          stop = _stop,
+          stream = True)
+    _output, _chunks, _usage = '', 0, None
+    for _chunk in _response:
+      if getattr(_chunk, 'usage', None) is not None:
+        _usage = _chunk.usage
+      if len(_chunk.choices) == 0:
+        continue
+      _text = _chunk.choices[0].text if self._input_type == str else _chunk.choices[0].delta.content
+      if _text is None:
+        continue
+      _output += _text
+      _chunks += 1
+      if _tool_call_detector._feed(_text):
+        _output = _output[:_tool_call_detector._end]
+        break
+    if hasattr(_response, 'close'):
+      _response.close()
+    if _usage is not None:
+      return (_output, _usage.prompt_tokens, _usage.completion_tokens, _usage.total_tokens, time.time() - _stt)
+    _prompt_tokens = len(str(_messages)) // 4 + 1
+    return (_output, _prompt_tokens, _chunks, _prompt_tokens + _chunks, time.time() - _stt)
\ No newline at end of file
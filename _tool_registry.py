@@ -0,0 +1,619 @@
+import ast
+from concurrent.futures import ThreadPoolExecutor
+import inspect
+import threading
+import time
+
+'''
+_ToolRegistry holds every function that Jay can call through system ("to-system: _function(...) END_FUNC").
+
+Each tool is registered once, with the python function that runs it. The arguments the tool accepts are read from the function's signature.
+When Jay calls a tool, the call is parsed once (using "ast", never "eval"), so only literal arguments (STR, INT, FLOAT, LIST, etc) can be passed.
+The tool is looked up by its exact name, the arguments are checked against the signature and the tool is run.
+The time spent parsing, validating and running each tool is recorded.
+
+Jay can make several independent calls in one response ("to-system: _a(...) END_FUNC to-system: _b(...) END_FUNC").
+These are run at the same time on a thread pool, and every result is returned to Jay together.
+Tools that ask the user for input, or that change a shared file, are registered with _concurrent = False, and are always run one at a time, across every thread that uses the registry (e.g. every conversation of _JayServer).
+Tools that need the user at Jay's own computer (e.g. asking at the console, or opening a file on the screen) are registered with _interactive = True, and are refused for remote conversations (see _JayServer).
+
+Tools that only read information (e.g. searching the internet), and that can be cancelled (they take a "_cancel_event"), can be registered with _speculative = True.
+If speculation is used, these tools are started while Jay is still writing the call, as soon as an argument has been finished (see "_speculate").
+If the finished call matches, its result is used. Otherwise, the speculative call is cancelled.
+
+The registry can also write a GBNF grammar of every valid call (see "_grammar"), so that a Llama_CPP model can only write calls that parse.
+
+_ToolCallDetector reads Jay's response as it is generated, and finds each complete call ("to-system: _function(...) END_FUNC") as soon as it is written.
+Generation is stopped as soon as the calls are finished, rather than waiting for Jay to write (and make up) the result of the call.
+'''
+
+class _ToolCallError(Exception):
+  '''
+  The tool call could not be parsed or validated. The message is returned to Jay.
+  '''
+  pass
+
+class _Tool():
+  def __init__(
+      self,
+      _name: str,
+      _function,
+      _argument_aliases: dict = {},
+      _concurrent: bool = True,
+      _interactive: bool = False,
+      _speculative: bool = False):
+    self._name = _name
+    self._function = _function
+    self._concurrent = _concurrent
+    self._interactive = _interactive
+    self._signature = inspect.signature(_function)
+    # Arguments that begin with "_" (e.g. _cancel_event) are given by system, never by Jay.
+    self._parameter_names = [_ for _ in self._signature.parameters.keys() if _[:1] != '_']
+    self._cancellable = '_cancel_event' in self._signature.parameters
+    # A wrong guess of a tool that cannot be cancelled would run to the end (e.g. a Calendar API call), so only tools that can be cancelled are speculative.
+    self._speculative = _speculative and self._cancellable
+    self._argument_aliases = _argument_aliases
+    
+    self._calls = 0
+    self._errors = 0
+    self._parse_time = 0.0
+    self._validate_time = 0.0
+    self._execute_time = 0.0
+
+class _ToolRegistry():
+  def __init__(
+      self,
+      _max_workers: int = 4):
+    '''
+    Args:
+     - _max_workers (INT): The number of tool calls that can run at the same time.
+    '''
+    self._tools = {}
+    self._max_workers = _max_workers
+    self._executor = None
+    # Speculative calls run on their own pool, so a wrong guess never takes a worker from the calls Jay has made.
+    self._speculation_executor = None
+    # The statistics of a tool can be updated from several threads at once.
+    self._lock = threading.Lock()
+    # Tools that are not concurrent (e.g. the to-do list) are run under this lock, so two threads (e.g. two conversations of _JayServer) never run them at the same time.
+    self._sequential_lock = threading.Lock()
+    
+    # Each speculation is {'future': Future, 'cancel_event': threading.Event, 'call_index': INT}, keyed by the tool and its arguments.
+    self._speculations = {}
+    self._speculation_hits = 0
+    self._speculation_misses = 0
+
+  def _register(
+      self,
+      _name: str,
+      _function,
+      _argument_aliases: dict = {},
+      _concurrent: bool = True,
+      _interactive: bool = False,
+      _speculative: bool = False):
+    '''
+    Registers a tool.
+    
+    Args:
+     - _name (STR): The name Jay uses to call the tool (e.g. '_calculator').
+     - _function: The function that is run. The names of its arguments are the names Jay uses (e.g. MATH).
+     - _argument_aliases (DICT): Argument names Jay commonly uses by mistake, and the argument they should be (e.g. {'QUERY': 'QUESTION'}).
+     - _concurrent (BOOL): Whether the tool can run at the same time as other tools. Defaults to True.
+     - _interactive (BOOL): Whether the tool needs the user at Jay's own computer (e.g. it calls "input()"). Interactive tools are refused for remote calls. Defaults to False.
+     - _speculative (BOOL): Whether the tool can be started before Jay has finished writing the call. Only tools that do not change anything should be speculative. Defaults to False.
+                            The function must have a "_cancel_event" argument (otherwise the tool is not speculative). It is given a threading.Event, which is set if the speculative call is cancelled.
+    '''
+    self._tools[_name] = _Tool(_name = _name, _function = _function, _argument_aliases = _argument_aliases, _concurrent = _concurrent, _interactive = _interactive, _speculative = _speculative)
+  
+  def _split_calls(
+      self,
+      _system_comm: str) -> list:
+    '''
+    Splits the system communication into individual calls.
+    "END_FUNC" must already be removed. Any text after the closing bracket of a call is discarded.
+    
+    Args:
+     - _system_comm (STR): e.g. 'to-system: _time() to-system: _todo_list_read()'.
+    
+    Returns:
+     - _calls (LIST): e.g. ['_time()', '_todo_list_read()'].
+    '''
+    _calls = []
+    for _call in _system_comm.split('to-system:'):
+      if ')' in _call:
+        _call = _call[:_call.rfind(')') + 1]
+      if _call.strip() != '':
+        _calls.append(_call.strip())
+    return _calls
+  
+  def _parse(
+      self,
+      _system_comm: str):
+    '''
+    Parses a tool call into the tool's name and its arguments.
+    
+    Args:
+     - _system_comm (STR): The call, e.g. '_calculator(MATH = "What is 2 + 2?")'.
+    
+    Returns:
+     - _name (STR): The name of the tool.
+     - _args (LIST): The positional arguments.
+     - _kwargs (DICT): The keyword arguments.
+    '''
+    try:
+      _tree = ast.parse(_system_comm.strip(), mode = 'eval')
+    except SyntaxError as e:
+      raise _ToolCallError(f'The function call could not be read: {e.msg}')
+    _call = _tree.body
+    if not isinstance(_call, ast.Call) or not isinstance(_call.func, ast.Name):
+      raise _ToolCallError('A system function must be called as _function_name(ARGUMENT = VALUE)')
+    try:
+      _args = [ast.literal_eval(_) for _ in _call.args]
+      _kwargs = {_.arg: ast.literal_eval(_.value) for _ in _call.keywords}
+    except (ValueError, TypeError, SyntaxError):
+      raise _ToolCallError('Arguments must be written as values (e.g. "text", 10, [1, 2]), not as expressions')
+    if None in _kwargs:
+      raise _ToolCallError('Arguments cannot be unpacked with "**"')
+    return _call.func.id, _args, _kwargs
+  
+  def _validate(
+      self,
+      _tool: _Tool,
+      _args: list,
+      _kwargs: dict) -> dict:
+    '''
+    Checks the arguments against the tool's signature.
+    
+    Returns:
+     - _kwargs (DICT): Every argument, as a keyword argument.
+    '''
+    _kwargs = {_tool._argument_aliases.get(_key, _key): _value for _key, _value in _kwargs.items()}
+    if len([_key for _key in _kwargs if _key[:1] == '_']) > 0:
+      raise _ToolCallError(f'The arguments of {_tool._name} are {_tool._parameter_names}')
+    try:
+      _bound_arguments = _tool._signature.bind(*_args, **_kwargs)
+    except TypeError as e:
+      raise _ToolCallError(f'{e}. The arguments of {_tool._name} are {_tool._parameter_names}')
+    return dict(_bound_arguments.arguments)
+  
+  def _call(
+      self,
+      _system_comm: str,
+      _remote: bool = False) -> str:
+    '''
+    Parses, validates and runs a tool call.
+    
+    Args:
+     - _system_comm (STR): The call, without "to-system:" and "END_FUNC".
+     - _remote (BOOL): Whether the call is from a remote conversation, where interactive tools cannot be used. Defaults to False.
+    
+    Returns:
+     - _next_comment (STR): The "to-Jay:" result (or error) of the tool.
+    '''
+    _stt = time.time()
+    try:
+      _name, _args, _kwargs = self._parse(_system_comm)
+    except _ToolCallError as e:
+      return f'to-Jay: ERROR returned: {[str(e)]}.'
+    if _name not in self._tools:
+      return f'to-Jay: ERROR Returned: "{_name}" Is Not a System Function.'
+    _tool = self._tools[_name]
+    if _remote and _tool._interactive:
+      return f'to-Jay: ERROR Returned: "{_name}" Needs the User at Jay\'s Computer, and Cannot Be Used in This Conversation.'
+    _parse_time = time.time() - _stt
+    
+    _stt = time.time()
+    _error = False
+    try:
+      _kwargs = self._validate(_tool = _tool, _args = _args, _kwargs = _kwargs)
+    except _ToolCallError as e:
+      _error = True
+      _next_comment = f'to-Jay: ERROR returned: {[str(e)]}.'
+    _validate_time = time.time() - _stt
+    
+    _stt = time.time()
+    if not _error:
+      # If the same call was started speculatively, its result is used.
+      with self._lock:
+        _speculation = self._speculations.pop(self._call_key(_tool = _tool, _kwargs = _kwargs), None)
+        if _speculation is not None:
+          self._speculation_hits += 1
+      if _speculation is not None:
+        _next_comment = _speculation['future'].result()
+      else:
+        try:
+          if _tool._concurrent:
+            _next_comment = _tool._function(**_kwargs)
+          else:
+            with self._sequential_lock:
+              _next_comment = _tool._function(**_kwargs)
+        except Exception as e:
+          _error = True
+          _next_comment = f'to-Jay: ERROR returned: {[str(e)]}.'
+    _execute_time = time.time() - _stt
+    
+    with self._lock:
+      _tool._calls += 1
+      _tool._errors += int(_error)
+      _tool._parse_time += _parse_time
+      _tool._validate_time += _validate_time
+      _tool._execute_time += _execute_time
+    return _next_comment
+  
+  def _call_batch(
+      self,
+      _calls: list,
+      _remote: bool = False) -> list:
+    '''
+    Runs several independent tool calls.
+    Concurrent tools are run at the same time on the thread pool, while the other tools are run one at a time (in the order they were called).
+    
+    Args:
+     - _calls (LIST): The calls, without "to-system:" and "END_FUNC".
+     - _remote (BOOL): Whether the calls are from a remote conversation (see "_call").
+    
+    Returns:
+     - _next_comments (LIST): The "to-Jay:" result of each call, in the same order as _calls.
+    '''
+    _futures, _next_comments = {}, {}
+    for _index, _call in enumerate(_calls):
+      if self._is_concurrent(_call):
+        _futures[_index] = self._get_executor().submit(self._call, _call, _remote)
+    for _index, _call in enumerate(_calls):
+      if _index not in _futures:
+        _next_comments[_index] = self._call(_call, _remote)
+    for _index, _future in _futures.items():
+      _next_comments[_index] = _future.result()
+    return [_next_comments[_index] for _index in range(len(_calls))]
+  
+  def _get_executor(self) -> ThreadPoolExecutor:
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(max_workers = self._max_workers)
+    return self._executor
+  
+  def _call_key(
+      self,
+      _tool: _Tool,
+      _kwargs: dict) -> str:
+    '''
+    A key for a validated call. Default arguments are filled in, so that calls that only differ by writing a default value are the same call.
+    '''
+    _bound_arguments = _tool._signature.bind(**_kwargs)
+    _bound_arguments.apply_defaults()
+    return repr((_tool._name, sorted([(_key, repr(_value)) for _key, _value in _bound_arguments.arguments.items() if _key[:1] != '_'])))
+  
+  def _speculate(
+      self,
+      _call_index: int,
+      _system_comm: str):
+    '''
+    Starts a speculative tool call, while Jay is still writing it (see _ToolCallDetector).
+    Nothing happens if the call cannot be parsed yet, if the tool is not speculative, or if no argument has been written yet (a call with only default arguments is rarely the call Jay finishes).
+    If Jay changes the arguments of the call (e.g. adds URLs), the previous speculation of the call is cancelled and a new one is started.
+    
+    Args:
+     - _call_index (INT): Which call of the response this is (0 for the first call).
+     - _system_comm (STR): The call so far, with its brackets closed.
+    '''
+    try:
+      _name, _args, _kwargs = self._parse(_system_comm)
+      if _name not in self._tools or not self._tools[_name]._speculative:
+        return
+      _tool = self._tools[_name]
+      _kwargs = self._validate(_tool = _tool, _args = _args, _kwargs = _kwargs)
+    except _ToolCallError:
+      return
+    if len(_kwargs) == 0:
+      return
+    _key = self._call_key(_tool = _tool, _kwargs = _kwargs)
+    with self._lock:
+      if _key in self._speculations:
+        return
+      for _other_key, _speculation in list(self._speculations.items()):
+        if _speculation['call_index'] == _call_index:
+          self._cancel_speculation(self._speculations.pop(_other_key))
+      _cancel_event = threading.Event()
+      if _tool._cancellable:
+        _kwargs['_cancel_event'] = _cancel_event
+      if self._speculation_executor is None:
+        self._speculation_executor = ThreadPoolExecutor(max_workers = self._max_workers)
+      _future = self._speculation_executor.submit(self._run_speculation, _tool, _kwargs)
+      self._speculations[_key] = {'future': _future, 'cancel_event': _cancel_event, 'call_index': _call_index}
+  
+  def _run_speculation(
+      self,
+      _tool: _Tool,
+      _kwargs: dict) -> str:
+    try:
+      return _tool._function(**_kwargs)
+    except Exception as e:
+      return f'to-Jay: ERROR returned: {[str(e)]}.'
+  
+  def _cancel_speculation(
+      self,
+      _speculation: dict):
+    # A speculative call that has not started is never run. A running call is told to stop, and its result is never used.
+    _speculation['cancel_event'].set()
+    _speculation['future'].cancel()
+    self._speculation_misses += 1
+  
+  def _cancel_speculations(self):
+    '''
+    Cancels every speculative call that was not used. This is done once the calls of a response have been run (or if there were no calls).
+    '''
+    with self._lock:
+      for _speculation in self._speculations.values():
+        self._cancel_speculation(_speculation)
+      self._speculations = {}
+  
+  def _is_concurrent(
+      self,
+      _call: str) -> bool:
+    '''
+    Whether a call is to a concurrent tool. Calls that cannot be parsed are run in the calling thread (where they fail immediately).
+    '''
+    _name = _call.split('(')[0].strip()
+    return _name in self._tools and self._tools[_name]._concurrent
+  
+  def _grammar(self) -> str:
+    '''
+    Writes a GBNF grammar (the grammar format of Llama_CPP) that only accepts valid calls, from the signature of every tool.
+    The grammar begins just after "to-system:", and accepts one or more calls, each ended with "END_FUNC".
+    Arguments are written as keywords, in the order of the signature. Arguments with a default value can be left out.
+    The type of each argument is read from its annotation (or its default value), and defaults to STR.
+    
+    Returns:
+     - _grammar (STR): The grammar, to be loaded with LlamaGrammar.from_string.
+    '''
+    _rules = ['root ::= " "? call " END_FUNC" (" to-system: " call " END_FUNC")*',
+              'call ::= ' + ' | '.join([self._grammar_rule_name(_name) for _name in self._tools.keys()])]
+    for _name, _tool in self._tools.items():
+      _parameters = []
+      for _parameter in _tool._signature.parameters.values():
+        if _parameter.name[:1] == '_':
+          continue
+        if _parameter.annotation is not inspect.Parameter.empty:
+          _type = _parameter.annotation
+        elif _parameter.default is not inspect.Parameter.empty:
+          _type = type(_parameter.default)
+        else:
+          _type = str
+        _value = {int: 'int', float: 'float', bool: 'bool', list: 'list'}.get(_type, 'string')
+        _parameters.append((f'"{_parameter.name} = " {_value}', _parameter.default is inspect.Parameter.empty))
+      _rules.append(' '.join([f'{self._grammar_rule_name(_name)} ::= "{_name}("', self._grammar_arguments(_parameters), '")"']).replace('  ', ' '))
+    _rules += ['string ::= "\\"" ([^"\\\\\\n] | "\\\\" [^\\n])* "\\"" | "\'" ([^\'\\\\\\n] | "\\\\" [^\\n])* "\'"',
+               'int ::= "-"? [0-9]+',
+               'float ::= "-"? [0-9]+ ("." [0-9]+)?',
+               'bool ::= "True" | "False"',
+               'list ::= "[" (value (", " value)*)? "]"',
+               'value ::= string | float']
+    return '\n'.join(_rules)
+  
+  def _grammar_rule_name(
+      self,
+      _name: str) -> str:
+    # GBNF rule names can only use letters, numbers and "-".
+    return 'fn' + _name.replace('_', '-')
+  
+  def _grammar_arguments(
+      self,
+      _parameters: list,
+      _first: bool = True) -> str:
+    '''
+    Writes the grammar of the arguments. Each parameter is (_grammar, _required).
+    The first argument that is written has no ", " before it.
+    '''
+    if len(_parameters) == 0:
+      return ''
+    if not _first:
+      return ' '.join([f'(", " {_argument})' + ('' if _required else '?') for _argument, _required in _parameters])
+    (_argument, _required), _rest = _parameters[0], _parameters[1:]
+    _with_argument = f'{_argument} {self._grammar_arguments(_rest, _first = False)}'.strip()
+    if _required:
+      return _with_argument
+    _without_argument = self._grammar_arguments(_rest)
+    if _without_argument == '':
+      return f'({_with_argument})?'
+    return f'(({_with_argument}) | {_without_argument})'
+  
+  def _timings(self) -> dict:
+    '''
+    Returns the statistics of every tool that has been called.
+    {_name: {'calls': INT, 'errors': INT, 'parse': FLOAT, 'validate': FLOAT, 'execute': FLOAT}}, where the times are the total seconds.
+    '''
+    return {_name: {'calls': _tool._calls, 'errors': _tool._errors, 'parse': _tool._parse_time, 'validate': _tool._validate_time, 'execute': _tool._execute_time}
+            for _name, _tool in self._tools.items() if _tool._calls > 0}
+
+class _ToolCallDetector():
+  def __init__(
+      self,
+      _on_call_arguments = None):
+    '''
+    Finds complete system calls in a streamed response.
+    Text is given to "_feed" as it is generated. Once "_feed" returns True, generation should be stopped, and the response cut at "_end".
+    
+    A call is complete once its brackets are closed (ignoring brackets inside quotes) and it is followed by "END_FUNC".
+    After a complete call, Jay can begin another call (see _ToolRegistry._call_batch). Any other text means Jay has finished calling system.
+    
+    Args:
+     - _on_call_arguments: A function that is given (_call_index, _call) whenever an argument of the call being written is finished (e.g. _ToolRegistry._speculate). Defaults to None.
+                           An argument is finished by its closing quote, a "," or the closing bracket of the call, so a partly written argument (e.g. "DAY = 1" of "DAY = 15") is never given.
+                           _call is the call so far, with its brackets closed (e.g. '_search_the_internet(QUESTION = "...")').
+    '''
+    self._on_call_arguments = _on_call_arguments
+    self._last_call_arguments = ''
+    self._text = ''
+    self._index = 0
+    self._state = 'text'
+    self._calls = []
+    # The index in the response just after the final "END_FUNC".
+    self._end = -1
+    self._stopped = False
+    
+    self._call_start = 0
+    self._call_end = 0
+    self._name = ''
+    self._depth = 0
+    self._quote = None
+    self._escaped = False
+  
+  def _feed(
+      self,
+      _text: str) -> bool:
+    '''
+    Reads the next piece of the response.
+    
+    Args:
+     - _text (STR): The newly generated text.
+    
+    Returns:
+     - _stop (BOOL): Whether every call is complete, and generation should be stopped.
+    '''
+    self._text += _text
+    while not self._stopped:
+      if self._state == 'text' and not self._read_text():
+        break
+      if self._state == 'call' and not self._read_call():
+        break
+      if self._state == 'end_func' and not self._read_end_func():
+        break
+      if self._state == 'after_call' and not self._read_after_call():
+        break
+    return self._stopped
+  
+  def _find_marker(self) -> int:
+    _indices = [self._text.find(_, self._index) for _ in ['to-system:', 'To-system:']]
+    _indices = [_ for _ in _indices if _ != -1]
+    return min(_indices) if len(_indices) > 0 else -1
+  
+  def _start_call(
+      self,
+      _index: int):
+    self._state = 'call'
+    self._index = _index + 10
+    self._call_start = self._index
+    self._name, self._depth, self._quote, self._escaped = '', 0, None, False
+  
+  def _waiting_for_call(self) -> bool:
+    '''
+    Whether "to-system:" has just been written, and nothing of the call has been written yet.
+    '''
+    return self._state == 'call' and self._text[self._call_start:].strip() == ''
+  
+  def _started_call_in(
+      self,
+      _start: int) -> bool:
+    '''
+    Whether "to-system:" ends at or after _start, and some of the call is already written after it (e.g. one token of ": _" completes "to-system:" and starts the call).
+    '''
+    return self._state in ['call', 'end_func'] and self._call_start >= _start and not self._waiting_for_call()
+  
+  def _rewind_to_call_start(self):
+    '''
+    Forgets the text after "to-system:", so the call is read again as it is generated (see _LlamaSession._stream).
+    '''
+    self._text = self._text[:self._call_start]
+    self._start_call(self._call_start - 10)
+  
+  def _read_text(self) -> bool:
+    '''
+    Looks for "to-system:". The final characters are kept, as they may be the beginning of "to-system:".
+    '''
+    _marker = self._find_marker()
+    if _marker == -1:
+      self._index = max(self._index, len(self._text) - 9)
+      return False
+    self._start_call(_marker)
+    return True
+  
+  def _read_call(self) -> bool:
+    '''
+    Reads the function name and arguments, until the brackets are closed.
+    If the text is not a function call (e.g. Jay is talking about "to-system:"), the detector goes back to looking for "to-system:".
+    '''
+    while self._index < len(self._text):
+      _character = self._text[self._index]
+      self._index += 1
+      if self._depth == 0:
+        if _character == '(' and self._name[:1] == '_':
+          self._depth = 1
+        elif _character.isalnum() or _character == '_':
+          self._name += _character
+        elif not (_character.isspace() and self._name == ''):
+          self._state = 'text'
+          self._index -= 1
+          return True
+      elif self._quote is not None:
+        if self._escaped:
+          self._escaped = False
+        elif _character == '\\':
+          self._escaped = True
+        elif _character == self._quote:
+          self._quote = None
+          if self._depth == 1:
+            self._report_call_arguments(self._text[self._call_start:self._index] + ')')
+      elif _character in ['"', "'"]:
+        self._quote = _character
+      elif _character == ',' and self._depth == 1:
+        self._report_call_arguments(self._text[self._call_start:self._index - 1] + ')')
+      elif _character in ['(', '[', '{']:
+        self._depth += 1
+      elif _character in [']', '}']:
+        self._depth -= 1
+      elif _character == ')':
+        self._depth -= 1
+        if self._depth == 0:
+          self._call_end = self._index
+          self._state = 'end_func'
+          self._report_call_arguments(self._text[self._call_start:self._call_end])
+          return True
+      # A call with unbalanced quotes or brackets is ended at "END_FUNC", so that system can return the error to Jay.
+      if self._text[self._index - 8:self._index] == 'END_FUNC':
+        self._call_end = self._index - 8
+        self._end_call()
+        return True
+    return False
+  
+  def _report_call_arguments(
+      self,
+      _call: str):
+    if self._on_call_arguments is not None and _call.strip() != self._last_call_arguments:
+      self._last_call_arguments = _call.strip()
+      self._on_call_arguments(len(self._calls), self._last_call_arguments)
+  
+  def _read_end_func(self) -> bool:
+    '''
+    Checks that the call is followed by "END_FUNC".
+    '''
+    while self._index < len(self._text) and self._text[self._index].isspace():
+      self._index += 1
+    _remaining = self._text[self._index:self._index + 8]
+    if _remaining == 'END_FUNC':
+      self._index += 8
+      self._end_call()
+      return True
+    if 'END_FUNC'[:len(_remaining)] == _remaining:
+      return False
+    # The call was never ended, so it is not a call.
+    self._state = 'text'
+    return True
+  
+  def _end_call(self):
+    self._calls.append(self._text[self._call_start:self._call_end].strip())
+    self._end = self._index
+    self._state = 'after_call'
+  
+  def _read_after_call(self) -> bool:
+    '''
+    After a complete call, either another call begins, or generation is stopped.
+    '''
+    while self._index < len(self._text) and self._text[self._index].isspace():
+      self._index += 1
+    _remaining = self._text[self._index:self._index + 10]
+    if _remaining in ['to-system:', 'To-system:']:
+      self._start_call(self._index)
+      return True
+    if len(_remaining) < 10 and ('to-system:'[:len(_remaining)] == _remaining or 'To-system:'[:len(_remaining)] == _remaining):
+      return False
+    self._stopped = True
+    return False
\ No newline at end of file
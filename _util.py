@@ -10,7 +10,10 @@ def _prompt_llama_cpp(
     _max_tokens: int = -1,
     _repeat_penalty: float = 1.1,
     _stream: bool = False,
-    _input_text: str = 'Streamed Text: "'):
+    _input_text: str = 'Streamed Text: "',
+    _session = None,
+    _tool_call_detector = None,
+    _tool_call_grammar = None):
   '''
   Generates a text output from a Llama_CPP llm.
   Either the output is streamed or generated statically.
@@ -27,6 +30,9 @@ def _prompt_llama_cpp(
    - _repeat_penalty: Defaults to 1.1.
    - _stream: Whether to stream the output.
    - _input_text: The beginning of the text to be streamed.
+   - _session: A _LlamaSession over _llm. If given, only the tokens that are not already in the KV cache are evaluated. Defaults to None.
+   - _tool_call_detector: A _ToolCallDetector. If given, the stream stops as soon as the model's system calls are complete. Only used when _stream is True. Defaults to None.
+   - _tool_call_grammar: A LlamaGrammar that system calls are sampled with. Only used with _session and _tool_call_detector. Defaults to None.
   
   Output:
    - _output: The generated output text.
@@ -67,8 +73,17 @@ def _prompt_llama_cpp(
         _stop_tokens = _stop_tokens,
         _max_tokens = _max_tokens,
         _repeat_penalty = _repeat_penalty,
-        _input_text = _input_text)
+        _input_text = _input_text,
+        _session = _session,
+        _tool_call_detector = _tool_call_detector,
+        _tool_call_grammar = _tool_call_grammar)
     _total_tokens = _completion_tokens + _prompt_tokens
+  elif _session is not None:
+    _output, _prompt_tokens, _completion_tokens, _total_tokens = _session._generate(
+        _prompt_input = _prompt_input,
+        _stop_tokens = _stop_tokens,
+        _max_tokens = _max_tokens,
+        _repeat_penalty = _repeat_penalty)
   else:
     _output_dict = _llm(
         _prompt_input,
@@ -90,7 +105,10 @@ def _stream_llama_cpp(
     _stop_tokens: list = ['<|eot_id|>'],
     _max_tokens: int = -1,
     _repeat_penalty: float = 1.1,
-    _input_text = 'Streamed Text: "'):
+    _input_text = 'Streamed Text: "',
+    _session = None,
+    _tool_call_detector = None,
+    _tool_call_grammar = None):
   '''
   Prints and streams the text from a Llama_CPP model.
   The text is subject to post-processing, so the output is not final.
@@ -105,6 +123,9 @@ def _stream_llama_cpp(
    - _stop_tokens: The stop tokens for the Llama_CPP model. Default model uses Llama3 stop-tokens.
    - _max_tokens: The maximum output tokens of the Llama_CPP model. Defaults to -1 (no maximum length).
    - _repeat_penalty: Defaults to 1.1.
+   - _session: A _LlamaSession over _llm. If given, only the tokens that are not already in the KV cache are evaluated. Defaults to None.
+   - _tool_call_detector: A _ToolCallDetector. If given, the stream stops as soon as the model's system calls are complete. Defaults to None.
+   - _tool_call_grammar: A LlamaGrammar that system calls are sampled with. Only used with _session and _tool_call_detector. Defaults to None.
   
   Output:
    - _output: The generated output text.
@@ -130,35 +151,56 @@ def _stream_llama_cpp(
   print(_completion_tokens)
   ```
   '''
-  _tokenized_input = _llm.tokenize(bytes(_prompt_input, 'utf-8'))
-  _prompt_tokens = len(_tokenized_input)
+  if _session is None:
+    _tokenized_input = _llm.tokenize(bytes(_prompt_input, 'utf-8'))
+    _prompt_tokens = len(_tokenized_input)
+    _streamed_text = (_token['choices'][0]['text'] for _token in _llm(
+        _prompt_input,
+        stop = _stop_tokens,
+        max_tokens = _max_tokens,
+        repeat_penalty = _repeat_penalty,
+        echo = False,
+        stream = True))
+  else:
+    _streamed_text = _session._stream(
+        _prompt_input = _prompt_input,
+        _stop_tokens = _stop_tokens,
+        _max_tokens = _max_tokens,
+        _repeat_penalty = _repeat_penalty,
+        _tool_call_detector = _tool_call_detector,
+        _tool_call_grammar = _tool_call_grammar)
   _output, _printable_streamed_text, _completion_tokens = '', _input_text, 0
-  for _token in _llm(
-      _prompt_input,
-      stop = _stop_tokens,
-      max_tokens = _max_tokens,
-      repeat_penalty = _repeat_penalty,
-      echo = False,
-      stream = True):
-    _output += _token['choices'][0]['text']
-    if '\n' in _token['choices'][0]['text']:
-      for _character in _token['choices'][0]['text']:
+  for _text in _streamed_text:
+    _output += _text
+    # The session runs the detector itself. Otherwise, the stream is stopped here once the system calls are complete.
+    _stop_stream = _session is None and _tool_call_detector is not None and _tool_call_detector._feed(_text)
+    if _stop_stream:
+      _text = _text[:max(0, len(_text) - (len(_output) - _tool_call_detector._end))]
+      _output = _output[:_tool_call_detector._end]
+    if '\n' in _text:
+      for _character in _text:
         if _character != '\n':
           _printable_streamed_text += _character
         else:
          sys.stdout.write(_print_function(f"{_printable_streamed_text}     \n ... \r")); sys.stdout.flush()
          _printable_streamed_text = ''
-    elif len(_printable_streamed_text + _token['choices'][0]['text'] + ' ... ') > _console_length:
-      _printable_streamed_text += _token['choices'][0]['text']
+    elif len(_printable_streamed_text + _text + ' ... ') > _console_length:
+      _printable_streamed_text += _text
       sys.stdout.write(_print_function(f"{_printable_streamed_text[:_console_length - 1]}\r"))
       sys.stdout.write(_print_function('\n \r'))
       _printable_streamed_text = _printable_streamed_text[_console_length - 1:]
     else:
-      _printable_streamed_text += _token['choices'][0]['text']
+      _printable_streamed_text += _text
     
     sys.stdout.write(_print_function(f"{_printable_streamed_text} ... \r"))
     sys.stdout.flush()
     _completion_tokens += 1
+    if _stop_stream:
+      _streamed_text.close()
+      break
   sys.stdout.write(_print_function(f"{_printable_streamed_text}\"     \n"))
   sys.stdout.flush()
+  if _session is not None:
+    # The session holds back text that could be a stop token, so the chunks are not always one token each.
+    _prompt_tokens, _completion_tokens = _session._prompt_tokens, _session._completion_tokens
   return _output, _prompt_tokens, _completion_tokens
\ No newline at end of file
@@ -5,16 +5,25 @@ import datetime
 import logging
 from termcolor import colored
 os.system('color')
-from llama_cpp import Llama
+from llama_cpp import LlamaGrammar
 
 from _agent_calculator import _agent_calculator_func
+from _answer_cache import _AnswerCache
+from _code_runner import _get_code_runner
+from _context_window import _ContextWindow
 from _google_calendar import Calendar
+from _journal import _TranscriptJournal, _read_journal, _journal_to_conversation
 from _news_download import _get_the_news as _get_the_news_fn
 from _query import _Query
 from _send_email import _timer_email
 from _send_email import _send_email as _send_email_fn
+from _server import _JayServer
 from _system_functions import NotePad, _load_file, _open_and_run_files, _load_music_file, Todo_List
+from _llama_session import _LlamaSession
+from _model_registry import _model_registry
+from _prefix_cache import _prefix_cache
 from _together_api import _API
+from _tool_registry import _ToolRegistry, _ToolCallDetector
 from _util import _prompt_llama_cpp
 
 logger = logging.getLogger()
@@ -40,7 +49,15 @@ class Jay():
       _model_path: str,
       _notepad_folder_name: str,
       _together_api_key: str,
-      _use_llm: str):
+      _use_llm: str,
+      _incremental_session: bool = True,
+      _kv_snapshot_folder: str = 'KV_Cache',
+      _context_budget_tokens: int = 24576,
+      _journal_fsync_policy: str = 'turn',
+      _resume_prompt_file: str = '',
+      _constrained_tool_calls: bool = False,
+      _speculative_tool_calls: bool = False,
+      _calculator_samples: int = 1):
     '''
     Jay is initialized here. The main LLM is loaded, the notepad, calendar and the Query class is initialized.
     
@@ -52,6 +69,14 @@ class Jay():
      - _notepad_folder_name: The folder that notes will be saved in.
      - _together_api_key: The API key for together.ai. Set to '' if not using together.ai
      - _use_llm: The base LLM model. Either 'llama-cpp-python' for local .gguf model, or 'together.ai' for online LLMs.
+     - _incremental_session: Only used with 'llama-cpp-python'. Whether the KV cache is kept between turns, so only the new part of the conversation is evaluated. Defaults to True.
+     - _kv_snapshot_folder: Only used with an incremental session. The folder that the KV cache of the system prompt is saved in, so it is not evaluated again every time Jay starts. Set to None to not use snapshots.
+     - _context_budget_tokens: The maximum size of the prompt. Once the conversation is larger than this, older turns and system results are summarized. Defaults to 24576 (3/4 of the 32768 token context, so there is room to generate).
+     - _journal_fsync_policy: When the conversation journal is forced onto the disk. Either 'always', 'turn' or 'never'. More information is found in _journal.py
+     - _resume_prompt_file: A journal (.jsonl) from a previous conversation, which is loaded and continued. Defaults to '' (a new conversation).
+     - _constrained_tool_calls: Only used with an incremental session. Whether system calls are sampled with a grammar of the system functions, so that every call Jay writes is valid. Defaults to False.
+     - _speculative_tool_calls: Whether searches (the internet, the news and the calendar) are started while Jay is still writing the call, so the search runs while Jay is generating. Defaults to False.
+     - _calculator_samples: The number of Coders that answer each calculator question at the same time, where the most common answer is used. Only used with 'together.ai'. Defaults to 1 (a single Coder, and the Refiner if its code fails).
     '''
     assert _use_llm in ['llama-cpp-python', 'together.ai']
     self._model_path = _model_path
@@ -61,9 +86,21 @@ class Jay():
     
     # Step (1): The logged conversations are prepared as an empty list, and the args are saved.
     self._use_llm = _use_llm
-    self._prompt_txt_file = f"Prompts\\prompt_{int(time.time())}.txt"
+    # The conversation is saved as an append-only journal. If a previous conversation is resumed, its journal is continued.
+    if _resume_prompt_file != '':
+      self._prompt_txt_file = _resume_prompt_file
+    else:
+      self._prompt_txt_file = f"Prompts\\prompt_{int(time.time())}.jsonl"
+    self._resume_prompt_file = _resume_prompt_file
+    self._journal_fsync_policy = _journal_fsync_policy
     self._notepad_folder_name = _notepad_folder_name
     self._together_api_key = _together_api_key
+    self._incremental_session = _incremental_session
+    self._kv_snapshot_folder = _kv_snapshot_folder
+    self._context_budget_tokens = _context_budget_tokens
+    self._constrained_tool_calls = _constrained_tool_calls
+    self._speculative_tool_calls = _speculative_tool_calls
+    self._calculator_samples = _calculator_samples
     
     # Step (2): The model is loaded, the model type and utils are logged.
     self._load_llm_model(
@@ -88,16 +125,31 @@ class Jay():
     self._util_print_color('self._load_calendar()', to_print = 0.0)
     
     # Step (5): The query model is loaded.
-    # Query does involve loading an LLM, but only as a last resort. The LLM is loaded only in the most extreme circumstances, and immediately deleted afterwards.
-    # As of 3/6/2024, the local model is a .gguf, which is very quick to load.
+    # With a local .gguf, _Query and the calculator share one context of the model from the model registry (see _model_registry.py), rather than each loading their own.
+    # The KV caches of their fixed system prompts are saved with Jay's snapshot (see _prefix_cache.py).
+    _prefix_cache._snapshot_folder = self._kv_snapshot_folder
     self._query_model = _Query(_print_function = self._util_print_color, _generation_model = self._use_llm, _generation_model_path = self._model_path, _together_api_key = self._together_api_key)
     self._util_print_color('self._load_query_model()', to_print = 0.0)
+    # Recent answers of "_search_the_internet" are cached, so the same question is not searched again (see _answer_cache.py).
+    self._answer_cache = _AnswerCache()
     
     # Step (6): The Todo list is loaded.
     # The Todo list is found at "Todo\\Todo_List.txt"
     self._todo = Todo_List()
     self._util_print_color('self._load_todo()', to_print = 0.0)
     
+    # Step (7): The system functions are registered, so that Jay can call them.
+    self._util_load_tools()
+    self._util_print_color('self._load_tools()', to_print = 0.0)
+    # The calculator's code runner is started now, so its workers have imported sympy and numpy before the first calculation.
+    _get_code_runner()
+    self._util_print_color('self._load_code_runner()', to_print = 0.0)
+    if self._use_llm == 'llama-cpp-python':
+      _model_report = _model_registry._report()
+      for _model in _model_report['models']:
+        self._util_print_color(f"|- Loaded Model: {_model['model']} ({_model['context']}, n_ctx = {_model['n_ctx']}) - {_model['load_time']} secs - Used by {_model['consumers']}", to_print = 1.0)
+      self._util_print_color(f"|- Resident Memory: {_model_report['resident_memory_mb']} MB", to_print = 1.0)
+    
   ##############################
   # PART (2) THE CHAT FUNCTION #
   ##############################
@@ -142,6 +194,7 @@ class Jay():
     self._util_print_dash()
     
     self._print_for_user('Output: {}'.format(_ai_response))
+    self._journal._close()
     
   #################################
   # PART (3) LOADING THE CHAT LLM #
@@ -163,18 +216,90 @@ class Jay():
       self._util_load_llama_gguf()
     elif _use_llm == 'together.ai':
       self._util_load_together()
+    self._util_load_context_window()
+    self._util_load_journal()
   
   def _util_load_llama_gguf(self):
     self._n_ctx_train = 32768
     self._conversation = self._util_prompt_model_llama3()
     _stt = time.time()
-    self._model = Llama(model_path = self._model_path, n_ctx = self._n_ctx_train, n_gpu_layers = 0, verbose = False)
+    # Jay has its own context, as the KV cache holds the conversation between turns.
+    self._model = _model_registry._get(_model_path = self._model_path, _consumer = 'Jay', _context_name = 'Jay', _n_ctx = self._n_ctx_train)._llm
     self._util_print_color(f"Model Loaded: {time.time() - _stt} secs", to_print = 0.0)
+    # The session keeps the evaluated conversation in the KV cache, so each turn only evaluates the text added since the last turn.
+    if self._incremental_session:
+      self._session = _LlamaSession(_llm = self._model)
+      self._model_utils['_LlamaSession'] = '_session'
+    else:
+      self._session = None
+    
+    # The system prompt and examples are restored from a snapshot on disk, if one was saved by a previous process.
+    # The date is not part of the snapshot, so the snapshot does not go stale.
+    if self._session is not None and self._kv_snapshot_folder is not None:
+      _snapshot_loaded, _time_taken = self._session._load_or_save_snapshot(
+          _snapshot_folder = self._kv_snapshot_folder,
+          _model_path = self._model_path,
+          _prompt_input = self._util_prompt_model_llama3_prefix())
+      if _snapshot_loaded:
+        self._util_print_color(f"System Prompt Snapshot Loaded: {_time_taken} secs", to_print = 0.0)
+      else:
+        self._util_print_color(f"System Prompt Evaluated and Snapshot Saved: {_time_taken} secs", to_print = 0.0)
     
   def _util_load_together(self):
     self._model = _API(_api_key = self._together_api_key, _model_name = self._model_path)
     self._model_utils[self._model_path] = '_model_name'
     self._conversation = self._util_prompt_model_llama3()
+    self._session = None
+  
+  def _util_load_context_window(self):
+    '''
+    The context window holds the prompt that is sent to the model, which is kept within _context_budget_tokens.
+    The system prompt is pinned. self._conversation still holds the full conversation, which is saved to file.
+    '''
+    if self._resume_prompt_file != '':
+      # The previous conversation is rebuilt from its journal. The first record is the starting prompt of that conversation.
+      _records = _read_journal(self._resume_prompt_file)
+      if len(_records) == 0 or not isinstance(_records[0], dict) or _records[0].get('type') != 'prompt':
+        # The journal is empty (or every line is half-written), or it does not start with a prompt, so there is nothing to resume. A new conversation is started in a new journal, and the old journal is left as it is.
+        self._util_print_color(f"|- {self._resume_prompt_file} Has No Conversation to Resume. A New Conversation is Started.", to_print = 1.0)
+        self._resume_prompt_file = ''
+        self._prompt_txt_file = f"Prompts\\prompt_{int(time.time())}.jsonl"
+    if self._resume_prompt_file != '':
+      self._conversation = _journal_to_conversation(_records)
+      self._context_window = _ContextWindow(
+          _pinned_prompt = _records[0]['text'],
+          _count_tokens = self._util_count_tokens,
+          _budget_tokens = self._context_budget_tokens)
+      for _record in _records[1:]:
+        self._context_window._append(_record['text'], _segment_type = _record['type'])
+      self._context_window._compact()
+      self._util_print_color(f"|- Resumed Conversation: {len(_records)} Records, {self._context_window._total_tokens()} Tokens", to_print = 1.0)
+    else:
+      self._context_window = _ContextWindow(
+          _pinned_prompt = self._conversation,
+          _count_tokens = self._util_count_tokens,
+          _budget_tokens = self._context_budget_tokens)
+  
+  def _util_load_journal(self):
+    '''
+    The journal saves the conversation to self._prompt_txt_file. Only the text added each turn is written.
+    '''
+    self._journal = _TranscriptJournal(
+        _filename = self._prompt_txt_file,
+        _fsync_policy = self._journal_fsync_policy)
+    if self._resume_prompt_file == '':
+      self._journal._append(self._conversation, _record_type = 'prompt')
+      self._journal._end_turn()
+  
+  def _util_count_tokens(
+      self,
+      string):
+    '''
+    Counts the tokens in a string. together.ai does not have a tokenizer available locally, so there are assumed to be about 4 characters per token.
+    '''
+    if self._use_llm == 'llama-cpp-python':
+      return len(self._model.tokenize(bytes(string, 'utf-8'), add_bos = False, special = True))
+    return len(string) // 4 + 1
   
   ##################################################################
   # PART (4) SENDING TEXT TO THE MODEL AND GENERATING THE RESPONSE #
@@ -199,7 +324,8 @@ class Jay():
         _prompt_input,
         _stop_tokens,
         _stream,
-        _max_tokens = -1):
+        _max_tokens = -1,
+        _tool_call_detector = None):
       if _use_llm in ['llama-cpp-python']:
         # llama-cpp generates the results from a .gguf file.
         def _print_function(_str):
@@ -210,25 +336,44 @@ class Jay():
             _prompt_input = _prompt_input,
             _stop_tokens = _stop_tokens,
             _max_tokens = _max_tokens,
-            _stream = _stream)
+            _stream = _stream,
+            _session = self._session,
+            _tool_call_detector = _tool_call_detector,
+            _tool_call_grammar = self._tool_call_grammar)
+        # The number of prompt tokens that were already in the KV cache, and did not need to be evaluated.
+        _hit = 0 if self._session is None else self._session._prefix_hit_tokens
+        if self._session is not None and self._session._diverged:
+          self._util_print_color(f"|- Session prefix diverged, {_hit} tokens reused", to_print = 0.0)
       elif _use_llm in ['together.ai']:
         # together.ai is used.
-        _assistant_output, _pt, _ct, _tt, _ = self._model(_prompt_input, _stop = _stop_tokens, _max_tokens = _max_tokens)
-      return _assistant_output, _pt, _ct, _tt
+        _assistant_output, _pt, _ct, _tt, _ = self._model(_prompt_input, _stop = _stop_tokens, _max_tokens = _max_tokens, _tool_call_detector = _tool_call_detector)
+        _hit = 0
+      return _assistant_output, _pt, _ct, _tt, _hit
     
     # Step (1): The previous prompt is added to _conversation.
-    _add_nc_for_system = False
-    
     self._conversation += _input 
     self._conversation += '<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t'
     
+    # Step (2): The prompt is added to the context window. System results begin with "(to-Jay:", and everything else is from the user.
+    # If the context window is over budget, older turns are summarized.
+    _input_type = 'tool' if _input[:8] == '(to-Jay:' else 'user'
+    self._context_window._append(_input + '<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t', _segment_type = _input_type)
+    self._journal._append(_input + '<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>\n\n\t', _record_type = _input_type)
+    _tokens_before_compaction = self._context_window._total_tokens()
+    if self._context_window._compact():
+      self._util_print_color(f"|- Context Compacted: {_tokens_before_compaction} -> {self._context_window._total_tokens()} tokens", to_print = 1.0)
+    
     # Step (3): The assistant's prompt is generated.
+    # The tool call detector reads the response as it is generated, and stops generation as soon as Jay's system calls are complete ("to-system: _function(...) END_FUNC").
     _stt = time.time()
-    _assistant_output, _pt, _ct, _tt = _generate_response(
+    # If speculation is used, searches are started as soon as their arguments are written, before the call is finished.
+    _tool_call_detector = _ToolCallDetector(_on_call_arguments = self._tools._speculate if self._speculative_tool_calls else None)
+    _assistant_output, _pt, _ct, _tt, _hit = _generate_response(
         _use_llm = self._use_llm,
-        _prompt_input = self._conversation,
-        _stop_tokens = ['<|eot_id|>\n', 'NC(to-Jay:'],
-        _stream = True)
+        _prompt_input = self._context_window._prompt(),
+        _stop_tokens = ['<|eot_id|>\n', '<|eot_id|>'],
+        _stream = True,
+        _tool_call_detector = _tool_call_detector)
     # The model is prompted to have an internal monologue before it responds to the user.
     # The internal monologue happens inside the tags <jay_internal> and </jay_internal>.
     # This allows the model to get it's thoughts clear before it answers the user.
@@ -236,9 +381,6 @@ class Jay():
     # When the response is printed, the tags are printed in red, so that the user can identify when there is an issue with printing the tags.
     # Sometimes, the model will forget to use the end of internal monologue tag and immediately respond to the user. This does not break the code, but it is technically improper prompting behaviour.
     
-    if _assistant_output[-6:] == 'END_FU':
-      _assistant_output += 'NC'
-      _add_nc_for_system = True
     _assistant_output = _assistant_output.replace('To-system:', 'to-system:')
     if _assistant_output.replace(' ', '').replace('\n', '')[-10:] == '</EXAMPLE>':
       _assistant_output = _assistant_output[:-10]
@@ -246,26 +388,15 @@ class Jay():
       _assistant_output = _assistant_output[:-8]
     
     # Step (4): The model decides whether it's prompt will call system.
-    # If:
-    #   - If there is no "to-system:" in the prompt, then system is not being called.
-    #   - All functions that system can call begin with "_" (e.g. _add_calendar_event, _calculator, etc), so if the next character after "to-system:" is not "_", then no system function is being called. All functions also require "(" after the function name, and ") END_FUNC" after the function arguments.
-    #   - If the first characters from prompt (excluding whitespace) is "to-system:_", then we assume the model is calling a system function.
-    #   - If the characters "to-system:_" is present but not at the beginning of the text, the model is asked to clarify whether a system function should be called (TRUE) or not (FALSE).
-    #   - If the prompt ended with "END_FUNC", then there is a to system call.
-    # If a system function is being called, the end of the function (END_FUNC) is used to cut off the end of the prompt. The system response immediately follows the function being called.
-    if 'to-system:' in _assistant_output:
-      _system_call = _assistant_output.split('to-system:')[1].replace(' ', '')[0] == '_'
-      _potential_system_call = _assistant_output.split('to-system:')[1]
-      _potential_system_call_split_words = [_ for _ in _potential_system_call.split(' ') if _ != '']
-      if _system_call:
-        _system_call = '(' in _potential_system_call_split_words[0]
-      if _system_call:
-        _system_call = _add_nc_for_system
-    else:
-      _system_call = False
+    # System is called if the tool call detector found a complete call: "to-system:", a function name beginning with "_" (e.g. _add_calendar_event, _calculator, etc), the arguments in brackets, and "END_FUNC".
+    # If a system function is being called, the response has already been cut off after the final "END_FUNC". The system response immediately follows the function being called.
+    _system_call = len(_tool_call_detector._calls) > 0
+    if not _system_call:
+      self._tools._cancel_speculations()
     
     if _system_call:    
-      _assistant_output = _assistant_output.split('END_FUNC')[0]
+      # Everything up to the final "END_FUNC" is kept, as Jay can call several functions at once.
+      _assistant_output = _assistant_output[:_assistant_output.rfind('END_FUNC')]
       if _assistant_output[-1] == ' ':
         _assistant_output += 'END_FUNC'
       else:
@@ -273,18 +404,21 @@ class Jay():
     
     # Step (5): Prompt generation statistics are presented.
     _time_taken = round(time.time() - _stt, 4)
-    self._util_print_color(f"|- {_time_taken} secs, P:{_pt} - Comp:{_ct} - Total:{_tt}", to_print = 2.0)
+    self._util_print_color(f"|- {_time_taken} secs, P:{_pt} - Hit:{_hit} - Comp:{_ct} - Total:{_tt}", to_print = 2.0)
     self._util_print_color('====================', to_print = 2.0)
     
     # Step (6): The prompt is added to _conversation.
     self._conversation += _assistant_output
     if not _system_call:
       self._conversation += '<|eot_id|>\n<|start_header_id|>user<|end_header_id|>\n\n\t'
+      _assistant_text = _assistant_output + '<|eot_id|>\n<|start_header_id|>user<|end_header_id|>\n\n\t'
+    else:
+      _assistant_text = _assistant_output
+    self._context_window._append(_assistant_text, _segment_type = 'assistant')
     
-    # Step (7): _conversation is saved, and the model's output and whether system should be called are returned.
-    f = open(self._prompt_txt_file, 'w', encoding = 'utf-8')
-    f.write(self._conversation)
-    f.close()
+    # Step (7): The turn is appended to the journal, and the model's output and whether system should be called are returned.
+    self._journal._append(_assistant_text, _record_type = 'assistant')
+    self._journal._end_turn()
     return _assistant_output, _system_call
   
   ########################################################
@@ -298,6 +432,30 @@ class Jay():
     The model-to-system output is analysed here.
     Only output that contains the str 'to-system:' is sent here.
     '''
+    _user_output, _next_comment = self._run_system_calls(_ai_response)
+    if len(_user_output) > 0:
+      self._print_for_user('Output: {}'.format(_user_output))
+    _ai_response, _send_to_system = self._send_and_respond(_input = _next_comment)
+    if _send_to_system:
+      _ai_response = self._model_to_system_communication(_ai_response)
+    return _ai_response
+  
+  def _run_system_calls(
+      self,
+      _ai_response,
+      _remote: bool = False) -> tuple:
+    '''
+    Runs the system calls in Jay's output. This does not use the conversation, so it can be run outside of "_send_and_respond" (e.g. by _JayServer, while another conversation is using the model).
+    
+    Args:
+     - _ai_response (STR): Jay's output.
+     - _remote (BOOL): Whether the output is from a remote conversation (see _JayServer), where functions that need the user at this computer are refused. Defaults to False.
+    
+    Returns:
+     - _user_output (STR): The part of the output before "to-system:", which is said to the user. '' if there is none.
+     - _next_comment (STR): The "(to-Jay: ...)." results, to be sent to Jay.
+    '''
+    _user_output = ''
     if 'END_FUNC' in _ai_response:
       _ai_response = _ai_response.replace('END_FUNC', '')
     #if '<function = True>' in _ai_response:
@@ -313,8 +471,8 @@ class Jay():
           _user_output = _user_output[1:]
           if len(_user_output) == '':
              break
-        if len(_user_output) > 0:
-          self._print_for_user('Output: {}'.format(_user_output))
+      else:
+        _user_output = ''
       
       _system_comm = ['to-system:'] + _system_comm
       _system_comm = ''.join(_system_comm)
@@ -338,188 +496,148 @@ class Jay():
     _system_call_str = '|- ' + _system_comm + ' END_FUNC'
     self._util_print_color(_system_call_str.replace('  ', ' '), to_print = 2.0)
     
-    # Step (3): The selected function is activated here.
-    if '_add_calendar_event' in _system_comm.split('(')[0]:
-      _next_comment = self._util_add_calendar_event(_system_comm)
-    
-    elif '_calculator' in _system_comm.split('(')[0]:
-      _next_comment = self._util_calculator(_system_comm)
-      
-    elif '_get_the_news' in _system_comm.split('(')[0]:
-      _next_comment = self._util_get_the_news(_system_comm)
-    
-    elif '_open_file_for_user' in _system_comm.split('(')[0]:
-      _next_comment = self._util_open_file_for_user(_system_comm)
-    
-    elif '_play_music' in _system_comm.split('(')[0]:
-      _next_comment = self._util_play_music(_system_comm)
-      
-    elif '_read_file_for_AI' in _system_comm.split('(')[0]:
-      _next_comment = self._util_read_file_for_AI(_system_comm)
-      
-    elif '_save_note' in _system_comm.split('(')[0]:
-      _next_comment = self._util_save_note(_system_comm)
-      
-    elif '_search_calendar' in _system_comm.split('(')[0]:
-      _next_comment = self._util_search_calendar(_system_comm)
-        
-    elif '_search_the_internet' in _system_comm.split('(')[0]:
-      _next_comment = self._util_search_the_internet(_system_comm)
-      
-    elif '_send_email' in _system_comm.split('(')[0]:
-      _next_comment = self._util_send_email(_system_comm)
-        
-    elif '_set_timer' in _system_comm.split('(')[0]:
-      _next_comment = self._util_set_timer(_system_comm)
-        
-    elif '_time' in _system_comm.split('(')[0]:
-      _next_comment = self._util_time(_system_comm)
-    
-    elif '_todo_list_add' in _system_comm.split('(')[0]:
-      _next_comment = self._util_todo_list_add(_system_comm)
-    
-    elif '_todo_list_delete' in _system_comm.split('(')[0]:
-      _next_comment = self._util_todo_list_delete(_system_comm)
-    
-    elif '_todo_list_read' in _system_comm.split('(')[0]:
-      _next_comment = self._util_todo_list_read(_system_comm)
-      
+    # Step (3): The selected function is parsed, checked and run by the tool registry.
+    # If Jay made several independent calls in one response, they are run at the same time, and every result is returned to Jay in one turn.
+    _calls = self._tools._split_calls(_system_comm)
+    if len(_calls) > 1:
+      _stt = time.time()
+      _next_comments = self._tools._call_batch(_calls, _remote = _remote)
+      self._util_print_color(f"|- {len(_calls)} System Functions Run Concurrently: {round(time.time() - _stt, 4)} secs", to_print = 1.0)
     else:
-      _next_comment = f'to-Jay: ERROR Returned: "{_system_comm.split("(")[0]}" Is Not a System Function.'
-    
-    self._util_print_color(f"|- {_next_comment}"[:100], to_print = 2.0)
-    _next_comment = f'({_next_comment}). '
-    _ai_response, _send_to_system = self._send_and_respond(_input = _next_comment)
-    if _send_to_system:
-      _ai_response = self._model_to_system_communication(_ai_response)
-    return _ai_response
+      _next_comments = [self._tools._call(''.join(_calls), _remote = _remote)]
+    self._tools._cancel_speculations()
+    _tool_timings = self._tools._timings()
+    self._util_print_color(f"|- Tool Timings (Total secs): {_tool_timings}", to_print = 0.0)
+    if self._speculative_tool_calls:
+      self._util_print_color(f"|- Speculative Calls: {self._tools._speculation_hits} Used - {self._tools._speculation_misses} Cancelled", to_print = 0.0)
+    
+    for _next_comment in _next_comments:
+      self._util_print_color(f"|- {_next_comment}"[:100], to_print = 2.0)
+    _next_comment = ' '.join([f'({_next_comment}).' for _next_comment in _next_comments]) + ' '
+    return _user_output, _next_comment
   
   #############################
   # PART (6) SYSTEM FUNCTIONS #
   #############################
   
+  def _util_load_tools(self):
+    '''
+    Every system function is registered with the tool registry.
+    The arguments that Jay can use for each function are read from the signature of the "_util" method.
+    '''
+    # Functions that ask the user for input (_play_music, _save_note), or that write to a shared file (the to-do list), are never run at the same time as other functions.
+    # Functions that need the user at this computer (asking at the console, or opening a file on the screen) are refused for remote conversations (see _JayServer).
+    # Functions that only search for information can be started speculatively, before Jay has finished writing the call.
+    self._tools = _ToolRegistry()
+    self._tools._register('_add_calendar_event', self._util_add_calendar_event, _concurrent = False)
+    self._tools._register('_calculator', self._util_calculator)
+    self._tools._register('_get_the_news', self._util_get_the_news)
+    self._tools._register('_open_file_for_user', self._util_open_file_for_user, _concurrent = False, _interactive = True)
+    self._tools._register('_play_music', self._util_play_music, _concurrent = False, _interactive = True)
+    self._tools._register('_read_file_for_AI', self._util_read_file_for_AI)
+    self._tools._register('_save_note', self._util_save_note, _concurrent = False, _interactive = True)
+    self._tools._register('_search_calendar', self._util_search_calendar)
+    self._tools._register('_search_the_internet', self._util_search_the_internet, _argument_aliases = {'QUERY': 'QUESTION'}, _speculative = True)
+    self._tools._register('_send_email', self._util_send_email, _concurrent = False)
+    self._tools._register('_set_timer', self._util_set_timer, _concurrent = False)
+    self._tools._register('_time', self._util_time)
+    self._tools._register('_todo_list_add', self._util_todo_list_add, _concurrent = False)
+    self._tools._register('_todo_list_delete', self._util_todo_list_delete, _concurrent = False)
+    self._tools._register('_todo_list_read', self._util_todo_list_read, _concurrent = False)
+    
+    # If tool calls are constrained, a grammar is written from the signatures above. Once Jay writes "to-system:", Jay can only write a valid call.
+    self._tool_call_grammar = None
+    if self._constrained_tool_calls and self._session is not None:
+      self._tool_call_grammar = LlamaGrammar.from_string(self._tools._grammar(), verbose = False)
+      self._util_print_color('|- _tool_call_grammar', to_print = 0.0)
+  
   def _util_add_calendar_event(
       self,
-      _system_comm):
+      EVENT_NAME: str,
+      LENGTH_MINUTES: int,
+      MINUTE: int,
+      HOUR: int,
+      DAY: int = -1,
+      MONTH: int = -1,
+      YEAR: int = -1):
     '''
     Adds an event to the calendar.
     
     _add_calendar_event(EVENT_NAME: str, LENGTH_MINUTES: int, MINUTE: int, HOUR: int, DAY: int = 8, MONTH: int = 6, YEAR: int = 2024)
     '''
-    
-    def _add_calendar_event(EVENT_NAME: str, LENGTH_MINUTES: int, MINUTE: int, HOUR: int, DAY: int = -1, MONTH: int = -1, YEAR: int = -1):
-      if DAY == -1:
-        DAY = datetime.date.today().day
-      if MONTH == -1:
-        MONTH = datetime.date.today().month
-      if YEAR == -1:
-        YEAR = datetime.date.today().year
-      
-      _calendar_placement = self._calendar._add_calendar_event(
-          _event_name = EVENT_NAME, 
-          _minute = MINUTE, 
-          _hour = HOUR, 
-          _day = DAY, 
-          _month = MONTH, 
-          _year = YEAR,
-          _print_function = self._util_print_color,
-          _length_event = LENGTH_MINUTES)
-      return f'to-Jay: {[_calendar_placement]}.\n'
-      
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}.\n"
-    return _next_comment
+    if DAY == -1:
+      DAY = datetime.date.today().day
+    if MONTH == -1:
+      MONTH = datetime.date.today().month
+    if YEAR == -1:
+      YEAR = datetime.date.today().year
+    
+    _calendar_placement = self._calendar._add_calendar_event(
+        _event_name = EVENT_NAME, 
+        _minute = MINUTE, 
+        _hour = HOUR, 
+        _day = DAY, 
+        _month = MONTH, 
+        _year = YEAR,
+        _print_function = self._util_print_color,
+        _length_event = LENGTH_MINUTES)
+    return f'to-Jay: {[_calendar_placement]}.\n'
   
   def _util_calculator(
       self,
-      _system_comm):
+      MATH: str):
     '''
     Answers a math question, by sending the question to an LLM that creates a python code to answer the question.
     Not 100% accurate, feel free to double check.
     
     _calculator(QUESTION: str)
     '''
-    def _calculator(MATH: str):
-      _answer, _calculator_code = _agent_calculator_func(_math_input = MATH, _print_function = self._util_print_color, _model_file = self._use_llm, _model_path = self._model_path, _together_api_key = self._together_api_key)
-      return f"to-Jay: {[_answer]}."
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    _answer, _calculator_code = _agent_calculator_func(_math_input = MATH, _print_function = self._util_print_color, _model_file = self._use_llm, _model_path = self._model_path, _together_api_key = self._together_api_key, _samples = self._calculator_samples)
+    return f"to-Jay: {[_answer]}."
   
   def _util_get_the_news(
       self,
-      _system_comm):
+      COUNTRY: str = 'Australia'):
     '''
     Gets the news, given the country.
     
     _get_the_news(COUNTRY: str = 'Australia')
     '''
-    def _get_the_news(COUNTRY: str = 'Australia'):
-      _news_head_lines, _news_descriptions = _get_the_news_fn(COUNTRY, _print_function = self._util_print_color)
-      if len(_news_head_lines) != 1:
-        self._util_print_color(f"Number of Extracted Headlines: {len(_news_head_lines)}", to_print = 0.0)
-      else:
-        self._util_print_color(f"Extracted: {_news_head_lines[0]}", to_print = 0.0)
-      return f'to-Jay: {_news_head_lines}. If the user has requested the news, please return to the user in a bullet point list.'
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    _news_head_lines, _news_descriptions = _get_the_news_fn(COUNTRY, _print_function = self._util_print_color)
+    if len(_news_head_lines) != 1:
+      self._util_print_color(f"Number of Extracted Headlines: {len(_news_head_lines)}", to_print = 0.0)
+    else:
+      self._util_print_color(f"Extracted: {_news_head_lines[0]}", to_print = 0.0)
+    return f'to-Jay: {_news_head_lines}. If the user has requested the news, please return to the user in a bullet point list.'
     
   def _util_open_file_for_user(
       self,
-      _system_comm):
+      FILE: str):
     '''
     Opens file for the user.
     
     _open_file_for_user(NAME: str)
     '''
-    def _open_file_for_user(FILE: str):
-      try:
-        _load_file = _open_and_run_files(FILE)
-        return 'to-Jay: ["File has been opened for the user."]'
-      except:
-        return f"to-Jay: ERROR returned: File {FILE} was not found. Ask the user for further clarification."
-    
     try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+      _load_file = _open_and_run_files(FILE)
+      return 'to-Jay: ["File has been opened for the user."]'
+    except:
+      return f"to-Jay: ERROR returned: File {FILE} was not found. Ask the user for further clarification."
     
   def _util_play_music(
       self,
-      _system_comm):
+      KEYWORDS = ''):
     '''
     Plays music from a pre-defined playlist.
     The music files (e.g. youtube videos, .mp3 files) should be found the file "..\\Music\\Music_File.csv".
     
     _play_music()
     '''
-    def _play_music(KEYWORDS = ''):
-      return _load_music_file(_keyword = KEYWORDS)
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    return _load_music_file(_keyword = KEYWORDS)
     
   def _util_read_file_for_AI(
       self,
-      _system_comm):
+      FILE: str):
     '''
     Loads a file and feeds the file into the AI's context. Only works with files that can be read with a "read()" function (e.g. .txt file).
     
@@ -527,54 +645,42 @@ class Jay():
     
     _read_file_for_AI(NAME: str)
     '''
-    def _read_file_for_AI(FILE: str):
-      try:
-        _file_to_read = _load_file(FILE)
-        self._util_print_color(f"File Loaded: {str(_file_to_read)[:100]}", to_print = 0.0)
-        return f'to-Jay: File: {[_file_to_read]}'
-      except:
-        return f"to-Jay: ERROR returned: File {FILE} was not found. Ask the user for further clarification."
-      
     try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+      _file_to_read = _load_file(FILE)
+      self._util_print_color(f"File Loaded: {str(_file_to_read)[:100]}", to_print = 0.0)
+      return f'to-Jay: File: {[_file_to_read]}'
+    except:
+      return f"to-Jay: ERROR returned: File {FILE} was not found. Ask the user for further clarification."
   
   def _util_save_note(
       self,
-      _system_comm):
+      TITLE: str,
+      BODY: str,
+      FORMAT: str = '.txt'):
     '''
     Saves a note, given a title and body.
     If the information should be beefed up, ask Jay to expand on notes.
     
     _save_note(TITLE: str, BODY: str, FORMAT: str = '.txt')
     '''
-    def _save_note(TITLE: str, BODY: str, FORMAT: str = '.txt'):
-      _should_take_notes = input('to-user: Save note (T\F): ').lower()
-      if _should_take_notes in ['t', 'y', 'true', 'yes']:
-        self._util_print_color('|- NOTE SAVED', to_print = 0.0)
-        _note_taken = self._notepad._save_note(
-            title = TITLE,
-            body = BODY,
-            _format = FORMAT)
-      else:
-        self._util_print_color('NOTE WASN\'T SAVED BY USER\'S REQUEST', 'red', to_print = 2.0)
-        _note_taken = 'Note saved.'
-      _next_comment = f"to-Jay: {[_note_taken]}"
-      return _next_comment
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
+    _should_take_notes = input('to-user: Save note (T\\F): ').lower()
+    if _should_take_notes in ['t', 'y', 'true', 'yes']:
+      self._util_print_color('|- NOTE SAVED', to_print = 0.0)
+      _note_taken = self._notepad._save_note(
+          title = TITLE,
+          body = BODY,
+          _format = FORMAT)
+    else:
+      self._util_print_color('NOTE WASN\'T SAVED BY USER\'S REQUEST', 'red', to_print = 2.0)
+      _note_taken = 'Note saved.'
+    _next_comment = f"to-Jay: {[_note_taken]}"
     return _next_comment
     
   def _util_search_calendar(
       self,
-      _system_comm):
+      DAY: int  = -1,
+      MONTH: int = -1,
+      YEAR: int = -1):
     '''
     Searches the calendar.
     It can either search the calendar for an event name, or for a time.
@@ -582,175 +688,122 @@ class Jay():
     
     _search_calendar(EVENT_NAME: str = '', MINUTE: int = -1, HOUR: int = -1, DAY: int = -1, MONTH: int = -1, YEAR: int = -1)
     '''
-    def _search_calendar(DAY: int  = -1, MONTH: int = -1, YEAR: int = -1):
-      if DAY == -1:
-        DAY = datetime.date.today().day
-      if MONTH == -1:
-        MONTH = datetime.date.today().month
-      if YEAR == -1:
-        YEAR = datetime.date.today().year
-      _calendar_placement = self._calendar._search_calendar_for_day(
-          _day = DAY, 
-          _month = MONTH, 
-          _year = YEAR)
-      if len(_calendar_placement) == 0:
-        _calendar_placement = 'Calendar is empty for the stated time period'
-      return f'to-Jay: {_calendar_placement}.'
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    if DAY == -1:
+      DAY = datetime.date.today().day
+    if MONTH == -1:
+      MONTH = datetime.date.today().month
+    if YEAR == -1:
+      YEAR = datetime.date.today().year
+    _calendar_placement = self._calendar._search_calendar_for_day(
+        _day = DAY, 
+        _month = MONTH, 
+        _year = YEAR)
+    if len(_calendar_placement) == 0:
+      _calendar_placement = 'Calendar is empty for the stated time period'
+    return f'to-Jay: {_calendar_placement}.'
     
   def _util_search_the_internet(
       self,
-      _system_comm):
+      QUESTION: str,
+      URLs: list = [],
+      _cancel_event = None):
     '''
     Searches the internet.
+    _cancel_event is set if the search was started speculatively, and Jay did not make the call.
     
     _search_the_internet(QUESTION: str)
     '''
-    def _search_the_internet(QUESTION: str, URLs: list = []):
-      _answer = self._query_model.call(_query = QUESTION, _urls = URLs)
-      return f"to-Jay: {_answer}. Use this information to respond to the user's question. Ensure you only return information that \"_search_the_internet\" has provided you, and state where you are using which reference (e.g. <1> and <2>). DO NOT REPEAT THE QUESTION OR FUNCTION."
-    
-    _system_comm = _system_comm.replace('_search_the_internet(QUERY', '_search_the_internet(QUESTION')
-    if True: #try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    else: #except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    if len(URLs) == 0:
+      _answer = self._answer_cache._call(
+          _query = QUESTION,
+          _search = lambda _query, _cancel_event: self._query_model.call(_query = _query, _cancel_event = _cancel_event, _number_references = False),
+          _cancel_event = _cancel_event,
+          _number_references = self._query_model._number_references)
+      self._util_print_color(f'|- Answer Cache: {self._answer_cache._stats()}', to_print = 0.0)
+    else:
+      _answer = self._query_model.call(_query = QUESTION, _urls = URLs, _cancel_event = _cancel_event)
+    return f"to-Jay: {_answer}. Use this information to respond to the user's question. Ensure you only return information that \"_search_the_internet\" has provided you, and state where you are using which reference (e.g. <1> and <2>). DO NOT REPEAT THE QUESTION OR FUNCTION."
     
   def _util_send_email(
       self,
-      _system_comm):
+      CONTACT_NAME: str,
+      SUBJECT: str,
+      BODY: str):
     '''
     Sends an email.
     The contact must be a predefined contact, Jay cannot send an email to an email address without the user's previous approval.
     
     _send_email(CONTACT_NAME: str, SUBJECT: str, BODY: str)
     '''
-    def _send_email(CONTACT_NAME: str, SUBJECT: str, BODY: str):
-      _possible_contacts = _email_contacts()
-      # _email_contacts should return a dict {CONTACT_NAME: EMAIL_ADDRESS}.
-      if CONTACT_NAME in _possible_contacts.keys():
-        _send_email_fn(_subject = SUBJECT, _body = BODY, _print_function = self._util_print_color, _contact = _possible_contacts[CONTACT_NAME], _sender_email = self._email_address, _sender_email_pwd = self._email_pwd)
-        return "to-Jay: ['Email Successfully Sent']. Please return this information to the user."
-      return f'to-Jay: ERROR: {CONTACT_NAME} is not in a contact. Ask the user for further clarification.'
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    _possible_contacts = _email_contacts()
+    # _email_contacts should return a dict {CONTACT_NAME: EMAIL_ADDRESS}.
+    if CONTACT_NAME in _possible_contacts.keys():
+      _send_email_fn(_subject = SUBJECT, _body = BODY, _print_function = self._util_print_color, _contact = _possible_contacts[CONTACT_NAME], _sender_email = self._email_address, _sender_email_pwd = self._email_pwd)
+      return "to-Jay: ['Email Successfully Sent']. Please return this information to the user."
+    return f'to-Jay: ERROR: {CONTACT_NAME} is not in a contact. Ask the user for further clarification.'
   
   def _util_set_timer(
       self,
-      _system_comm):
+      MINUTES: int):
     '''
     Sets a timer.
     As of 13/6/2024, this doesn't work. The function always returns true, but there is no timer function.
     
     _set_timer(MINUTES: int)
     '''
-    def _set_timer(MINUTES: int):
-      from threading import Thread
-      from time import sleep
-      
-      def _thread_timer_email_fn():
-        sleep(MINUTES * 60)
-        _timer_email(MINUTES = MINUTES, _email_address = self._email_address, _email_pwd = self._email_pwd)
-        sys.exit()
-      
-      _timer_thread = Thread(target = _thread_timer_email_fn)
-      _timer_thread.start()
-      return "to-Jay: ['Timer Set']"
+    from threading import Thread
+    from time import sleep
     
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    def _thread_timer_email_fn():
+      sleep(MINUTES * 60)
+      _timer_email(MINUTES = MINUTES, _email_address = self._email_address, _email_pwd = self._email_pwd)
+      sys.exit()
+    
+    _timer_thread = Thread(target = _thread_timer_email_fn)
+    _timer_thread.start()
+    return "to-Jay: ['Timer Set']"
   
-  def _util_time(
-      self,
-      _system_comm):
+  def _util_time(self):
     '''
     Tells the time, using time.asctime().
     
     _time()
     '''
-    def _time():
-      return f"to-Jay: Time and Date is {[time.asctime()]}."
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f"to-Jay: ERROR returned: {[_next_comment]}."
-    return _next_comment
+    return f"to-Jay: Time and Date is {[time.asctime()]}."
   
   def _util_todo_list_add(
       self,
-      _system_comm):
+      ELEMENT):
     '''
-    '''
-    def _todo_list_add(ELEMENT):
-      self._todo._add_element(_element = ELEMENT)
-      return 'to-Jay: To-Do Element Added.'
+    Adds an element to the To-Do list.
     
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f'to-Jay: ERROR returned: {[_next_comment]}.'
-    return _next_comment
+    _todo_list_add(ELEMENT)
+    '''
+    self._todo._add_element(_element = ELEMENT)
+    return 'to-Jay: To-Do Element Added.'
   
   def _util_todo_list_delete(
       self,
-      _system_comm):
+      ELEMENT):
     '''
     Deletes an element from the To-Do list
     
     _todo_list_delete()
     '''
-    def _todo_list_delete(ELEMENT):
-      _delete_check = self._todo._delete_element(_element = ELEMENT)
-      if _delete_check:
-        return 'to-Jay: To-Do Element Deleted.'
-      else:
-        return 'to-Jay: Element Deletion Failed. Please inform the user.'
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f'to-Jay: ERROR returned: {[_next_comment]}.'
-    return _next_comment
+    _delete_check = self._todo._delete_element(_element = ELEMENT)
+    if _delete_check:
+      return 'to-Jay: To-Do Element Deleted.'
+    else:
+      return 'to-Jay: Element Deletion Failed. Please inform the user.'
   
-  def _util_todo_list_read(
-      self,
-      _system_comm):
+  def _util_todo_list_read(self):
     '''
     Reads the To-Do list for Jay to access.
     
     _todo_list_read()
     '''
-    def _todo_list_read():
-      _todo_list = self._todo._read_list()
-      return f'to-Jay: To-Do: "{_todo_list}".'
-    
-    try:
-      _next_comment = eval(_system_comm.replace('to-system:', ''))
-    except Exception as e:
-      _next_comment = str(e)
-      _next_comment = f'to-Jay: ERROR returned: {[_next_comment]}.'
-    return _next_comment
+    _todo_list = self._todo._read_list()
+    return f'to-Jay: To-Do: "{_todo_list}".'
   
   ###########################
   # PART (7) UTIL FUNCTIONS #
@@ -813,15 +866,15 @@ Jay ALWAYS uses system functions whenever it makes sense to do so.
 If Jay wants to use system, you MUST use the phrase "to-system:".
 "to-system:" always initiates system, so Jay should only use that phrase when Jay wants to use system's functions.
 System provides the functions:
-(1) 'to-system: _add_calendar_event(EVENT_NAME (str), LENGTH_MINUTES (int), MINUTE (int), HOUR (int), DAY (int) = {datetime.date.today().day}, MONTH (int) = {datetime.date.today().month}, YEAR (int) = {datetime.date.today().year}) END_FUNC' - Adds an event into the calendar. The time must be in 24 hour time.
+(1) 'to-system: _add_calendar_event(EVENT_NAME (str), LENGTH_MINUTES (int), MINUTE (int), HOUR (int), DAY (int) = -1, MONTH (int) = -1, YEAR (int) = -1) END_FUNC' - Adds an event into the calendar. The time must be in 24 hour time. If DAY, MONTH or YEAR are -1, today's date is used.
 (2) 'to-system: _calculator(MATH (str)) END_FUNC' - Solve a math problem. The input can be in natural language, and the calculator can only solve self-contained math problems. You must provide all information that you can to the calculator using the input.
 (3) 'to-system: _get_the_news(COUNTRY (str) = 'Australia') END_FUNC' - Gets news headlines of a particular country. Defaults to Australia.
 (4) 'to-system: _open_file_for_user(FILE (str)) END_FUNC' - Loads a file for the user and allows the user to view the contents. This function gives Jay direct access to the user's file system. Any file type can be opened.
 (5) 'to-system: _play_music(KEYWORDS = '') END_FUNC' - Plays music from the user's playlist. If the user does not provide KEYWORDS, a song will be chosen at random from the playlist.
 (6) 'to-system: _read_file_for_AI(FILE (str)) END_FUNC' - Reads a file into the AI assistant.
 (7) 'to-system: _save_note(TITLE (str), BODY (str), FORMAT (str) = '.txt') END_FUNC' - Saves a note.
-(8) 'to-system: _search_calendar(DAY (int) = {datetime.date.today().day}, MONTH: int = {datetime.date.today().month}, YEAR: int = {datetime.date.today().year}) END_FUNC' - Returns all the events scheduled in the calendar for a particular date. The time must be in 24 hour time. If asked for today, use "{datetime.date.today().day}/{datetime.date.today().month}/{datetime.date.today().year}".
-(9) 'to-system: _search_the_internet(QUESTION (str), URLs (list) = []) END_FUNC' - Searches the internet to answer any question using the google search engine. If you need to search the internet for QUESTION, but the QUESTION is too complicated to be asked in one question, you can break it down into multiple questions and ask them one at a time. Both information and a reference will be provided to you, make sure you return both. If the user provides a particular URL or URLS to search, set them as the URLs argument. Otherwise, keep it as an empty list.
+(8) 'to-system: _search_calendar(DAY (int) = -1, MONTH: int = -1, YEAR: int = -1) END_FUNC' - Returns all the events scheduled in the calendar for a particular date. The time must be in 24 hour time. If asked for today, use today's date, which is given to Jay before the conversation begins.
+(9) 'to-system: _search_the_internet(QUESTION (str), URLs (list) = []) END_FUNC' - Searches the internet to answer any question using the google search engine. If you need to search the internet for QUESTION, but the QUESTION is too complicated to be asked in one question, you can break it down into multiple questions and ask them all at once. Both information and a reference will be provided to you, make sure you return both. If the user provides a particular URL or URLS to search, set them as the URLs argument. Otherwise, keep it as an empty list.
 (10) 'to-system: _send_email(CONTACT_NAME (str), SUBJECT (str), BODY (str)) END_FUNC' - Sends an email.
 (11) 'to-system: _set_timer(MINUTES (int)) END_FUNC' - Sets a timer, in minutes.
 (12) 'to-system: _time() END_FUNC' - Tells the time and date.
@@ -830,6 +883,7 @@ Jay also has access to the user's to-do list, and can use the following function
 (14) 'to-system: _todo_list_delete(ELEMENT: str) END_FUNC' - Deletes an element from the to-do list.
 (15) 'to-system: _todo_list_read() END_FUNC' - Allows Jay to read the user's to-do list.
 System will always respond with "to-Jay:", and Jay will respond to the user after this.
+If Jay needs several system functions that do not depend on each other's results, Jay can call them together, one after the other (e.g. 'to-system: _search_the_internet(QUESTION = "What is the population of Sydney?") END_FUNC to-system: _search_the_internet(QUESTION = "What is the population of Melbourne?") END_FUNC'). System will run them at the same time, and respond with every result together.
 Whenever Jay responds to the user, Jay will begin your prompt with an internal monologue.
 The internal monologue will begin with the tag <jay_internal>, and end the tag with </jay_internal>.
 Jay's internal monologue allows Jay to think about what is the best thing to say before Jay responds to the user.
@@ -842,9 +896,22 @@ The user cannot access the information inside the <jay_internal> tag, that is th
     return _system_prompt
   
   def _util_prompt_model_llama3(self):
+    '''
+    The full starting prompt: the fixed prefix, followed by the date-dependent suffix.
+    '''
+    return self._util_prompt_model_llama3_prefix() + self._util_prompt_model_llama3_suffix()
+  
+  def _util_prompt_model_llama3_prefix(self):
+    '''
+    The system prompt and the example conversations.
+    The prefix does not depend on the date or time, so that its KV cache can be saved to disk and reused (see "_util_load_llama_gguf").
+    The example conversations use a fixed date.
+    '''
     _system_prompt = self._util_load_system_triple_dash()
     _system_prompt = _system_prompt.replace('\n', ' ').replace('  ', ' ')
-    _current_time = time.asctime()
+    _example_time = 'Mon Jun 10 09:30:00 2024'
+    _example_date = datetime.date(2024, 6, 10)
+    _example_date_10 = _example_date + datetime.timedelta(days = 10)
     
     # <|begin_of_text|>
     _prompt = f'''<|begin_of_text|><|start_header_id|>system<|end_header_id|>
@@ -862,13 +929,13 @@ I'm sure I can help you. What can I do to help you today?<|eot_id|>\n<|start_hea
 \tCan you please tell me what will be in my calendar in 10 days time?<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
 \t<jay_internal>I can figure this out in three steps. First, I need the current date, which I can using "_time". Second, I can the date in ten days time using the "_calculator" function, and I can then check the calendar for that date.</jay_internal>
-Absolutely, I will check now! First, I will check with system to get the current date. to-system: _time() END_FUNC(to-Jay: Time and Date is [{_current_time}].)<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
+Absolutely, I will check now! First, I will check with system to get the current date. to-system: _time() END_FUNC(to-Jay: Time and Date is [{_example_time}].)<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
 \t<jay_internal>Now that I have the date, I can use system to tell me the date in 10 days time.</jay_internal>
-Today is {datetime.date.today().day}/{datetime.date.today().month}/{datetime.date.today().year}. I will find what the date will be in ten days time. to-system: _calculator(MATH = "What is the date 10 days after {(datetime.date.today() + datetime.timedelta(days = 10)).day}/{(datetime.date.today() + datetime.timedelta(days = 10)).month}/{(datetime.date.today() + datetime.timedelta(days = 10)).year}") END_FUNC(to-Jay: ["The date in 10 days time will be {(datetime.date.today() + datetime.timedelta(days = 10)).day}/{(datetime.date.today() + datetime.timedelta(days = 10)).month}/{(datetime.date.today() + datetime.timedelta(days = 10)).year}"].)<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
+Today is {_example_date.day}/{_example_date.month}/{_example_date.year}. I will find what the date will be in ten days time. to-system: _calculator(MATH = "What is the date 10 days after {_example_date.day}/{_example_date.month}/{_example_date.year}") END_FUNC(to-Jay: ["The date in 10 days time will be {_example_date_10.day}/{_example_date_10.month}/{_example_date_10.year}"].)<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
 \t<jay_internal>I now have the date in 10 days. I will now search the calendar using "_search_calendar", and I can return this information to the user.</jay_internal>
-to-system: _search_calendar(DAY = {(datetime.date.today() + datetime.timedelta(days = 10)).day}, MONTH = {(datetime.date.today() + datetime.timedelta(days = 10)).month}, YEAR = {(datetime.date.today() + datetime.timedelta(days = 10)).year}) END_FUNC(to-Jay: Calendar is empty for the stated time period.)<|eot_id|><|start_header_id|>assistant<|end_header_id|>
+to-system: _search_calendar(DAY = {_example_date_10.day}, MONTH = {_example_date_10.month}, YEAR = {_example_date_10.year}) END_FUNC(to-Jay: Calendar is empty for the stated time period.)<|eot_id|><|start_header_id|>assistant<|end_header_id|>
 
 \t<jay_internal>System has returned to me that there is nothing in the user's calendar in 10 days time. I will return this information to him.
 I should ask if he wants to book something on that date, in case he asked me about that date for a reason.</jay_internal>
@@ -921,7 +988,18 @@ I can do that for you, I have access to your file system. However, can you pleas
 \t<jay_internal>That's easy. I will use the file "_open_file_for_user".</jay_internal>
 No problem. to-system: _open_file_for_user(FILE = "C:\\Users\\Desktop\\test_doc.pdf") END_FUNC(to-Jay: ["File has been opened for the user."].)<|eot_id|>\n<|start_header_id|>assistant<|end_header_id|>
 
-\tThe file has been loaded for you. Enjoy!</EXAMPLE><|eot_id|>\n<|start_header_id|>user<|end_header_id|>
+\tThe file has been loaded for you. Enjoy!</EXAMPLE><|eot_id|>\n'''
+    return _prompt
+  
+  def _util_prompt_model_llama3_suffix(self):
+    '''
+    The date-dependent part of the starting prompt, which follows the example conversations.
+    This is bound when the conversation starts, and is never part of the saved KV cache.
+    '''
+    _today = datetime.date.today()
+    _prompt = f'''<|start_header_id|>system<|end_header_id|>
+
+\tThe example conversations are finished, and the conversation with the user begins now. Today is {_today.day}/{_today.month}/{_today.year}. Time and Date is [{time.asctime()}].<|eot_id|>\n<|start_header_id|>user<|end_header_id|>
 
 \t<START>'''
     return _prompt
@@ -932,6 +1010,8 @@ if __name__ == '__main__':
   _email_pwd = '' # The user's gmail API password (this is not the Gmail password)
   _notepad_folder_name = 'Notes'
   _together_api_key = '' # The together.ai API key.
+  _serve = False # Whether Jay is run as a server for several conversations at once, rather than in the console.
+  _calculator_samples = 1 # The number of Coders that answer each calculator question. More than 1 uses the most common answer (self-consistency), at the cost of more LLM calls. Only used with together.ai.
   
   _llm = 'together'
   if _llm == 'together':
@@ -952,5 +1032,9 @@ if __name__ == '__main__':
       _model_path = _model_path,
       _notepad_folder_name = _notepad_folder_name,
       _together_api_key = _together_api_key,
-      _use_llm = _use_llm)
-  model.chat()
\ No newline at end of file
+      _use_llm = _use_llm,
+      _calculator_samples = _calculator_samples)
+  if _serve:
+    _JayServer(_jay = model)._run()
+  else:
+    model.chat()
\ No newline at end of file
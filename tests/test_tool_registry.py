@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from _system_functions import Todo_List
+from _tool_registry import _ToolRegistry
+
+def test_two_sessions_never_run_todo_list_add_at_the_same_time(tmp_path):
+  '''
+  Two conversations of _JayServer run their system calls on the server's shared tool pool, so both can call "_todo_list_add" at the same time.
+  '''
+  _todo = Todo_List(_filename = str(tmp_path / 'Todo_List.txt'))
+  open(_todo._filename, 'w').close()
+  _running, _most_running = [0], [0]
+  _lock = threading.Lock()
+  
+  def _todo_list_add(ELEMENT):
+    with _lock:
+      _running[0] += 1
+      _most_running[0] = max(_most_running[0], _running[0])
+    # The to-do list is read and written, as "_delete_element" does, so two calls at once would lose an element.
+    _list = _todo._read_list()
+    time.sleep(0.05)
+    with open(_todo._filename, 'w') as f:
+      f.write(_list + f'\n* {ELEMENT}')
+    with _lock:
+      _running[0] -= 1
+    return 'to-Jay: To-Do Element Added.'
+  
+  _tools = _ToolRegistry()
+  _tools._register('_todo_list_add', _todo_list_add, _concurrent = False)
+  with ThreadPoolExecutor(max_workers = 8) as _tool_executor:
+    _futures = [_tool_executor.submit(_tools._call, f'_todo_list_add(ELEMENT = "session {_session}")', True) for _session in range(2)]
+    _results = [_future.result() for _future in _futures]
+  
+  assert _results == ['to-Jay: To-Do Element Added.'] * 2
+  assert _most_running[0] == 1
+  assert sorted(_todo._read_list().split('\n')[1:]) == ['* session 0', '* session 1']
+
+def test_concurrent_tools_still_run_at_the_same_time():
+  _barrier = threading.Barrier(2, timeout = 5)
+  def _search(QUESTION: str):
+    _barrier.wait()
+    return f'to-Jay: {QUESTION}'
+  
+  _tools = _ToolRegistry()
+  _tools._register('_search', _search)
+  with ThreadPoolExecutor(max_workers = 2) as _tool_executor:
+    _futures = [_tool_executor.submit(_tools._call, f'_search(QUESTION = "{_session}")') for _session in range(2)]
+    assert [_future.result() for _future in _futures] == ['to-Jay: 0', 'to-Jay: 1']
\ No newline at end of file